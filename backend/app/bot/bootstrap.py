@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List
+
+from telegram.ext import Application, MessageHandler, filters
+from telegram.request import BaseRequest
+
+from app.core.config import settings
+from app.core.concurrency import offload, db_executor
+from app.bot.handler import handle_message
+from app.bot.request import SharedRequest, build_bot_request
+from app.services.tenant_cache import tenant_cache
+
+logger = logging.getLogger(__name__)
+
+def build_application(token: str, request: BaseRequest | None = None) -> Application:
+    """
+    Builds the python-telegram-bot Application for one tenant bot. request is the
+    HTTP client for Bot API calls (the registry's shared pool, or a fake in the
+    load test); without one the bot gets its own pool.
+    """
+    request = request if request is not None else build_bot_request()
+    # Webhook bots never call getUpdates, so the same client serves both slots.
+    builder = (Application.builder().token(token).base_url(settings.TELEGRAM_BASE_URL)
+               .request(request).get_updates_request(request))
+    application = builder.build()
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    return application
+
+def webhook_url_for(token: str) -> str:
+    return f"{settings.WEBHOOK_DOMAIN}/webhook/{token}"
+
+class BotRegistry:
+    """
+    Holds the initialized Application for every tenant bot, keyed by token.
+    Bots are brought up concurrently at startup or lazily on their first webhook.
+    """
+    def __init__(self, init_concurrency: int):
+        self.init_concurrency = init_concurrency
+        self.apps: Dict[str, Application] = {}
+        # Lazy initialization locks, kept while any caller holds or waits for them
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._lock_users: Dict[str, int] = {}
+        self.startup_report: Dict[str, Any] = {}
+        self._shared_request: SharedRequest | None = None
+
+    def _request(self) -> BaseRequest | None:
+        """The shared Bot API pool, or None (a pool per bot) with SHARED_HTTP_POOL off."""
+        if not settings.SHARED_HTTP_POOL:
+            return None
+        if self._shared_request is None:
+            self._shared_request = SharedRequest(build_bot_request())
+        return self._shared_request
+
+    async def _initialize(self, token: str, *, register_webhook: bool, keep: bool = True) -> str:
+        """
+        Initializes one bot and registers its webhook unless Telegram already has it.
+        Bots served by another worker, and bots whose webhook could not be checked or
+        set, are shut down again instead of kept. Returns what was done.
+        """
+        application = build_application(token, request=self._request())
+        await application.initialize()
+
+        action = "loaded"
+        try:
+            if register_webhook:
+                webhook_url = webhook_url_for(token)
+                webhook_info = await application.bot.get_webhook_info()
+                if webhook_info.url == webhook_url:
+                    action = "webhook_current"
+                else:
+                    await application.bot.set_webhook(url=webhook_url)
+                    logger.info(f"Webhook set for bot {token[:10]}... at {webhook_url}")
+                    action = "webhook_set"
+        except BaseException:
+            await application.shutdown()
+            raise
+
+        if keep:
+            self.apps[token] = application
+        else:
+            await application.shutdown()
+        return action
+
+    async def initialize_all(self, tokens: List[str], *, register_webhooks: bool = True,
+                             keep: Callable[[str], bool] | None = None) -> Dict[str, Any]:
+        """
+        Initializes all bots with at most init_concurrency in flight, and returns a
+        report of the startup time, what was done per bot and which bots failed.
+        Only bots for which keep(token) is true stay loaded (all by default).
+        """
+        start_time = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.init_concurrency)
+
+        async def initialize_one(token: str) -> str:
+            async with semaphore:
+                return await self._initialize(token, register_webhook=register_webhooks, keep=keep is None or keep(token))
+
+        results = await asyncio.gather(*(initialize_one(token) for token in tokens), return_exceptions=True)
+
+        failures = {}
+        counts = {'webhook_set': 0, 'webhook_current': 0, 'loaded': 0}
+        for token, result in zip(tokens, results):
+            if isinstance(result, Exception):
+                failures[f"{token[:10]}..."] = str(result)
+                logger.error(f"Failed to initialize bot {token[:10]}...: {result}")
+            else:
+                counts[result] += 1
+
+        self.startup_report = {
+            'mode': 'eager',
+            'bots': len(tokens),
+            'initialized': len(tokens) - len(failures),
+            'loaded': len(self.apps),
+            'webhooks_set': counts['webhook_set'],
+            'webhooks_already_current': counts['webhook_current'],
+            'failed': failures,
+            'seconds': time.perf_counter() - start_time,
+        }
+        logger.info(
+            f"Initialized {self.startup_report['initialized']}/{len(tokens)} bots in {self.startup_report['seconds']:.2f} seconds "
+            f"({counts['webhook_set']} webhooks set, {counts['webhook_current']} already current, "
+            f"{len(self.apps)} kept loaded, {len(failures)} failed)."
+        )
+        return self.startup_report
+
+    async def get_or_load(self, token: str) -> Application | None:
+        """
+        Returns the Application for a token, building it on first use if the token
+        belongs to a registered company. Returns None for unknown tokens.
+        """
+        application = self.apps.get(token)
+        if application is not None:
+            return application
+
+        # The lock is only dropped once nobody waits for it, or a caller arriving after a failed
+        # attempt would take a new lock and initialize the bot alongside a waiter on the old one.
+        lock = self._locks.setdefault(token, asyncio.Lock())
+        self._lock_users[token] = self._lock_users.get(token, 0) + 1
+        try:
+            async with lock:
+                if token in self.apps:
+                    return self.apps[token]
+                if not await offload(db_executor, tenant_cache.get, token):
+                    return None
+                await self._initialize(token, register_webhook=False)
+                logger.info(f"Lazily initialized bot {token[:10]}...")
+                return self.apps[token]
+        except Exception as e:
+            logger.error(f"Failed to lazily initialize bot {token[:10]}...: {e}")
+            return None
+        finally:
+            self._lock_users[token] -= 1
+            if not self._lock_users[token]:
+                del self._lock_users[token], self._locks[token]
+
+    async def shutdown_all(self, *, delete_webhooks: bool) -> None:
+        semaphore = asyncio.Semaphore(self.init_concurrency)
+
+        async def shutdown_one(token: str, application: Application) -> None:
+            async with semaphore:
+                try:
+                    if delete_webhooks:
+                        await application.bot.delete_webhook()
+                        logger.info(f"Webhook deleted for bot {token[:10]}... ")
+                    await application.shutdown()
+                except Exception as e:
+                    logger.error(f"Failed to shutdown bot {token[:10]}...: {e}")
+
+        await asyncio.gather(*(shutdown_one(token, application) for token, application in self.apps.items()))
+        self.apps.clear()
+        if self._shared_request is not None:
+            await self._shared_request.close()
+            self._shared_request = None
+
+bot_registry = BotRegistry(init_concurrency=settings.BOT_INIT_CONCURRENCY)
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+from telegram import Update
+from telegram.ext import Application
+
+from app.core import metrics
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+ACCEPTED = "accepted"
+DUPLICATE = "duplicate"
+REJECTED = "rejected"
+
+class UpdateDispatcher:
+    """
+    Hands webhook updates to a pool of background workers so the webhook can be
+    acknowledged immediately.
+
+    Each chat is pinned to one worker (by hashing bot token and chat id), which
+    keeps a chat's messages in order. Each worker has a bounded queue; when it is
+    full the update is rejected so Telegram redelivers it later. update_ids are
+    remembered per bot so Telegram's retries are not processed twice.
+    """
+    def __init__(self, num_workers: int, max_queue_size: int, dedupe_size: int):
+        self.num_workers = num_workers
+        self.max_queue_size = max_queue_size
+        self.dedupe_size = dedupe_size
+
+        self._queues: List[asyncio.Queue] = []
+        self._workers: List[asyncio.Task] = []
+        self._seen: OrderedDict[Tuple[str, int], None] = OrderedDict()
+        self._stopping = False
+
+        self.accepted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        per_worker = max(1, self.max_queue_size // self.num_workers)
+        self._queues = [asyncio.Queue(maxsize=per_worker) for _ in range(self.num_workers)]
+        self._workers = [asyncio.create_task(self._run(queue)) for queue in self._queues]
+        logger.info(f"Started {self.num_workers} update workers (queue size {per_worker} each).")
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Lets the workers drain their queues for up to `timeout` seconds, then cancels them."""
+        if not self._workers:
+            return
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self._queues)), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Update queues not drained after {timeout} seconds; {self.depth()} updates dropped.")
+        self._stopping = True
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._stopping = False
+
+    def submit(self, token: str, application: Application, update: Update) -> str:
+        """Queues an update for processing. Returns ACCEPTED, DUPLICATE or REJECTED."""
+        key = (token, update.update_id)
+        if key in self._seen:
+            self.duplicates += 1
+            return DUPLICATE
+
+        chat = update.effective_chat
+        shard_key = f"{token}:{chat.id if chat else update.update_id}"
+        queue = self._queues[zlib.crc32(shard_key.encode()) % self.num_workers]
+        try:
+            queue.put_nowait((application, update, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return REJECTED
+
+        self._seen[key] = None
+        if len(self._seen) > self.dedupe_size:
+            self._seen.popitem(last=False)
+        self.accepted += 1
+        return ACCEPTED
+
+    async def _run(self, queue: asyncio.Queue) -> None:
+        while True:
+            application, update, enqueued_at = await queue.get()
+            wait = time.perf_counter() - enqueued_at
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            # The tenant is not known before the handler runs.
+            metrics.stage_seconds.observe(wait, 'queue_wait', '')
+            try:
+                await application.process_update(update)
+                self.processed += 1
+            except asyncio.CancelledError:
+                if self._stopping:
+                    raise
+                # Cancelled from inside the handler: a dead worker would leave its chats hanging.
+                self.failed += 1
+                metrics.errors.inc('dispatch', '')
+                logger.error(f"Processing of update {update.update_id} was cancelled.")
+            except Exception as e:
+                self.failed += 1
+                metrics.errors.inc('dispatch', '')
+                logger.error(f"Error processing update {update.update_id}: {e}", exc_info=True)
+            finally:
+                queue.task_done()
+
+    def depth(self) -> int:
+        return sum(queue.qsize() for queue in self._queues)
+
+    def stats(self) -> Dict[str, Any]:
+        started = self.processed + self.failed
+        return {
+            'workers': len(self._workers),
+            'queue_depth': self.depth(),
+            'max_worker_queue_depth': max((queue.qsize() for queue in self._queues), default=0),
+            'accepted': self.accepted,
+            'duplicates': self.duplicates,
+            'rejected': self.rejected,
+            'processed': self.processed,
+            'failed': self.failed,
+            'avg_wait_ms': 1000 * self.total_wait / started if started else 0.0,
+            'max_wait_ms': 1000 * self.max_wait,
+        }
+
+update_dispatcher = UpdateDispatcher(
+    num_workers=settings.WEBHOOK_WORKERS,
+    max_queue_size=settings.WEBHOOK_QUEUE_SIZE,
+    dedupe_size=settings.WEBHOOK_DEDUPE_SIZE,
+)
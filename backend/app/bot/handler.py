@@ -2,70 +2,189 @@ import logging
 import time
 from telegram import Update
 from telegram.ext import ContextTypes
-from app.services.supabase_service import supabase_service
-from app.services.rag_service import rag_service
+from app.core import metrics
+from app.core.config import settings
+from app.core.concurrency import offload, db_executor, Overloaded
+from app.core.metrics import timed_stage
+from app.core.tracing import new_trace_id
+from app.bot.streaming import ProgressiveReply
+from app.services.rag_service import rag_service, LLM_ERROR_RESPONSE
 from app.services.usage_service import usage_service
+from app.services.tenant_cache import tenant_cache
+from app.services.vector_index import vector_index_registry
+from app.services.answer_cache import answer_cache
+from app.services.admission import admission_controller
+from app.services.conversation_store import conversation_store, retrieval_query
+from app.services.llm_coalescer import llm_coalescer, coalescing_key
+from app.services.answer_router import answer_router
 
 logger = logging.getLogger(__name__)
 
+RATE_LIMITED_RESPONSE = "You're sending messages faster than I can answer them. Please wait a moment and try again."
+OVERLOADED_RESPONSE = "We're receiving a lot of messages right now. Please try again in a moment."
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handles incoming text messages, identifies tenant, and generates response."""
-    start_time = time.time()
+    start_time = time.perf_counter()
+    new_trace_id()
     if update.message and update.message.text:
         user_query = update.message.text
         bot_token = context.bot.token
         chat_id = str(update.message.chat_id)
 
-        logger.info(f"Received message from chat_id {chat_id} on bot {bot_token[:10]}...")
+        logger.info(f"Received update {getattr(update, 'update_id', None)} from chat_id {chat_id} on bot {bot_token[:10]}...")
+
+        # 0. Admission Control (rate limits use the cached plan when the tenant is warm, defaults otherwise)
+        cached_tenant = tenant_cache.peek(bot_token)
+        admission = admission_controller.admit(bot_token, chat_id, cached_tenant['plan'] if cached_tenant else None)
+        if not admission.admitted:
+            metrics.refusals.inc(admission.reason, str(cached_tenant['company']['id']) if cached_tenant else '')
+            if admission.notify:
+                await update.message.reply_text(RATE_LIMITED_RESPONSE)
+            logger.warning(f"Refused message from chat_id {chat_id} on bot {bot_token[:10]}...: {admission.reason}")
+            return
 
         # 1. Identify Tenant
-        company = supabase_service.get_company_by_telegram_bot_token(bot_token)
-        if not company:
+        tenant = await offload(db_executor, tenant_cache.get, bot_token)
+        tenant_lookup_seconds = time.perf_counter() - start_time
+        if not tenant:
+            metrics.refusals.inc('unregistered_bot', '')
             await update.message.reply_text("This bot is not registered with any company. Please contact the administrator.")
             logger.warning(f"Unregistered bot_token: {bot_token}")
             return
 
+        company = tenant['company']
         company_id = company['id']
         company_name = company['name']
+        metrics.stage_seconds.observe(tenant_lookup_seconds, 'tenant_lookup', company_id)
         logger.info(f"Message for company: {company_name} (ID: {company_id})")
 
         # 2. Check for Active Subscription
-        subscription = supabase_service.get_active_subscription_by_company_id(company_id)
+        subscription = tenant['subscription']
         if not subscription:
+            metrics.refusals.inc('no_subscription', company_id)
             await update.message.reply_text("This company does not have an active subscription. Please contact the administrator.")
             logger.warning(f"No active subscription for company ID: {company_id}")
             return
 
         # 3. Enforce Usage Limits
-        if usage_service.has_exceeded_limit(subscription):
+        with timed_stage('usage_check', company_id):
+            limit_exceeded = await offload(db_executor, usage_service.has_exceeded_limit, subscription, plan=tenant['plan'])
+        if limit_exceeded:
+            metrics.refusals.inc('limit_exceeded', company_id)
             await update.message.reply_text("You have exceeded your monthly token limit. Please upgrade your plan or wait for the next billing cycle.")
             logger.warning(f"Token limit exceeded for company ID: {company_id}")
             return
 
-        # 4. Retrieve Knowledge Base
-        knowledge_bases = supabase_service.get_knowledge_bases_by_company_id(company_id)
-        if not knowledge_bases:
-            await update.message.reply_text(f"No knowledge base found for {company_name}. Please contact the administrator to upload knowledge.")
-            logger.warning(f"No knowledge base for company ID: {company_id}")
-            return
+        # 4. Retrieve Knowledge Base (in database mode it is searched in place at step 7)
+        knowledge_index = None
+        if settings.VECTOR_SEARCH_MODE != "database":
+            with timed_stage('kb_fetch', company_id):
+                knowledge_index = await offload(db_executor, vector_index_registry.get, company_id)
+            if not len(knowledge_index):
+                metrics.refusals.inc('no_knowledge_base', company_id)
+                await update.message.reply_text(f"No knowledge base found for {company_name}. Please contact the administrator to upload knowledge.")
+                logger.warning(f"No knowledge base for company ID: {company_id}")
+                return
+
+        # 5. Generate Query Embedding (a follow-up is searched together with the previous question)
+        history = conversation_store.history(company_id, chat_id) if settings.CONVERSATION_MEMORY_ENABLED else []
+        search_text = retrieval_query(history, user_query)
+        with timed_stage('embed', company_id):
+            query_embedding = await rag_service.generate_embedding_async(search_text)
+        # Without a resident index, knowledge base changes reach the answer cache through invalidation only.
+        kb_version = knowledge_index.version if knowledge_index is not None else 0
+        # An answer shaped by this chat's earlier turns must not be served to other chats, so
+        # only messages without conversation history use the cache.
+        use_answer_cache = settings.ANSWER_CACHE_ENABLED and not history
 
-        # 5. Generate Query Embedding
-        query_embedding = rag_service.generate_embedding(user_query)
+        # 6. Answer Cache (hits are not billed)
+        if use_answer_cache:
+            cached_response = answer_cache.get(company_id, query_embedding, kb_version)
+            metrics.cache_events.inc('hit' if cached_response is not None else 'miss', company_id)
+            if cached_response is not None:
+                with timed_stage('reply', company_id):
+                    await update.message.reply_text(cached_response)
+                answer_router.record('cache', company_id)
+                if settings.CONVERSATION_MEMORY_ENABLED:
+                    conversation_store.append(company_id, chat_id, telegram_user_id(update), user_query, cached_response)
+                metrics.stage_seconds.observe(time.perf_counter() - start_time, 'total', company_id)
+                logger.info(f"Answer cache hit. Replied to chat_id {chat_id} for company {company_name}.")
+                return
 
-        # 6. Semantic Search
-        relevant_knowledge = rag_service.semantic_search(query_embedding, knowledge_bases)
+        # 7. Semantic Search (hybrid on the resident index; falling back to it if the database search fails)
+        with timed_stage('search', company_id):
+            relevant_knowledge = None
+            if knowledge_index is None:
+                relevant_knowledge = await offload(db_executor, rag_service.search_knowledge_base, company_id, query_embedding, top_k=settings.CONTEXT_CANDIDATES)
+                if relevant_knowledge is None:
+                    metrics.errors.inc('database_search', company_id)
+                    knowledge_index = await offload(db_executor, vector_index_registry.get, company_id)
+            if relevant_knowledge is None:
+                relevant_knowledge = rag_service.semantic_search(query_embedding, knowledge_index, top_k=settings.CONTEXT_CANDIDATES,
+                                                                 query_text=search_text)
 
-        # 7. Generate Response with LLM
-        ai_response, token_count = rag_service.generate_response_with_llm(user_query, relevant_knowledge)
+        # 8. Answer Routing: a close match to an entry tagged as a direct answer is sent as stored,
+        # without calling Gemini (not billed); anything else goes on to the LLM
+        direct_response = answer_router.direct_answer(relevant_knowledge, company)
+        if direct_response is not None:
+            with timed_stage('reply', company_id):
+                await update.message.reply_text(direct_response)
+            answer_router.record('direct', company_id)
+            if settings.CONVERSATION_MEMORY_ENABLED:
+                conversation_store.append(company_id, chat_id, telegram_user_id(update), user_query, direct_response)
+            metrics.stage_seconds.observe(time.perf_counter() - start_time, 'total', company_id)
+            logger.info(f"Direct answer. Replied to chat_id {chat_id} for company {company_name}.")
+            return
+
+        # 9. Context assembly within the plan's token budget
+        with timed_stage('context', company_id):
+            relevant_knowledge = rag_service.build_context(relevant_knowledge, plan=tenant['plan'])
 
-        # 8. Record Usage
+        # 10. Generate Response with LLM, streaming partial text into the reply when enabled.
+        # Identical requests already in flight share that call's answer (and are not streamed).
+        reply = ProgressiveReply(update.message, min_edit_interval=settings.STREAM_EDIT_INTERVAL_SECONDS, bot_token=bot_token)
+        on_text = reply.update if settings.STREAM_RESPONSES else None
+        try:
+            with timed_stage('llm', company_id):
+                result = await llm_coalescer.run(
+                    coalescing_key(company_id, user_query, relevant_knowledge, history),
+                    lambda: rag_service.generate_response_with_llm_async(
+                        user_query, relevant_knowledge, on_text=on_text,
+                        priority=(tenant['plan'] or {}).get('llm_priority') or 0, company_id=company_id, history=history))
+        except Overloaded as e:
+            metrics.refusals.inc('llm_overload', company_id)
+            await update.message.reply_text(OVERLOADED_RESPONSE)
+            logger.warning(f"Shed message for company ID {company_id}: {e}")
+            return
+        ai_response, token_count = result.text, result.billed_tokens
+        if result.shared:
+            metrics.llm_coalesced.inc(company_id)
+            metrics.llm_tokens_saved.inc(company_id, amount=result.tokens)
+        elif ai_response == LLM_ERROR_RESPONSE:
+            metrics.errors.inc('llm', company_id)
+
+        # 11. Record Usage (billed per LLM_COALESCING_TOKEN_POLICY when the call was shared)
+        if result.tokens > 0 and not result.shared:
+            metrics.llm_tokens.inc(company_id, amount=result.tokens)
+            if use_answer_cache:
+                answer_cache.put(company_id, query_embedding, kb_version, ai_response)
         if token_count > 0:
             usage_service.record_usage(subscription_id=subscription['id'], total_tokens=token_count)
 
-        await update.message.reply_text(ai_response)
-        end_time = time.time()
-        logger.info(f"Total processing time: {end_time - start_time:.4f} seconds")
-        logger.info(f"Replied to chat_id {chat_id} for company {company_name}.")
+        with timed_stage('reply', company_id):
+            await reply.finish(ai_response)
+        answer_router.record('llm', company_id)
+        if settings.CONVERSATION_MEMORY_ENABLED and result.tokens > 0:
+            conversation_store.append(company_id, chat_id, telegram_user_id(update), user_query, ai_response)
+        total_seconds = time.perf_counter() - start_time
+        metrics.stage_seconds.observe(total_seconds, 'total', company_id)
+        logger.info(f"Replied to chat_id {chat_id} for company {company_name} in {total_seconds:.4f} seconds.")
     else:
         logger.info(f"Received non-text message or empty message from {update.message.chat_id}")
         await update.message.reply_text("I can only process text messages at the moment.")
+
+def telegram_user_id(update: Update) -> str:
+    """The sender's Telegram user id (the chat id when there is no sender, e.g. in channels)."""
+    user = update.effective_user
+    return str(user.id if user else update.message.chat_id)
@@ -0,0 +1,61 @@
+from typing import Tuple
+
+import httpx
+from telegram.request import BaseRequest, HTTPXRequest, RequestData
+from telegram._utils.defaultvalue import DEFAULT_NONE
+from telegram._utils.types import ODVInput
+
+from app.core.config import settings
+
+def build_bot_request() -> HTTPXRequest:
+    """An HTTPX client for Bot API calls with the configured pool size, keep-alive, HTTP version and timeouts."""
+    return HTTPXRequest(
+        connection_pool_size=settings.TELEGRAM_POOL_SIZE,
+        http_version=settings.TELEGRAM_HTTP_VERSION,
+        connect_timeout=settings.TELEGRAM_CONNECT_TIMEOUT,
+        read_timeout=settings.TELEGRAM_READ_TIMEOUT,
+        write_timeout=settings.TELEGRAM_WRITE_TIMEOUT,
+        pool_timeout=settings.TELEGRAM_POOL_TIMEOUT,
+        httpx_kwargs={'limits': httpx.Limits(
+            max_connections=settings.TELEGRAM_POOL_SIZE,
+            max_keepalive_connections=settings.TELEGRAM_POOL_SIZE,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_SECONDS,
+        )},
+    )
+
+class SharedRequest(BaseRequest):
+    """
+    One Bot API connection pool used by every tenant bot. Bots initialize and shut
+    down their request as they come and go, so those calls leave the pool open;
+    it is closed by close() once all bots are shut down.
+    """
+    def __init__(self, request: BaseRequest):
+        self._request = request
+
+    @property
+    def read_timeout(self) -> float | None:
+        return self._request.read_timeout
+
+    async def initialize(self) -> None:
+        await self._request.initialize()
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        await self._request.shutdown()
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: RequestData | None = None,
+        read_timeout: ODVInput[float] = DEFAULT_NONE,
+        write_timeout: ODVInput[float] = DEFAULT_NONE,
+        connect_timeout: ODVInput[float] = DEFAULT_NONE,
+        pool_timeout: ODVInput[float] = DEFAULT_NONE,
+    ) -> Tuple[int, bytes]:
+        return await self._request.do_request(
+            url, method, request_data=request_data, read_timeout=read_timeout,
+            write_timeout=write_timeout, connect_timeout=connect_timeout, pool_timeout=pool_timeout,
+        )
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Tuple
+
+from telegram import Message
+from telegram.constants import ChatType
+from telegram.error import BadRequest, RetryAfter
+
+from app.core.config import settings
+from app.services.admission import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Telegram rejects messages longer than this.
+MAX_MESSAGE_LENGTH = 4096
+
+class EditBudget:
+    """
+    Token buckets for partial replies, per bot and per group chat: besides the
+    spacing of edits to one message, Telegram limits how many messages a bot
+    sends overall and in each group. Partial replies are skipped while a bucket
+    is empty; final texts are always sent but use up the budget too. Group
+    buckets are kept for the max_chats most recent groups.
+    """
+    def __init__(self, bot_rate: float, group_rate: float, max_chats: int):
+        self.bot_rate = bot_rate
+        self.group_rate = group_rate
+        self.max_chats = max_chats
+        self._bots: OrderedDict[str, TokenBucket] = OrderedDict()
+        self._groups: OrderedDict[Tuple[str, int], TokenBucket] = OrderedDict()
+        self.skipped = 0
+
+    def allow(self, bot_token: str, chat_id: int, group: bool, final: bool = False) -> bool:
+        """Charges one message to the bot's (and the group's) budget, or returns False without charging."""
+        now = time.monotonic()
+        buckets = []
+        if self.bot_rate:
+            # A second's worth of burst
+            buckets.append((self._bucket(self._bots, bot_token, self.bot_rate, max(1.0, self.bot_rate), now),
+                            self.bot_rate, max(1.0, self.bot_rate)))
+        if group and self.group_rate:
+            # Three messages of burst: the first partial reply, an edit and the final text
+            buckets.append((self._bucket(self._groups, (bot_token, chat_id), self.group_rate, 3.0, now),
+                            self.group_rate, 3.0))
+        if not final and any(bucket.refill(rate, capacity, now) < 1 for bucket, rate, capacity in buckets):
+            self.skipped += 1
+            return False
+        for bucket, rate, capacity in buckets:
+            bucket.refill(rate, capacity, now)
+            bucket.tokens -= 1
+        return True
+
+    def _bucket(self, buckets: OrderedDict, key, rate: float, capacity: float, now: float) -> TokenBucket:
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(rate, capacity, now)
+            if len(buckets) > self.max_chats:
+                buckets.popitem(last=False)
+        else:
+            buckets.move_to_end(key)
+        return bucket
+
+edit_budget = EditBudget(
+    bot_rate=settings.STREAM_BOT_MESSAGES_PER_SECOND,
+    group_rate=settings.STREAM_GROUP_MESSAGES_PER_MINUTE / 60,
+    max_chats=settings.ADMISSION_MAX_CHATS,
+)
+
+class ProgressiveReply:
+    """
+    Replies to a message with text that grows as LLM chunks arrive: the first
+    chunk is sent as a new message, later chunks edit it in place. Edits are
+    spaced at least min_edit_interval seconds apart and drawn from the bot's and
+    the group's edit_budget to stay within Telegram's limits; finish() always
+    delivers the complete text, as a new message if the partial one cannot be edited.
+    """
+    def __init__(self, message: Message, min_edit_interval: float, bot_token: str = ''):
+        self.message = message
+        self.min_edit_interval = min_edit_interval
+        self.bot_token = bot_token
+        self._group = message.chat.type in (ChatType.GROUP, ChatType.SUPERGROUP)
+        self.sent: Message | None = None
+        self._sent_text = ""
+        self._last_edit = 0.0
+        self.edits = 0
+
+    async def update(self, text: str) -> None:
+        """Shows the partial text, unless the last edit was too recent."""
+        text = text[:MAX_MESSAGE_LENGTH]
+        if not text.strip() or text == self._sent_text:
+            return
+        if self.sent is not None and time.monotonic() - self._last_edit < self.min_edit_interval:
+            return
+        if not edit_budget.allow(self.bot_token, self.message.chat_id, self._group):
+            return
+        if self.sent is None:
+            self.sent = await self.message.reply_text(text)
+            self._sent_text, self._last_edit = text, time.monotonic()
+            return
+        await self._edit(text)
+
+    async def finish(self, text: str) -> None:
+        """Delivers the final text, splitting anything beyond Telegram's length limit into follow-up messages."""
+        head, tail = text[:MAX_MESSAGE_LENGTH], text[MAX_MESSAGE_LENGTH:]
+        if self.sent is None:
+            edit_budget.allow(self.bot_token, self.message.chat_id, self._group, final=True)
+            self.sent = await self.message.reply_text(head)
+            self._sent_text = head
+        elif head != self._sent_text:
+            edit_budget.allow(self.bot_token, self.message.chat_id, self._group, final=True)
+            await self._edit(head, final=True)
+
+        while tail:
+            await self.message.reply_text(tail[:MAX_MESSAGE_LENGTH])
+            tail = tail[MAX_MESSAGE_LENGTH:]
+
+    async def _edit(self, text: str, final: bool = False) -> None:
+        try:
+            try:
+                await self.sent.edit_text(text)
+            except RetryAfter as e:
+                delay = _seconds(e.retry_after)
+                if not final:
+                    # Flood control: skip intermediate edits until Telegram allows them again.
+                    logger.warning(f"Edit rate limited, backing off for {delay:.1f}s")
+                    self._last_edit = time.monotonic() + delay
+                    return
+                await asyncio.sleep(delay)
+                await self.sent.edit_text(text)
+        except BadRequest as e:
+            if "not modified" in str(e).lower():
+                pass
+            elif final:
+                # The partial reply was deleted or can no longer be edited; the answer still goes out.
+                logger.warning(f"Final edit failed, sending the answer as a new message: {e}")
+                self.sent = await self.message.reply_text(text)
+            else:
+                raise
+        self._sent_text = text
+        self._last_edit = time.monotonic()
+        self.edits += 1
+
+def _seconds(retry_after) -> float:
+    """RetryAfter.retry_after is an int or a timedelta depending on the library version."""
+    return retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else float(retry_after)
@@ -0,0 +1,135 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import heapq
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, List, Tuple, TypeVar
+
+from app.core.config import settings
+
+T = TypeVar('T')
+
+# Bounded pools for blocking work, one per pipeline stage, so a burst of slow
+# database calls cannot starve embedding (and vice versa).
+db_executor = ThreadPoolExecutor(max_workers=settings.DB_MAX_CONCURRENCY, thread_name_prefix='db')
+embedding_executor = ThreadPoolExecutor(max_workers=settings.EMBEDDING_MAX_CONCURRENCY, thread_name_prefix='embedding')
+
+async def offload(executor: ThreadPoolExecutor, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Runs a blocking call on the given executor and awaits the result, in a copy
+    of the caller's context so context variables such as the trace id carry over.
+    With ASYNC_PIPELINE disabled the call runs inline on the event loop,
+    which is the old behaviour and is kept for before/after comparisons.
+    """
+    if not settings.ASYNC_PIPELINE:
+        return func(*args, **kwargs)
+    loop = asyncio.get_running_loop()
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    return await loop.run_in_executor(executor, call)
+
+class Overloaded(Exception):
+    """Raised instead of queueing when a PriorityLimiter's queue is full or the wait times out."""
+
+class PriorityLimiter:
+    """
+    Caps concurrent calls. Callers beyond the cap wait in a priority queue (higher
+    priority first, then arrival order). When max_waiting callers are already
+    waiting, the lowest-priority (then newest) of them and the new caller compete:
+    the lower-priority one gets Overloaded, the new caller on a tie. A caller that
+    has waited timeout seconds gets Overloaded too, so requests are shed instead
+    of queueing without bound.
+    """
+    def __init__(self, capacity: int, max_waiting: int, timeout: float):
+        self.capacity = capacity
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self._queue: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        # Overloaded raised, by the priority of the caller shed
+        self.shed: Dict[int, int] = {}
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority: int = 0) -> AsyncIterator[float]:
+        """Holds a slot for the block and yields the seconds spent waiting for it."""
+        waited = await self.acquire(priority)
+        try:
+            yield waited
+        finally:
+            self.release()
+
+    async def acquire(self, priority: int = 0) -> float:
+        if self.active < self.capacity and not self.waiting:
+            self.active += 1
+            return 0.0
+        if self.waiting >= self.max_waiting:
+            self._evict_for(priority)
+
+        start = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (-priority, next(self._sequence), future))
+        self.waiting += 1
+        try:
+            # On timeout or cancellation wait_for cancels the future, and release() skips it.
+            await asyncio.wait_for(future, self.timeout)
+        except BaseException as e:
+            if _handed_over(future):
+                if isinstance(e, asyncio.TimeoutError):
+                    # The slot arrived right at the deadline: keep it.
+                    return time.perf_counter() - start
+                # A slot already handed to a caller that is being cancelled goes to the next waiter,
+                # otherwise it would never be released and the capacity would shrink for good.
+                self.release()
+                raise
+            # An evicted caller (its future holds Overloaded) was counted out by _evict_for().
+            if not future.done() or future.cancelled():
+                self.waiting -= 1
+            if isinstance(e, asyncio.TimeoutError):
+                self._count_shed(priority)
+                raise Overloaded(f"no slot within {self.timeout} seconds") from None
+            raise
+        return time.perf_counter() - start
+
+    def _evict_for(self, priority: int) -> None:
+        """Makes room in a full queue by shedding its lowest-priority waiter, or raises Overloaded."""
+        victim = max((entry for entry in self._queue if not entry[2].done()), default=None)
+        if victim is None or victim[0] <= -priority:
+            self._count_shed(priority)
+            raise Overloaded(f"{self.waiting} calls already waiting")
+        self._queue.remove(victim)
+        heapq.heapify(self._queue)
+        self.waiting -= 1
+        self._count_shed(-victim[0])
+        victim[2].set_exception(Overloaded(f"shed for a priority {priority} call"))
+
+    def _count_shed(self, priority: int) -> None:
+        self.shed[priority] = self.shed.get(priority, 0) + 1
+
+    def release(self) -> None:
+        """Hands the slot to the next waiter, or frees it."""
+        while self._queue:
+            _, _, future = heapq.heappop(self._queue)
+            if not future.done():
+                self.waiting -= 1
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self) -> dict:
+        return {'capacity': self.capacity, 'active': self.active, 'waiting': self.waiting,
+                'max_waiting': self.max_waiting, 'shed_by_priority': dict(self.shed)}
+
+def _handed_over(future: asyncio.Future) -> bool:
+    """Whether release() gave the waiter a slot (release() has then already counted it out of waiting)."""
+    return future.done() and not future.cancelled() and future.exception() is None
+
+# Caps the number of concurrent LLM calls across all tenants.
+llm_limiter = PriorityLimiter(settings.LLM_MAX_CONCURRENCY, settings.LLM_QUEUE_MAX_WAITING, settings.LLM_QUEUE_TIMEOUT_SECONDS)
+
+def shutdown_executors() -> None:
+    db_executor.shutdown(wait=False, cancel_futures=True)
+    embedding_executor.shutdown(wait=False, cancel_futures=True)
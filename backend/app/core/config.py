@@ -1,6 +1,7 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 import os
+from typing import Dict
 
 # Construct the absolute path to the .env file
 dotenv_path = os.path.join(os.path.dirname(__file__), '../../.env')
@@ -13,5 +14,193 @@ class Settings(BaseSettings):
     SUPABASE_KEY: str
     GOOGLE_API_KEY: str
     WEBHOOK_DOMAIN: str = "https://your-domain.com"
+    ADMIN_API_KEY: str = ""
+
+    # Tenant context cache (company, subscription and plan per bot token)
+    TENANT_CACHE_TTL_SECONDS: float = 300.0
+    # Unregistered bot tokens are remembered this long (up to TENANT_CACHE_MAX_UNKNOWN of them), so
+    # junk webhook traffic is answered from memory; registering a company clears its token.
+    TENANT_CACHE_UNKNOWN_TTL_SECONDS: float = 60.0
+    TENANT_CACHE_MAX_UNKNOWN: int = 10000
+
+    # Write-behind usage ledger. The flush interval is the most usage a crash can lose.
+    USAGE_FLUSH_INTERVAL_SECONDS: float = 5.0
+    USAGE_FLUSH_MAX_PENDING: int = 200
+    USAGE_RESEED_INTERVAL_SECONDS: float = 300.0
+
+    # Request pipeline. With ASYNC_PIPELINE off, blocking calls run on the event loop.
+    ASYNC_PIPELINE: bool = True
+    DB_MAX_CONCURRENCY: int = 16
+    EMBEDDING_MAX_CONCURRENCY: int = 2
+    LLM_MAX_CONCURRENCY: int = 32
+    # LLM calls beyond LLM_MAX_CONCURRENCY wait by plan priority (plans.llm_priority, higher
+    # first); past LLM_QUEUE_MAX_WAITING waiting the lowest priority is shed, as is a call that waited
+    # LLM_QUEUE_TIMEOUT_SECONDS. With WEBHOOK_FAST_ACK at most WEBHOOK_WORKERS messages are handled
+    # at once, so LLM_MAX_CONCURRENCY + LLM_QUEUE_MAX_WAITING must stay below it for shedding to happen.
+    LLM_QUEUE_MAX_WAITING: int = 64
+    LLM_QUEUE_TIMEOUT_SECONDS: float = 20.0
+    # Identical LLM requests in flight at once (same company, question, context and conversation)
+    # share one Gemini call. Tokens are billed "once" (to the request that made the call), "split"
+    # between the requests that shared it, or to "each" of them in full.
+    LLM_COALESCING_ENABLED: bool = True
+    LLM_COALESCING_TOKEN_POLICY: str = "once"
+
+    # Admission control, checked before any database or model work: token buckets per chat and
+    # per company refilled at the plan's chat_messages_per_minute / company_messages_per_minute
+    # (else the defaults below; 0 disables a limit), holding up to the burst sizes below.
+    ADMISSION_CONTROL_ENABLED: bool = True
+    CHAT_MESSAGES_PER_MINUTE: float = 20.0
+    CHAT_BURST: int = 5
+    COMPANY_MESSAGES_PER_MINUTE: float = 600.0
+    COMPANY_BURST: int = 100
+    ADMISSION_MAX_CHATS: int = 100000
+    # A refused chat gets one "slow down" reply per flood; it is forgotten this long after its
+    # last refusal, and is told again if it is refused after that.
+    ADMISSION_NOTIFY_TTL_SECONDS: float = 60.0
+
+    # Knowledge base embeddings. With COMPACT_EMBEDDINGS on (run scripts/migrate_embeddings.py
+    # first), rows also carry a base64 float16/float32 copy that is read instead of pgvector's JSON text.
+    COMPACT_EMBEDDINGS: bool = False
+    COMPACT_EMBEDDING_DTYPE: str = "float16"
+
+    # Per-tenant search matrices are snapshotted here and memory-mapped after a restart ("" disables)
+    VECTOR_SNAPSHOT_DIR: str = os.path.join(os.path.dirname(__file__), '../../data/snapshots')
+    VECTOR_SNAPSHOT_PRELOAD: bool = True
+
+    # Knowledge base search: "local" (resident per-tenant index) or "database" (the
+    # match_knowledge_bases RPC, see docs/saas/sql/match_knowledge_bases.sql)
+    VECTOR_SEARCH_MODE: str = "local"
+    VECTOR_SEARCH_MIN_SIMILARITY: float = 0.0
+
+    # Prompt context: CONTEXT_CANDIDATES retrieved rows are reduced to at most CONTEXT_MAX_PASSAGES
+    # diverse passages within the plan's token budget (plans.context_token_budget, else
+    # CONTEXT_TOKEN_BUDGETS by plan name, else CONTEXT_TOKEN_BUDGET).
+    CONTEXT_CANDIDATES: int = 8
+    CONTEXT_MAX_PASSAGES: int = 3
+    CONTEXT_TOKEN_BUDGET: int = 1200
+    CONTEXT_TOKEN_BUDGETS: Dict[str, int] = {}
+    CONTEXT_DIVERSITY: float = 0.7
+    CONTEXT_DUPLICATE_THRESHOLD: float = 0.9
+    LLM_TOKEN_ESTIMATE_SCALE: float = 1.0
+
+    # Approximate (IVF) search for knowledge bases with at least ANN_MIN_ENTRIES rows.
+    # The index is retrained once a knowledge base grows ANN_RETRAIN_GROWTH times past its
+    # trained size; ANN_INDEX_DIR="" keeps it in memory only.
+    ANN_MIN_ENTRIES: int = 5000
+    ANN_NPROBE: int = 16
+    ANN_RETRAIN_GROWTH: float = 2.0
+    ANN_INDEX_DIR: str = os.path.join(os.path.dirname(__file__), '../../data/ann')
+
+    # Hybrid retrieval: a per-tenant BM25 index shortlists HYBRID_LEXICAL_CANDIDATES rows sharing
+    # terms with the question (SKUs, phone numbers, place names), only those are scored densely,
+    # and the two rankings are fused by reciprocal rank (1 / (HYBRID_RRF_K + rank)). Rows scoring
+    # below HYBRID_LEXICAL_MIN_SCORE_RATIO of the best BM25 score only matched a minor term and are left out.
+    HYBRID_SEARCH_ENABLED: bool = True
+    HYBRID_LEXICAL_CANDIDATES: int = 200
+    HYBRID_LEXICAL_MIN_SCORE_RATIO: float = 0.25
+    HYBRID_RRF_K: int = 60
+    BM25_K1: float = 1.2
+    BM25_B: float = 0.75
+
+    # Embedding backend: "torch" (sentence-transformers) or "onnx" (see scripts/export_onnx_model.py)
+    EMBEDDING_BACKEND: str = "torch"
+    EMBEDDING_MODEL_NAME: str = "all-MiniLM-L6-v2"
+    EMBEDDING_ONNX_DIR: str = os.path.join(os.path.dirname(__file__), '../../models/all-MiniLM-L6-v2-onnx')
+    EMBEDDING_ONNX_FILE: str = "model_int8.onnx"
+    EMBEDDING_ONNX_THREADS: int = 0
+    WARMUP_ON_STARTUP: bool = True
+
+    # Query embedding micro-batching
+    EMBEDDING_BATCH_WINDOW_MS: float = 5.0
+    EMBEDDING_MAX_BATCH_SIZE: int = 32
+
+    # Direct answers: when the top search result is a knowledge base entry tagged as a direct
+    # answer and its similarity reaches the company's direct_answer_threshold (else
+    # DIRECT_ANSWER_THRESHOLD), the stored answer is sent without calling Gemini. Turn on after
+    # adding the knowledge_bases columns (docs/saas/database_schema.md, section 11).
+    DIRECT_ANSWERS_ENABLED: bool = False
+    DIRECT_ANSWER_THRESHOLD: float = 0.85
+
+    # Per-tenant semantic answer cache (messages that follow earlier turns of their chat bypass it)
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = 0.95
+    ANSWER_CACHE_TTL_SECONDS: float = 3600.0
+    ANSWER_CACHE_MAX_ENTRIES_PER_TENANT: int = 256
+    ANSWER_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+
+    # Conversation memory: the last CONVERSATION_MAX_TURNS question/answer pairs per chat feed
+    # retrieval and the prompt. A chat idle for CONVERSATION_IDLE_TTL_SECONDS starts over. Turns
+    # are written to the conversations/messages tables in batches when CONVERSATION_PERSIST is on
+    # (create the tables first, docs/saas/database_schema.md, section 10).
+    CONVERSATION_MEMORY_ENABLED: bool = True
+    CONVERSATION_MAX_TURNS: int = 4
+    CONVERSATION_IDLE_TTL_SECONDS: float = 1800.0
+    CONVERSATION_MAX_BYTES: int = 64 * 1024 * 1024
+    CONVERSATION_FOLLOW_UP_MAX_WORDS: int = 8
+    CONVERSATION_PROMPT_ANSWER_CHARS: int = 500
+    CONVERSATION_PERSIST: bool = False
+    CONVERSATION_FLUSH_INTERVAL_SECONDS: float = 5.0
+    CONVERSATION_FLUSH_MAX_PENDING: int = 500
+    CONVERSATION_MAX_UNFLUSHED: int = 50000
+
+    # Knowledge ingestion (all-MiniLM-L6-v2 truncates input at 256 word pieces)
+    INGESTION_CHUNK_TOKENS: int = 200
+    INGESTION_CHUNK_OVERLAP_TOKENS: int = 40
+    INGESTION_BATCH_SIZE: int = 64
+
+    # Webhook updates are acknowledged immediately and processed by background workers
+    WEBHOOK_FAST_ACK: bool = True
+    WEBHOOK_WORKERS: int = 128
+    WEBHOOK_QUEUE_SIZE: int = 2000
+    WEBHOOK_DEDUPE_SIZE: int = 10000
+
+    # Bot startup: "eager" initializes every bot at startup, "lazy" on its first webhook
+    BOT_STARTUP_MODE: str = "eager"
+    BOT_INIT_CONCURRENCY: int = 20
+    DELETE_WEBHOOKS_ON_SHUTDOWN: bool = False
+
+    # Outgoing HTTP. With SHARED_HTTP_POOL every tenant bot sends Bot API calls through one
+    # connection pool (TELEGRAM_HTTP_VERSION "2" multiplexes them over a few connections)
+    # instead of a pool per bot. TELEGRAM_BASE_URL can point at a self-hosted Bot API server.
+    SHARED_HTTP_POOL: bool = True
+    TELEGRAM_BASE_URL: str = "https://api.telegram.org/bot"
+    TELEGRAM_POOL_SIZE: int = 100
+    TELEGRAM_HTTP_VERSION: str = "1.1"
+    TELEGRAM_CONNECT_TIMEOUT: float = 5.0
+    TELEGRAM_READ_TIMEOUT: float = 10.0
+    TELEGRAM_WRITE_TIMEOUT: float = 10.0
+    TELEGRAM_POOL_TIMEOUT: float = 5.0
+    HTTP_KEEPALIVE_SECONDS: float = 60.0
+    SUPABASE_POOL_SIZE: int = 32
+    SUPABASE_HTTP2: bool = True
+    SUPABASE_TIMEOUT_SECONDS: float = 30.0
+
+    # Pre-fork serving (python -m app.prefork): workers share the model loaded before forking
+    # and are reached by the router over Unix sockets in PREFORK_SOCKET_DIR.
+    PREFORK_WORKERS: int = 2
+    PREFORK_SOCKET_DIR: str = os.path.join(os.path.dirname(__file__), '../../data/workers')
+
+    # Logging: records go through a bounded queue to a writer thread; the log file rotates at
+    # LOG_MAX_BYTES. LOG_LEVELS sets levels per logger, e.g. {"telegram": "DEBUG"}. Longer
+    # messages are cut at LOG_MAX_MESSAGE_CHARS (0 keeps them whole).
+    LOG_LEVEL: str = "INFO"
+    LOG_LEVELS: Dict[str, str] = {"httpx": "WARNING", "telegram": "INFO"}
+    LOG_FILE: str = "bot.log"
+    LOG_MAX_BYTES: int = 10 * 1024 * 1024
+    LOG_BACKUP_COUNT: int = 5
+    LOG_QUEUE_SIZE: int = 10000
+    LOG_MAX_MESSAGE_CHARS: int = 2000
+
+    # Prometheus metrics on /metrics
+    METRICS_ENABLED: bool = True
+
+    # Stream LLM output into the reply by editing it as chunks arrive, at most once per
+    # STREAM_EDIT_INTERVAL_SECONDS per reply. Partial replies also stay within a budget of
+    # messages per bot and per group chat (Telegram allows about 20 a minute in a group);
+    # when it is spent only the final text is sent. 0 disables a budget.
+    STREAM_RESPONSES: bool = True
+    STREAM_EDIT_INTERVAL_SECONDS: float = 1.0
+    STREAM_BOT_MESSAGES_PER_SECOND: float = 25.0
+    STREAM_GROUP_MESSAGES_PER_MINUTE: float = 18.0
 
 settings = Settings()
\ No newline at end of file
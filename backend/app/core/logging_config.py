@@ -0,0 +1,97 @@
+import atexit
+import copy
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
+
+from app.core.config import settings
+from app.core.tracing import TraceIdFilter
+
+# trace_id identifies the update a record was logged for ("-" outside updates)
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s"
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    Hands records to the listener thread without blocking the caller. When the
+    queue is full the record is dropped and counted rather than waited on.
+    """
+    def __init__(self, log_queue: queue.Queue, max_message_chars: int):
+        super().__init__(log_queue)
+        self.max_message_chars = max_message_chars
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only the message is cut; super().prepare() then appends the traceback, whose
+        # last line (the exception itself) is the part worth keeping.
+        if self.max_message_chars:
+            message = record.getMessage()
+            if len(message) > self.max_message_chars:
+                omitted = len(message) - self.max_message_chars
+                record = copy.copy(record)
+                record.msg = f"{message[:self.max_message_chars]}... [{omitted} chars truncated]"
+                record.args = None
+        return super().prepare(record)
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+queue_handler: Optional[BoundedQueueHandler] = None
+_listener: Optional[QueueListener] = None
+
+def configure_logging(log_file: Optional[str] = None) -> None:
+    """
+    Routes the root logger through a bounded queue to a background thread that
+    writes to the console and a size-rotated log file. Safe to call more than once.
+    """
+    global queue_handler, _listener
+    if _listener is not None:
+        return
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler()]
+    log_file = settings.LOG_FILE if log_file is None else log_file
+    if log_file:
+        handlers.append(RotatingFileHandler(
+            log_file, maxBytes=settings.LOG_MAX_BYTES, backupCount=settings.LOG_BACKUP_COUNT, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    # The trace id lives in a context variable, so it is read on the logging thread, not the listener's.
+    queue_handler = BoundedQueueHandler(queue.Queue(maxsize=settings.LOG_QUEUE_SIZE), settings.LOG_MAX_MESSAGE_CHARS)
+    queue_handler.addFilter(TraceIdFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(settings.LOG_LEVEL.upper())
+    for name, level in settings.LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    _listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+def restart_after_fork(log_file: Optional[str] = None) -> None:
+    """
+    Sets logging up again in a forked child, where the parent's listener thread
+    does not exist.
+    """
+    global queue_handler, _listener
+    queue_handler = None
+    _listener = None
+    configure_logging(log_file)
+
+def stop_logging() -> None:
+    """Writes out queued records and stops the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def dropped_records() -> int:
+    return queue_handler.dropped if queue_handler is not None else 0
@@ -0,0 +1,149 @@
+import bisect
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+from app.core.config import settings
+
+# Latency buckets in seconds, from in-memory lookups to slow LLM answers. Every
+# bucket is a series per stage and tenant, so keep the list short.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.025, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Counter:
+    """A monotonically increasing value per label combination."""
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str]):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        if not settings.METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield self.name, _label_text(self.labelnames, labels), value
+
+class Histogram:
+    """Bucketed observations per label combination, exposed as cumulative buckets, sum and count."""
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str], buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Per label combination: [count per bucket (+Inf last)..., sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        if not settings.METRICS_ENABLED:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [0.0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        with self._lock:
+            values = [(labels, list(series)) for labels, series in self._values.items()]
+        bounds = [f'le="{_format_bound(bound)}"' for bound in self.buckets + (float('inf'),)]
+        bucket_name = f"{self.name}_bucket"
+        for labels, series in values:
+            label_text = _label_text(self.labelnames, labels)
+            cumulative = 0.0
+            for bound, count in zip(bounds, series):
+                cumulative += count
+                yield bucket_name, f"{label_text},{bound}", cumulative
+            yield f"{self.name}_sum", label_text, series[-1]
+            yield f"{self.name}_count", label_text, cumulative
+
+class Gauge:
+    """A value read from a callback at scrape time, e.g. a queue depth."""
+    kind = 'gauge'
+
+    def __init__(self, name: str, help_text: str, read: Callable[[], float]):
+        self.name = name
+        self.help_text = help_text
+        self.read = read
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        yield self.name, "", float(self.read())
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[Counter | Histogram | Gauge] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Returns every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, label_text, value in metric.samples():
+                if label_text:
+                    lines.append(f"{name}{{{label_text}}} {_format_value(value)}")
+                else:
+                    lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+def _label_text(labelnames: Tuple[str, ...], labels: Tuple[str, ...]) -> str:
+    return ",".join(f'{key}="{_escape(value)}"' for key, value in zip(labelnames, labels))
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == float('inf') else repr(bound)
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if value == int(value) else repr(value)
+
+registry = MetricsRegistry()
+
+stage_seconds = registry.register(Histogram(
+    'bot_stage_seconds', "Time spent in each message pipeline stage.", ('stage', 'company_id')))
+cache_events = registry.register(Counter(
+    'bot_cache_events_total', "Answer cache lookups by result (hit or miss).", ('result', 'company_id')))
+llm_tokens = registry.register(Counter(
+    'bot_llm_tokens_total', "Gemini tokens used.", ('company_id',)))
+errors = registry.register(Counter(
+    'bot_errors_total', "Failures by pipeline stage.", ('stage', 'company_id')))
+refusals = registry.register(Counter(
+    'bot_refusals_total', "Messages refused before answering, by reason.", ('reason', 'company_id')))
+llm_coalesced = registry.register(Counter(
+    'bot_llm_coalesced_total', "LLM requests answered by another identical request's Gemini call.", ('company_id',)))
+llm_tokens_saved = registry.register(Counter(
+    'bot_llm_tokens_saved_total', "Gemini tokens not spent thanks to coalesced requests.", ('company_id',)))
+replies = registry.register(Counter(
+    'bot_replies_total', "Messages answered, by source (llm, cache or direct).", ('source', 'company_id')))
+
+class timed_stage:
+    """Records the duration of the enclosed block in bot_stage_seconds."""
+    __slots__ = ('stage', 'company_id', 'start')
+
+    def __init__(self, stage: str, company_id: str):
+        self.stage = stage
+        self.company_id = company_id
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc) -> None:
+        stage_seconds.observe(time.perf_counter() - self.start, self.stage, self.company_id)
@@ -0,0 +1,19 @@
+import logging
+import secrets
+from contextvars import ContextVar
+
+# The trace id of the update being processed. Context variables follow the
+# update through awaits and into offloaded calls (see concurrency.offload).
+trace_id_var: ContextVar[str] = ContextVar('trace_id', default='-')
+
+def new_trace_id() -> str:
+    """Starts a trace for the current update and returns its id."""
+    trace_id = secrets.token_hex(6)
+    trace_id_var.set(trace_id)
+    return trace_id
+
+class TraceIdFilter(logging.Filter):
+    """Adds the current trace id to every log record as %(trace_id)s."""
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = trace_id_var.get()
+        return True
@@ -0,0 +1,18 @@
+import zlib
+
+# Which pre-fork worker this process is (see app/prefork.py). A single-process
+# server is worker 0 of 1 and owns every bot.
+index = 0
+count = 1
+
+def assign(worker_index: int, worker_count: int) -> None:
+    global index, count
+    index = worker_index
+    count = worker_count
+
+def worker_for_token(token: str, workers: int) -> int:
+    """The worker that serves a bot. Stable across processes, unlike hash()."""
+    return zlib.crc32(token.encode()) % workers
+
+def owns(token: str) -> bool:
+    return worker_for_token(token, count) == index
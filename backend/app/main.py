@@ -1,78 +1,123 @@
 import asyncio
 import logging
+import threading
 from contextlib import asynccontextmanager
-from typing import Dict
+from typing import Any, Dict
 
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, HTTPException, Header
+from fastapi.responses import PlainTextResponse
 from telegram import Update
-from telegram.ext import Application, MessageHandler, filters
+from telegram.ext import Application
 
 from app.core.config import settings
-from app.bot.handler import handle_message
+from app.core import metrics, workers
+from app.core.concurrency import llm_limiter, shutdown_executors
+from app.core.logging_config import configure_logging, dropped_records
+from app.bot.bootstrap import bot_registry
+from app.bot.dispatcher import update_dispatcher, DUPLICATE, REJECTED
+from app.bot.streaming import edit_budget
 from app.services.supabase_service import supabase_service
+from app.services.tenant_cache import tenant_cache
+from app.services.vector_index import vector_index_registry
+from app.services.usage_ledger import usage_ledger
+from app.services.rag_service import rag_service
+from app.services.answer_cache import answer_cache
+from app.services.admission import admission_controller
+from app.services.conversation_store import conversation_store
+from app.services.llm_coalescer import llm_coalescer
+from app.services.answer_router import answer_router
 
 # --- Configure Logging ---
-log_formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+configure_logging()
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
-
-# Console handler
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(log_formatter)
-logger.addHandler(console_handler)
-
-# File handler
-file_handler = logging.FileHandler("bot.log")
-file_handler.setFormatter(log_formatter)
-logger.addHandler(file_handler)
 # --- End Logging Configuration ---
 
 # Dictionary to hold all our bot Application instances, keyed by token
-bot_apps: Dict[str, Application] = {}
+bot_apps: Dict[str, Application] = bot_registry.apps
+
+metrics.registry.register(metrics.Gauge('bot_update_queue_depth', "Updates waiting for a worker.", update_dispatcher.depth))
+metrics.registry.register(metrics.Gauge('bot_tenant_cache_hits', "Tenant context cache hits since startup.", lambda: tenant_cache.stats()['hits']))
+metrics.registry.register(metrics.Gauge('bot_tenant_cache_misses', "Tenant context cache misses since startup.", lambda: tenant_cache.stats()['misses']))
+metrics.registry.register(metrics.Gauge('bot_bots_loaded', "Initialized tenant bots.", lambda: len(bot_registry.apps)))
+metrics.registry.register(metrics.Gauge('bot_llm_active', "LLM calls in progress.", lambda: llm_limiter.active))
+metrics.registry.register(metrics.Gauge('bot_llm_waiting', "LLM calls waiting for a slot.", lambda: llm_limiter.waiting))
+metrics.registry.register(metrics.Gauge('bot_conversations', "Chats with conversation memory held.", lambda: conversation_store.stats()['conversations']))
+metrics.registry.register(metrics.Gauge('bot_conversation_memory_bytes', "Estimated size of the conversation memory.", lambda: conversation_store.stats()['bytes']))
+metrics.registry.register(metrics.Gauge('bot_conversation_messages_pending', "Messages waiting to be written.", lambda: conversation_store.stats()['pending_messages']))
+metrics.registry.register(metrics.Gauge('bot_conversation_messages_written', "Messages written since startup.", lambda: conversation_store.stats()['messages_written']))
+metrics.registry.register(metrics.Gauge('bot_conversation_flushes', "Batched message writes since startup.", lambda: conversation_store.stats()['flushes']))
+metrics.registry.register(metrics.Gauge('bot_log_records_dropped', "Log records dropped because the log queue was full.", dropped_records))
+
+def _log_preload_result(task: asyncio.Task) -> None:
+    """Done-callback of the snapshot preload, whose task nothing else awaits until shutdown."""
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Vector snapshot preload failed: {task.exception()}", exc_info=task.exception())
+    else:
+        logger.info("Vector snapshot preload finished.")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
     Handles startup and shutdown events for the FastAPI application.
-    On startup, it initializes all bots from the database and sets their webhooks.
+    On startup, it initializes all bots from the database and sets their webhooks,
+    or, in lazy mode, leaves each bot to be initialized by its first webhook.
     """
     # --- Startup ---
     logger.info("Starting up...")
+    if settings.WEBHOOK_FAST_ACK and settings.LLM_MAX_CONCURRENCY + settings.LLM_QUEUE_MAX_WAITING >= settings.WEBHOOK_WORKERS:
+        logger.warning(
+            f"LLM_MAX_CONCURRENCY + LLM_QUEUE_MAX_WAITING ({settings.LLM_MAX_CONCURRENCY} + {settings.LLM_QUEUE_MAX_WAITING}) "
+            f"is not below WEBHOOK_WORKERS ({settings.WEBHOOK_WORKERS}): LLM calls are never shed by plan priority, "
+            f"and overload shows up as rejected webhooks instead."
+        )
     
-    bot_tokens = supabase_service.get_all_bot_tokens()
-    
-    if not bot_tokens:
-        logger.warning("No bot tokens found in the database. No bots will be started.")
-    
-    for token in bot_tokens:
-        application = Application.builder().token(token).build()
-        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-        
-        webhook_url = f"{settings.WEBHOOK_DOMAIN}/webhook/{token}"
-        
-        try:
-            await application.initialize()
-            await application.bot.set_webhook(url=webhook_url)
-            logger.info(f"Webhook set for bot {token[:10]}... at {webhook_url}")
-            bot_apps[token] = application
-        except Exception as e:
-            logger.error(f"Failed to initialize bot {token[:10]}...: {e}")
+    if settings.BOT_STARTUP_MODE == "lazy":
+        bot_registry.startup_report = {'mode': 'lazy'}
+        logger.info("Lazy bot startup: bots will be initialized on their first webhook.")
+    else:
+        bot_tokens = supabase_service.get_all_bot_tokens()
+
+        if not bot_tokens:
+            logger.warning("No bot tokens found in the database. No bots will be started.")
+
+        # Under app/prefork.py each worker keeps the bots routed to it, and worker 0
+        # alone registers webhooks (for every bot).
+        if workers.index == 0:
+            await bot_registry.initialize_all(bot_tokens, keep=workers.owns)
+        else:
+            await bot_registry.initialize_all([token for token in bot_tokens if workers.owns(token)], register_webhooks=False)
+
+    if settings.WARMUP_ON_STARTUP:
+        await asyncio.to_thread(rag_service.warmup)
+
+    preload_task = None
+    preload_stop = threading.Event()
+    if settings.VECTOR_SNAPSHOT_PRELOAD:
+        # Memory-maps the local snapshots in the background; messages that arrive first load on demand.
+        preload_task = asyncio.create_task(asyncio.to_thread(vector_index_registry.preload_snapshots, preload_stop))
+        preload_task.add_done_callback(_log_preload_result)
+
+    usage_ledger.start()
+    conversation_store.start()
+    update_dispatcher.start()
 
     yield
 
     # --- Shutdown ---
     logger.info("Shutting down...")
-    for token, application in bot_apps.items():
-        try:
-            if application.running:
-                await application.bot.delete_webhook()
-                logger.info(f"Webhook deleted for bot {token[:10]}... ")
-                await application.shutdown()
-        except Exception as e:
-            logger.error(f"Failed to shutdown bot {token[:10]}...: {e}")
+    if preload_task is not None:
+        # A thread cannot be cancelled: the preload stops after the company it is loading, and is waited for.
+        preload_stop.set()
+        await asyncio.gather(preload_task, return_exceptions=True)
+    await update_dispatcher.stop()
+    await bot_registry.shutdown_all(delete_webhooks=settings.DELETE_WEBHOOKS_ON_SHUTDOWN)
     
     logger.info("All bots have been shut down.")
 
+    await usage_ledger.stop()
+    await conversation_store.stop()
+    shutdown_executors()
+
 
 # Create the FastAPI app with the lifespan manager
 app = FastAPI(lifespan=lifespan)
@@ -81,8 +126,10 @@ app = FastAPI(lifespan=lifespan)
 async def handle_webhook(token: str, request: Request):
     """
     This single endpoint receives updates from all Telegram bots.
+    Updates are queued for the background workers and acknowledged right away,
+    so Telegram does not time out and redeliver them.
     """
-    application = bot_apps.get(token)
+    application = await bot_registry.get_or_load(token)
     if not application:
         logger.error(f"Update received for an unknown bot token: {token}")
         raise HTTPException(status_code=404, detail="Bot not found")
@@ -90,14 +137,83 @@ async def handle_webhook(token: str, request: Request):
     try:
         update_data = await request.json()
         update = Update.de_json(update_data, application.bot)
-        await application.process_update(update)
-        return {"status": "ok"}
+        if not settings.WEBHOOK_FAST_ACK:
+            await application.process_update(update)
+            return {"status": "ok"}
     except Exception as e:
         logger.error(f"Error processing update for bot {token[:10]}...: {e}")
         return {"status": "error"}
 
+    result = update_dispatcher.submit(token, application, update)
+    if result == REJECTED:
+        # A non-2xx response makes Telegram redeliver the update later.
+        logger.warning(f"Update queue full; rejecting update {update.update_id} for bot {token[:10]}...")
+        raise HTTPException(status_code=503, detail="Busy")
+    if result == DUPLICATE:
+        logger.info(f"Ignoring duplicate update {update.update_id} for bot {token[:10]}...")
+    return {"status": "ok"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics():
+    """Exposes pipeline metrics in the Prometheus text format."""
+    # Rendering grows with the number of tenants, so it runs off the event loop.
+    return PlainTextResponse(await asyncio.to_thread(metrics.registry.render), media_type="text/plain; version=0.0.4")
+
 
 @app.get("/")
 async def read_root():
     """Root endpoint to check if the backend is running."""
     return {"message": "Multi-Tenant AI Bot Backend is running!"}
+
+
+def verify_admin_key(x_admin_key: str | None) -> None:
+    """Rejects admin requests unless ADMIN_API_KEY is configured and matches."""
+    if not settings.ADMIN_API_KEY or x_admin_key != settings.ADMIN_API_KEY:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+@app.post("/admin/tenants/invalidate")
+async def invalidate_tenant(payload: Dict[str, Any], x_admin_key: str | None = Header(default=None)):
+    """
+    Drops cached tenant state after an admin change (new company, plan, subscription or knowledge).
+    Called by the scripts in /scripts; an empty payload clears everything.
+    """
+    verify_admin_key(x_admin_key)
+
+    bot_token = payload.get('bot_token')
+    company_id = payload.get('company_id')
+    if bot_token:
+        tenant_cache.invalidate(bot_token)
+    if company_id:
+        tenant_cache.invalidate_company(company_id)
+        vector_index_registry.invalidate(company_id)
+        answer_cache.invalidate(company_id)
+    if not bot_token and not company_id:
+        tenant_cache.clear()
+        vector_index_registry.clear()
+        answer_cache.clear()
+
+    logger.info(f"Tenant cache invalidated (company_id={company_id}, bot_token={(bot_token or '')[:10]}...)")
+    return {"status": "ok"}
+
+
+@app.get("/admin/stats")
+async def read_stats(x_admin_key: str | None = Header(default=None)):
+    """Returns in-process cache statistics."""
+    verify_admin_key(x_admin_key)
+    return {
+        "tenant_cache": tenant_cache.stats(),
+        "vector_index": vector_index_registry.stats(),
+        "usage_ledger": usage_ledger.stats(),
+        "embedding_batcher": rag_service.embedding_batcher.stats(),
+        "answer_cache": answer_cache.stats(),
+        "update_queue": update_dispatcher.stats(),
+        "admission": admission_controller.stats(),
+        "conversations": conversation_store.stats(),
+        "llm_limiter": llm_limiter.stats(),
+        "llm_coalescing": llm_coalescer.stats(),
+        "answer_routing": answer_router.stats(),
+        "partial_replies_skipped": edit_budget.skipped,
+        "bots": {"loaded": len(bot_registry.apps), "startup": bot_registry.startup_report},
+    }
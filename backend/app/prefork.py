@@ -0,0 +1,182 @@
+"""
+Pre-fork serving mode: one supervisor process loads the embedding model and the
+snapshotted tenant indexes, then forks PREFORK_WORKERS copies of the app, which
+share those pages copy-on-write, and a router that listens on the public port.
+
+The router sends /webhook/{token} to worker crc32(token) % PREFORK_WORKERS, so a
+tenant's caches live in one worker. /admin/tenants/invalidate goes to every worker,
+/worker/{i}/... to worker i (e.g. /worker/1/metrics), anything else to worker 0.
+The supervisor replaces workers that exit.
+
+Usage (from backend/):
+    python -m app.prefork --workers 4 --host 0.0.0.0 --port 8000
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import time
+from typing import Dict, List, Tuple
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request, Response
+
+from app.core import logging_config, workers
+from app.core.config import settings
+from app.main import app as worker_app
+from app.services.rag_service import rag_service
+from app.services.supabase_service import supabase_service
+from app.services.vector_index import vector_index_registry
+
+logger = logging.getLogger(__name__)
+
+# Headers passed on to the workers
+FORWARDED_HEADERS = ('content-type', 'x-admin-key', 'x-telegram-bot-api-secret-token')
+
+def create_router_app(sockets: List[str]) -> FastAPI:
+    """The public app: forwards each request to a worker over its Unix socket."""
+    clients = [
+        httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(uds=path), base_url="http://worker", timeout=60.0)
+        for path in sockets
+    ]
+    router = FastAPI()
+
+    async def forward(worker_index: int, request: Request, path: str) -> Response:
+        headers = {name: request.headers[name] for name in FORWARDED_HEADERS if name in request.headers}
+        try:
+            response = await clients[worker_index].request(
+                request.method, path, params=request.query_params, headers=headers, content=await request.body())
+        except httpx.TransportError as e:
+            # Telegram redelivers updates that get a non-2xx response.
+            logger.warning(f"Worker {worker_index} unavailable: {e}")
+            return Response(status_code=503, content='{"detail":"Worker unavailable"}', media_type="application/json")
+        return Response(content=response.content, status_code=response.status_code,
+                        media_type=response.headers.get('content-type'))
+
+    @router.post("/webhook/{token}")
+    async def route_webhook(token: str, request: Request):
+        return await forward(workers.worker_for_token(token, len(clients)), request, f"/webhook/{token}")
+
+    @router.post("/admin/tenants/invalidate")
+    async def broadcast_invalidation(request: Request):
+        responses = [await forward(i, request, "/admin/tenants/invalidate") for i in range(len(clients))]
+        return next((response for response in responses if response.status_code != 200), responses[0])
+
+    @router.api_route("/worker/{worker_index}/{path:path}", methods=["GET", "POST"])
+    async def route_to_worker(worker_index: int, path: str, request: Request):
+        if not 0 <= worker_index < len(clients):
+            return Response(status_code=404)
+        return await forward(worker_index, request, f"/{path}")
+
+    @router.api_route("/{path:path}", methods=["GET", "POST"])
+    async def route_default(path: str, request: Request):
+        return await forward(0, request, f"/{path}")
+
+    return router
+
+def preload() -> None:
+    """Loads what the workers share before forking."""
+    start_time = time.time()
+    # ONNX Runtime sessions own thread pools that do not survive fork, so that backend loads per worker.
+    if settings.EMBEDDING_BACKEND == "torch":
+        rag_service.embedding_backend
+    if settings.VECTOR_SNAPSHOT_PRELOAD:
+        vector_index_registry.preload_snapshots()
+    # Objects created so far are never collected, so the collector does not write to (and copy) their pages.
+    gc.collect()
+    gc.freeze()
+    logger.info(f"Pre-fork preload took: {time.time() - start_time:.4f} seconds")
+
+def child_log_file(name: str) -> str:
+    """Each child writes its own log file (bot-worker0.log, ...), so rotations do not race."""
+    if not settings.LOG_FILE:
+        return ""
+    root, extension = os.path.splitext(settings.LOG_FILE)
+    return f"{root}-{name}{extension}"
+
+def run_worker(worker_index: int, worker_count: int, socket_path: str, respawned: bool) -> None:
+    """Runs in the forked child: serves the bot app on socket_path."""
+    workers.assign(worker_index, worker_count)
+    logging_config.restart_after_fork(child_log_file(f"worker{worker_index}"))
+    supabase_service.reset_client()
+    if respawned:
+        # Indexes loaded by the supervisor at startup may be stale by now.
+        vector_index_registry.unload()
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    logger.info(f"Worker {worker_index}/{worker_count} serving on {socket_path}")
+    uvicorn.Server(uvicorn.Config(worker_app, uds=socket_path, log_config=None)).run()
+
+def run_router(sockets: List[str], host: str, port: int) -> None:
+    logging_config.restart_after_fork(child_log_file("router"))
+    uvicorn.Server(uvicorn.Config(create_router_app(sockets), host=host, port=port, log_config=None)).run()
+
+def spawn(target, *args) -> int:
+    pid = os.fork()
+    if pid == 0:
+        status = 0
+        try:
+            target(*args)
+        except BaseException:
+            logger.exception("Pre-fork child failed")
+            status = 1
+        finally:
+            logging_config.stop_logging()
+            os._exit(status)
+    return pid
+
+def serve(host: str, port: int, worker_count: int, socket_dir: str) -> None:
+    os.makedirs(socket_dir, exist_ok=True)
+    sockets = [os.path.join(socket_dir, f"worker-{i}.sock") for i in range(worker_count)]
+    preload()
+
+    children: Dict[int, Tuple[str, int]] = {}
+    for i, path in enumerate(sockets):
+        children[spawn(run_worker, i, worker_count, path, False)] = ('worker', i)
+    children[spawn(run_router, sockets, host, port)] = ('router', -1)
+    logger.info(f"Serving on {host}:{port} with {worker_count} workers.")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        role, worker_index = children.pop(pid)
+        if stopping:
+            continue
+        name = f"Worker {worker_index}" if role == 'worker' else "Router"
+        logger.error(f"{name} (pid {pid}) exited with status {status}; restarting it.")
+        time.sleep(1.0)
+        if role == 'worker':
+            children[spawn(run_worker, worker_index, worker_count, sockets[worker_index], True)] = (role, worker_index)
+        else:
+            children[spawn(run_router, sockets, host, port)] = (role, worker_index)
+    logger.info("All workers have exited.")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=settings.PREFORK_WORKERS)
+    parser.add_argument('--host', default="0.0.0.0")
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--socket-dir', default=settings.PREFORK_SOCKET_DIR)
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.socket_dir)
+
+if __name__ == "__main__":
+    main()
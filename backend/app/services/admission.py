@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Tuple
+
+from app.core.config import settings
+
+class TokenBucket:
+    """Holds up to `capacity` tokens, refilled at `rate` tokens per second."""
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def refill(self, rate: float, capacity: float, now: float) -> float:
+        """Brings the bucket up to `now` (applying plan changes) and returns the tokens available."""
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * self.rate)
+        self.rate, self.capacity, self.updated = rate, capacity, now
+        return self.tokens
+
+class Admission(NamedTuple):
+    admitted: bool
+    # 'chat_rate' or 'company_rate' when refused
+    reason: str | None = None
+    # False for further refusals of a chat that was already told it is rate limited
+    notify: bool = False
+
+ADMITTED = Admission(True)
+
+class AdmissionController:
+    """
+    Per-chat and per-company token-bucket rate limits, checked before a message
+    costs any database or model work. Rates come from the plan's
+    chat_messages_per_minute / company_messages_per_minute columns when present,
+    else from settings; a rate of 0 disables that limit. Chat buckets are kept
+    for the max_chats most recent chats, and a refused chat is remembered as
+    notified for notify_ttl seconds after its last refusal (at most max_chats of
+    them). Refusals are counted per bot (one bot per company), so they are
+    attributed even before the tenant is cached.
+    """
+    def __init__(self, max_chats: int, notify_ttl: float):
+        self.max_chats = max_chats
+        self.notify_ttl = notify_ttl
+        self._chats: OrderedDict[Tuple[str, str], TokenBucket] = OrderedDict()
+        self._companies: Dict[str, TokenBucket] = {}
+        # Chats refused since their last admitted message -> time of their last refusal,
+        # oldest first, so each flood gets one reply.
+        self._notified: OrderedDict[Tuple[str, str], float] = OrderedDict()
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.refused = 0
+        # bot token -> refusals by reason
+        self._refusals: Dict[str, Dict[str, int]] = {}
+
+    def admit(self, bot_token: str, chat_id: str, plan: Dict[str, Any] | None = None) -> Admission:
+        if not settings.ADMISSION_CONTROL_ENABLED:
+            return ADMITTED
+        chat_rate = _per_second(plan, 'chat_messages_per_minute', settings.CHAT_MESSAGES_PER_MINUTE)
+        company_rate = _per_second(plan, 'company_messages_per_minute', settings.COMPANY_MESSAGES_PER_MINUTE)
+        chat_key = (bot_token, chat_id)
+        now = time.monotonic()
+
+        with self._lock:
+            self._forget_notified(now)
+            chat = self._bucket(chat_key, chat_rate, settings.CHAT_BURST, now) if chat_rate else None
+            company = self._company_bucket(bot_token, company_rate, now) if company_rate else None
+            # Both buckets are checked before either is charged, so a refused message costs nothing.
+            if chat is not None and chat.refill(chat_rate, settings.CHAT_BURST, now) < 1:
+                reason = 'chat_rate'
+            elif company is not None and company.refill(company_rate, settings.COMPANY_BURST, now) < 1:
+                reason = 'company_rate'
+            else:
+                if chat is not None:
+                    chat.tokens -= 1
+                if company is not None:
+                    company.tokens -= 1
+                self._notified.pop(chat_key, None)
+                self.admitted += 1
+                return ADMITTED
+
+            self.refused += 1
+            refusals = self._refusals.setdefault(bot_token, {})
+            refusals[reason] = refusals.get(reason, 0) + 1
+            notify = chat_key not in self._notified
+            self._notified[chat_key] = now
+            self._notified.move_to_end(chat_key)
+            if len(self._notified) > self.max_chats:
+                self._notified.popitem(last=False)
+            return Admission(False, reason, notify)
+
+    def _forget_notified(self, now: float) -> None:
+        """Drops the chats whose last refusal is older than notify_ttl."""
+        cutoff = now - self.notify_ttl
+        while self._notified:
+            key, refused_at = next(iter(self._notified.items()))
+            if refused_at > cutoff:
+                break
+            del self._notified[key]
+
+    def _bucket(self, key: Tuple[str, str], rate: float, capacity: float, now: float) -> TokenBucket:
+        bucket = self._chats.get(key)
+        if bucket is None:
+            bucket = self._chats[key] = TokenBucket(rate, capacity, now)
+            if len(self._chats) > self.max_chats:
+                evicted, _ = self._chats.popitem(last=False)
+                self._notified.pop(evicted, None)
+        else:
+            self._chats.move_to_end(key)
+        return bucket
+
+    def _company_bucket(self, bot_token: str, rate: float, now: float) -> TokenBucket:
+        bucket = self._companies.get(bot_token)
+        if bucket is None:
+            bucket = self._companies[bot_token] = TokenBucket(rate, settings.COMPANY_BURST, now)
+        return bucket
+
+    def clear(self) -> None:
+        with self._lock:
+            self._chats.clear()
+            self._companies.clear()
+            self._notified.clear()
+            self._refusals.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'enabled': settings.ADMISSION_CONTROL_ENABLED,
+                'admitted': self.admitted,
+                'refused': self.refused,
+                'tracked_chats': len(self._chats),
+                'tracked_companies': len(self._companies),
+                'notified_chats': len(self._notified),
+                # Keyed by bot id, the token's part before the colon.
+                'refused_by_bot': {_bot_id(token): dict(reasons) for token, reasons in self._refusals.items()},
+            }
+
+def _bot_id(bot_token: str) -> str:
+    return bot_token.split(':', 1)[0]
+
+def _per_second(plan: Dict[str, Any] | None, column: str, default: float) -> float:
+    value = (plan or {}).get(column)
+    return float(default if value is None else value) / 60.0
+
+admission_controller = AdmissionController(max_chats=settings.ADMISSION_MAX_CHATS, notify_ttl=settings.ADMISSION_NOTIFY_TTL_SECONDS)
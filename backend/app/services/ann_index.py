@@ -0,0 +1,141 @@
+import json
+import logging
+import os
+import time
+from typing import Any, List, Sequence
+
+import numpy as np
+
+from app.services import versioned_dir
+
+logger = logging.getLogger(__name__)
+
+# File names inside the current version of an index directory. The arrays are plain .npy so they can be memory-mapped.
+_CENTROIDS_FILE = 'centroids.npy'
+_OFFSETS_FILE = 'offsets.npy'
+_POSITIONS_FILE = 'positions.npy'
+_IDS_FILE = 'ids.json'
+
+class IVFIndex:
+    """
+    Inverted-file approximate nearest-neighbour index over L2-normalised vectors.
+
+    Training clusters the vectors with spherical k-means into nlist lists; a
+    query scans only the nprobe lists whose centroids are closest to it. The
+    index stores row positions, not vectors: candidates are scored exactly
+    against the caller's matrix, so results carry true cosine similarities.
+
+    The trained lists are three flat arrays (centroids, list offsets and the
+    positions sorted by list) that can be saved and memory-mapped back. Rows
+    added after training are assigned to their nearest list and kept in
+    memory alongside the trained ones.
+    """
+    def __init__(self, centroids: np.ndarray, offsets: np.ndarray, positions: np.ndarray, trained_size: int):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.positions = positions
+        self.trained_size = trained_size
+        self._extra: List[List[int]] = [[] for _ in range(len(centroids))]
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, nlist: int | None = None, iterations: int = 10,
+              sample_size: int = 50000, seed: int = 0) -> "IVFIndex":
+        """Clusters the (normalised) vectors and assigns every row to its nearest list."""
+        start_time = time.time()
+        size = len(vectors)
+        nlist = max(1, min(nlist or int(4 * np.sqrt(size)), size))
+        rng = np.random.default_rng(seed)
+
+        sample = vectors if size <= sample_size else vectors[rng.choice(size, sample_size, replace=False)]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = _nearest(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            counts = np.bincount(assignments, minlength=nlist)
+            # Empty lists keep their previous centroid.
+            filled = counts > 0
+            centroids[filled] = sums[filled]
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            centroids /= np.where(norms == 0, 1.0, norms)
+
+        assignments = _nearest(vectors, centroids)
+        positions = np.argsort(assignments, kind='stable').astype(np.int32)
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assignments, minlength=nlist))
+        logger.info(f"Trained IVF index with {nlist} lists over {size} vectors in {time.time() - start_time:.4f} seconds")
+        return cls(centroids.astype(np.float32), offsets, positions, size)
+
+    def add(self, first_position: int, vectors: np.ndarray) -> None:
+        """Assigns rows first_position, first_position + 1, ... to their nearest lists."""
+        for offset, list_id in enumerate(_nearest(vectors, self.centroids)):
+            self._extra[list_id].append(first_position + offset)
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        """Returns the positions stored in the nprobe lists closest to the (normalised) query."""
+        nprobe = min(nprobe, self.nlist)
+        scores = self.centroids @ query
+        probes = np.argpartition(-scores, nprobe - 1)[:nprobe] if nprobe < self.nlist else np.arange(self.nlist)
+
+        parts = [self.positions[self.offsets[l]:self.offsets[l + 1]] for l in probes]
+        parts.extend(np.asarray(self._extra[l], dtype=np.int32) for l in probes if self._extra[l])
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int32)
+
+    def save(self, directory: str, ids: Sequence[Any]) -> None:
+        """
+        Writes the trained lists to a new version of directory, published in a
+        single rename (see versioned_dir). ids are the row ids the positions
+        refer to, so load() can tell whether the index still matches the data.
+        """
+        version = versioned_dir.new_version(directory)
+        try:
+            np.save(os.path.join(version, _CENTROIDS_FILE), self.centroids)
+            np.save(os.path.join(version, _OFFSETS_FILE), self.offsets)
+            np.save(os.path.join(version, _POSITIONS_FILE), self.positions)
+            with open(os.path.join(version, _IDS_FILE), 'w') as f:
+                json.dump([_jsonable(row_id) for row_id in ids[:self.trained_size]], f)
+            versioned_dir.publish(directory, version)
+        except BaseException:
+            versioned_dir.discard(version)
+            raise
+
+    @classmethod
+    def load(cls, directory: str, ids: Sequence[Any], mmap: bool = True) -> "IVFIndex | None":
+        """
+        Loads an index saved by save(), memory-mapping its arrays. Returns None if
+        there is none, or if it was trained over different rows than the leading
+        entries of ids.
+        """
+        version = versioned_dir.current_version(directory)
+        if version is None:
+            return None
+        mmap_mode = 'r' if mmap else None
+        try:
+            with open(os.path.join(version, _IDS_FILE)) as f:
+                trained_ids = json.load(f)
+            if len(trained_ids) > len(ids) or trained_ids != [_jsonable(row_id) for row_id in ids[:len(trained_ids)]]:
+                logger.info(f"Ignoring stale IVF index in {version}")
+                return None
+            centroids = np.load(os.path.join(version, _CENTROIDS_FILE), mmap_mode=mmap_mode)
+            offsets = np.load(os.path.join(version, _OFFSETS_FILE))
+            positions = np.load(os.path.join(version, _POSITIONS_FILE), mmap_mode=mmap_mode)
+        except (OSError, ValueError) as e:
+            logger.info(f"No usable IVF index in {version}: {e}")
+            return None
+        if len(offsets) != len(centroids) + 1 or offsets[-1] != len(positions) or len(positions) != len(trained_ids):
+            logger.info(f"Ignoring inconsistent IVF index in {version}")
+            return None
+        return cls(centroids, offsets, positions, len(trained_ids))
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray, block: int = 8192) -> np.ndarray:
+    """Index of the most similar centroid for each vector, computed in blocks to bound memory."""
+    return np.concatenate([
+        np.argmax(vectors[i:i + block] @ centroids.T, axis=1) for i in range(0, len(vectors), block)
+    ]) if len(vectors) else np.empty(0, dtype=np.int64)
+
+def _jsonable(row_id: Any) -> Any:
+    return row_id if isinstance(row_id, (int, str)) else str(row_id)
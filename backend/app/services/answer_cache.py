@@ -0,0 +1,144 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.supabase_service import supabase_service
+
+# Rough per-entry bookkeeping cost on top of the vector and answer text.
+_ENTRY_OVERHEAD_BYTES = 256
+
+class AnswerCache:
+    """
+    Per-tenant cache of LLM answers keyed by query embedding. A lookup hits when
+    a cached query from the same company has cosine similarity at or above the
+    threshold and was answered against the same knowledge base version.
+    Entries expire after ttl_seconds and are evicted least-recently-used when a
+    tenant holds max_entries_per_tenant or the cache exceeds max_bytes.
+    """
+    def __init__(self, similarity_threshold: float, ttl_seconds: float, max_entries_per_tenant: int, max_bytes: int):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries_per_tenant = max_entries_per_tenant
+        self.max_bytes = max_bytes
+
+        # Global LRU order over (company_id, entry_id); per-tenant dicts for lookups.
+        self._lru: OrderedDict[Tuple[str, int], None] = OrderedDict()
+        self._tenants: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        self._ids = itertools.count()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self._tenant_counters: Dict[str, List[int]] = {}
+
+    def get(self, company_id: str, query_embedding: List[float], kb_version: int) -> str | None:
+        """Returns a cached answer for a semantically equivalent query, or None."""
+        company_id = str(company_id)
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        now = time.monotonic()
+
+        with self._lock:
+            counters = self._tenant_counters.setdefault(company_id, [0, 0])
+            entries = self._tenants.get(company_id)
+            best_id, best_similarity = None, self.similarity_threshold
+            if entries:
+                for entry_id, entry in list(entries.items()):
+                    if entry['expires_at'] <= now or entry['kb_version'] != kb_version:
+                        self._remove(company_id, entry_id)
+                        continue
+                    similarity = float(entry['embedding'] @ query)
+                    if similarity >= best_similarity:
+                        best_id, best_similarity = entry_id, similarity
+
+            if best_id is None:
+                self.misses += 1
+                counters[1] += 1
+                return None
+
+            self.hits += 1
+            counters[0] += 1
+            self._lru.move_to_end((company_id, best_id))
+            entries[best_id] = entries.pop(best_id)
+            return entries[best_id]['answer']
+
+    def put(self, company_id: str, query_embedding: List[float], kb_version: int, answer: str) -> None:
+        """Caches an answer generated for the query against the given knowledge base version. Empty answers are not cached."""
+        if not answer or not answer.strip():
+            return
+        company_id = str(company_id)
+        embedding = np.asarray(query_embedding, dtype=np.float32)
+        embedding = embedding / (np.linalg.norm(embedding) or 1.0)
+        size = embedding.nbytes + len(answer.encode('utf-8')) + _ENTRY_OVERHEAD_BYTES
+
+        with self._lock:
+            entries = self._tenants.setdefault(company_id, {})
+            while len(entries) >= self.max_entries_per_tenant:
+                self._remove(company_id, next(iter(entries)))
+
+            entry_id = next(self._ids)
+            entries[entry_id] = {
+                'embedding': embedding,
+                'answer': answer,
+                'kb_version': kb_version,
+                'expires_at': time.monotonic() + self.ttl_seconds,
+                'bytes': size,
+            }
+            self._lru[(company_id, entry_id)] = None
+            self._bytes += size
+
+            while self._bytes > self.max_bytes and self._lru:
+                self._remove(*next(iter(self._lru)))
+
+    def _remove(self, company_id: str, entry_id: int) -> None:
+        entries = self._tenants.get(company_id)
+        entry = entries.pop(entry_id, None) if entries else None
+        if entry is None:
+            return
+        self._bytes -= entry['bytes']
+        self._lru.pop((company_id, entry_id), None)
+        if not entries:
+            del self._tenants[company_id]
+
+    def invalidate(self, company_id: str) -> None:
+        """Drops every cached answer for the company (e.g. after its knowledge base changed)."""
+        company_id = str(company_id)
+        with self._lock:
+            for entry_id in list(self._tenants.get(company_id, {})):
+                self._remove(company_id, entry_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._lru.clear()
+            self._tenants.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._lru),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'tenants': {
+                    company_id: {'hits': hits, 'misses': misses, 'hit_rate': hits / (hits + misses)}
+                    for company_id, (hits, misses) in self._tenant_counters.items()
+                    if hits + misses
+                },
+            }
+
+answer_cache = AnswerCache(
+    similarity_threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+    max_entries_per_tenant=settings.ANSWER_CACHE_MAX_ENTRIES_PER_TENANT,
+    max_bytes=settings.ANSWER_CACHE_MAX_BYTES,
+)
+supabase_service.add_knowledge_base_listener(lambda company_id, row: answer_cache.invalidate(company_id))
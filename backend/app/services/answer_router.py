@@ -0,0 +1,74 @@
+import threading
+from typing import Any, Dict, List
+
+from app.core import metrics
+from app.core.config import settings
+
+# knowledge_bases.entry_type values
+PASSAGE = 'passage'
+DIRECT_ANSWER = 'direct_answer'
+
+# How a message was answered
+REPLY_SOURCES = ('direct', 'cache', 'llm')
+
+def direct_answer_threshold(company: Dict[str, Any] | None) -> float:
+    """The company's direct_answer_threshold column if set, else DIRECT_ANSWER_THRESHOLD."""
+    if company and company.get('direct_answer_threshold') is not None:
+        return float(company['direct_answer_threshold'])
+    return settings.DIRECT_ANSWER_THRESHOLD
+
+class AnswerRouter:
+    """
+    Decides whether a message is answered straight from the knowledge base or
+    by Gemini, and counts how each message was answered, per company, so the
+    share of traffic served without an LLM call can be reported.
+    """
+    def __init__(self):
+        self._replies: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def direct_answer(self, candidates: List[Dict[str, Any]], company: Dict[str, Any] | None) -> str | None:
+        """
+        The stored answer of the top search result if it is tagged as a direct
+        answer and its similarity reaches the company's threshold, else None.
+        """
+        if not settings.DIRECT_ANSWERS_ENABLED or not candidates:
+            return None
+        top = candidates[0]
+        answer = top.get('direct_answer')
+        if answer and top['similarity'] >= direct_answer_threshold(company):
+            return answer
+        return None
+
+    def record(self, source: str, company_id: str) -> None:
+        """Counts a reply by source ('direct', 'cache' or 'llm')."""
+        metrics.replies.inc(source, company_id)
+        with self._lock:
+            replies = self._replies.setdefault(str(company_id), dict.fromkeys(REPLY_SOURCES, 0))
+            replies[source] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._replies.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            companies = {company_id: dict(replies) for company_id, replies in self._replies.items()}
+        totals = dict.fromkeys(REPLY_SOURCES, 0)
+        for replies in companies.values():
+            for source, count in replies.items():
+                totals[source] += count
+        return {
+            'enabled': settings.DIRECT_ANSWERS_ENABLED,
+            'replies': totals,
+            'without_llm': _without_llm(totals),
+            'companies': {company_id: {**replies, 'without_llm': _without_llm(replies)}
+                          for company_id, replies in companies.items()},
+        }
+
+def _without_llm(replies: Dict[str, int]) -> float:
+    """Fraction of replies sent from a direct answer or the answer cache."""
+    total = sum(replies.values())
+    return (replies['direct'] + replies['cache']) / total if total else 0.0
+
+answer_router = AnswerRouter()
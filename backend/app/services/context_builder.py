@@ -0,0 +1,135 @@
+import math
+import re
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+# Gemini's tokenizer has a large vocabulary: common words are one token, long
+# words split into pieces, and digits are tokenized one by one.
+_LLM_PIECES = re.compile(r"[^\W\d_]+|\d|[^\w\s]")
+_WORD_CHARS_PER_TOKEN = 10
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_WORDS = re.compile(r"\w+")
+
+def estimate_llm_tokens(text: str) -> int:
+    """
+    Offline estimate of Gemini's token count for text, scaled by
+    LLM_TOKEN_ESTIMATE_SCALE (calibrate it with scripts/count_tokens.py).
+    """
+    tokens = sum(
+        math.ceil(len(piece) / _WORD_CHARS_PER_TOKEN) if piece[0].isalpha() else 1
+        for piece in _LLM_PIECES.findall(text)
+    )
+    return math.ceil(tokens * settings.LLM_TOKEN_ESTIMATE_SCALE)
+
+def token_budget_for_plan(plan: Dict[str, Any] | None) -> int:
+    """
+    The context token budget for a plan: its context_token_budget column if set,
+    else CONTEXT_TOKEN_BUDGETS by plan name, else CONTEXT_TOKEN_BUDGET.
+    """
+    if plan:
+        if plan.get('context_token_budget'):
+            return int(plan['context_token_budget'])
+        if plan.get('name') in settings.CONTEXT_TOKEN_BUDGETS:
+            return settings.CONTEXT_TOKEN_BUDGETS[plan['name']]
+    return settings.CONTEXT_TOKEN_BUDGET
+
+def build_context(passages: List[Dict[str, Any]], token_budget: int, max_passages: int,
+                  diversity: float, duplicate_threshold: float) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """
+    Selects passages for the prompt from retrieval results (best first, each with
+    'content', 'similarity' and optionally a normalised 'embedding' and a
+    'relevance' that replaces similarity in ranking, as hybrid search sets).
+
+    Selection is maximal marginal relevance: each step takes the candidate with the
+    best diversity * relevance - (1 - diversity) * redundancy, where redundancy
+    is its highest similarity to a passage already selected. Candidates at or above
+    duplicate_threshold are dropped as near-duplicates. A passage that crosses
+    token_budget is cut at the last sentence that fits, or at a word boundary when
+    not even its first sentence does; one that cannot be cut to fit is skipped in
+    favour of shorter candidates. The best passage is always kept, so found
+    knowledge is never reduced to nothing.
+
+    Returns the selected passages and a report comparing their estimated tokens
+    with the first max_passages results joined in full.
+    """
+    naive_tokens = sum(estimate_llm_tokens(passage['content']) for passage in passages[:max_passages])
+    candidates = list(passages)
+    selected: List[Dict[str, Any]] = []
+    used_tokens, duplicates, truncated = 0, 0, 0
+
+    while candidates and len(selected) < max_passages and used_tokens < token_budget:
+        scored = []
+        for candidate in candidates:
+            redundancy = max((_similarity(candidate, passage) for passage in selected), default=0.0)
+            if redundancy >= duplicate_threshold:
+                duplicates += 1
+                continue
+            relevance = candidate.get('relevance', candidate['similarity'])
+            scored.append((diversity * relevance - (1 - diversity) * redundancy, candidate))
+        if not scored:
+            break
+        best = max(scored, key=lambda item: item[0])[1]
+        candidates = [candidate for _, candidate in scored if candidate is not best]
+
+        content = best['content']
+        tokens = estimate_llm_tokens(content)
+        if used_tokens + tokens > token_budget:
+            content = _truncate_to_sentences(content, token_budget - used_tokens)
+            if not content:
+                if selected:
+                    continue
+                # Not even a word fits (one huge token run): keep a roughly budget-sized
+                # slice rather than answer without knowledge.
+                content = best['content'].strip()[:max(1, token_budget - used_tokens) * _WORD_CHARS_PER_TOKEN]
+            tokens = estimate_llm_tokens(content)
+            truncated += 1
+        selected.append({**best, 'content': content})
+        used_tokens += tokens
+
+    return selected, {
+        'passages': len(selected),
+        'tokens': used_tokens,
+        'naive_tokens': naive_tokens,
+        'saved_tokens': naive_tokens - used_tokens,
+        'duplicates_dropped': duplicates,
+        'truncated': truncated,
+    }
+
+def _similarity(a: Dict[str, Any], b: Dict[str, Any]) -> float:
+    """Cosine similarity when both passages carry embeddings, otherwise word-set overlap."""
+    if a.get('embedding') is not None and b.get('embedding') is not None:
+        return float(np.dot(a['embedding'], b['embedding']))
+    words_a, words_b = set(_WORDS.findall(a['content'].lower())), set(_WORDS.findall(b['content'].lower()))
+    if not words_a or not words_b:
+        return 0.0
+    return len(words_a & words_b) / len(words_a | words_b)
+
+def _truncate_to_sentences(text: str, max_tokens: int) -> str:
+    """
+    The longest run of leading sentences within max_tokens. If not even the first
+    fits (e.g. a long unpunctuated CSV row), its leading words; "" if no word fits.
+    """
+    kept, tokens = [], 0
+    for sentence in _SENTENCE_END.split(text.strip()):
+        sentence_tokens = estimate_llm_tokens(sentence)
+        if tokens + sentence_tokens > max_tokens:
+            if not kept:
+                return _truncate_to_words(sentence, max_tokens)
+            break
+        kept.append(sentence)
+        tokens += sentence_tokens
+    return " ".join(kept)
+
+def _truncate_to_words(text: str, max_tokens: int) -> str:
+    """The longest run of leading words within max_tokens."""
+    kept, tokens = [], 0
+    for word in text.split():
+        word_tokens = estimate_llm_tokens(word)
+        if tokens + word_tokens > max_tokens:
+            break
+        kept.append(word)
+        tokens += word_tokens
+    return " ".join(kept)
@@ -0,0 +1,304 @@
+import asyncio
+import logging
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, NamedTuple, Tuple
+
+from app.core.config import settings
+from app.services.supabase_service import supabase_service
+
+logger = logging.getLogger(__name__)
+
+# Rough per-turn cost on top of the question and answer text (string headers, the turn
+# tuple, its share of the chat's deque and index entry), from scripts/benchmark_conversations.py.
+_TURN_OVERHEAD_BYTES = 450
+
+# Words that usually refer back to an earlier turn ("and how long does that take?").
+_REFERRING_WORDS = frozenset({'it', 'its', 'that', 'this', 'those', 'these', 'they', 'them', 'their', 'there',
+                              'he', 'she', 'him', 'her', 'one', 'ones', 'else', 'also', 'too'})
+_FOLLOW_UP_OPENERS = ('and ', 'but ', 'or ', 'so ', 'what about', 'how about', 'then ')
+_WORD = re.compile(r"[a-z']+")
+
+class Turn(NamedTuple):
+    question: str
+    answer: str
+
+class Conversation:
+    __slots__ = ('id', 'turns', 'last_active', 'bytes')
+
+    def __init__(self, max_turns: int):
+        self.id = str(uuid.uuid4())
+        self.turns: Deque[Turn] = deque(maxlen=max_turns)
+        self.last_active = time.monotonic()
+        self.bytes = 0
+
+class ConversationStore:
+    """
+    The last max_turns question/answer pairs of each chat, kept in memory. A chat
+    idle for idle_ttl_seconds starts a new conversation. When the turns held
+    exceed max_bytes the least recently active conversations are dropped.
+
+    Every turn is also queued for the conversations and messages tables and
+    written by a background loop in batched inserts, so the reply path never
+    waits on the database. At most max_unflushed message rows (and as many
+    conversation rows) are held while the database is unreachable; older ones are
+    dropped, together with the messages of a dropped conversation, and counted.
+    """
+    def __init__(self, max_turns: int, idle_ttl_seconds: float, max_bytes: int,
+                 flush_interval: float, max_pending: int, max_unflushed: int):
+        self.max_turns = max_turns
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_unflushed = max_unflushed
+
+        self._conversations: OrderedDict[Tuple[str, str], Conversation] = OrderedDict()
+        self._bytes = 0
+        self._turns = 0
+        self._pending_conversations: Deque[Dict[str, Any]] = deque()
+        self._pending_messages: Deque[Dict[str, Any]] = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wake: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+        self.evictions = 0
+        self.flushes = 0
+        self.conversations_written = 0
+        self.messages_written = 0
+        self.flush_failures = 0
+        self.dropped_conversations = 0
+        self.dropped_messages = 0
+        # Drop counts as of the last warning, so each warning reports the drops since.
+        self._reported_drops = (0, 0)
+
+    # --- Memory ---
+    def history(self, company_id: str, chat_id: str) -> List[Turn]:
+        """The chat's recent turns, oldest first; empty if the chat is new or was idle too long."""
+        key = (str(company_id), str(chat_id))
+        with self._lock:
+            conversation = self._conversations.get(key)
+            if conversation is None:
+                return []
+            if time.monotonic() - conversation.last_active > self.idle_ttl_seconds:
+                self._drop(key)
+                return []
+            return list(conversation.turns)
+
+    def append(self, company_id: str, chat_id: str, telegram_user_id: str, question: str, answer: str) -> None:
+        """Adds a turn to the chat's conversation and queues it for the next batched write."""
+        key = (str(company_id), str(chat_id))
+        now = time.monotonic()
+        timestamp = datetime.now(timezone.utc).isoformat()
+        turn = Turn(question, answer)
+        size = len(question.encode('utf-8')) + len(answer.encode('utf-8')) + _TURN_OVERHEAD_BYTES
+
+        with self._lock:
+            conversation = self._conversations.get(key)
+            if conversation is not None and now - conversation.last_active > self.idle_ttl_seconds:
+                self._drop(key)
+                conversation = None
+            if conversation is None:
+                conversation = self._conversations[key] = Conversation(self.max_turns)
+                if settings.CONVERSATION_PERSIST:
+                    self._pending_conversations.append({
+                        'id': conversation.id,
+                        'company_id': key[0],
+                        'telegram_user_id': str(telegram_user_id),
+                        'start_time': timestamp,
+                    })
+            else:
+                self._conversations.move_to_end(key)
+
+            if len(conversation.turns) == conversation.turns.maxlen:
+                oldest = conversation.turns[0]
+                released = len(oldest.question.encode('utf-8')) + len(oldest.answer.encode('utf-8')) + _TURN_OVERHEAD_BYTES
+                conversation.bytes -= released
+                self._bytes -= released
+                self._turns -= 1
+            conversation.turns.append(turn)
+            conversation.bytes += size
+            conversation.last_active = now
+            self._bytes += size
+            self._turns += 1
+            while self._bytes > self.max_bytes and len(self._conversations) > 1:
+                self._drop(next(iter(self._conversations)))
+                self.evictions += 1
+
+            should_flush = False
+            if settings.CONVERSATION_PERSIST:
+                for sender, content in (('user', question), ('bot', answer)):
+                    self._pending_messages.append({
+                        'conversation_id': conversation.id, 'sender': sender, 'content': content, 'timestamp': timestamp,
+                    })
+                self._trim()
+                should_flush = len(self._pending_messages) >= self.max_pending
+
+        if should_flush and self._loop is not None and self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def _drop(self, key: Tuple[str, str]) -> None:
+        conversation = self._conversations.pop(key)
+        self._bytes -= conversation.bytes
+        self._turns -= len(conversation.turns)
+
+    def _trim(self) -> None:
+        """
+        Drops the oldest queued rows past max_unflushed, and the queued messages of
+        any conversation dropped (they could not be inserted without it).
+        """
+        dropped_ids = set()
+        while len(self._pending_conversations) > self.max_unflushed:
+            dropped_ids.add(self._pending_conversations.popleft()['id'])
+        messages = len(self._pending_messages)
+        if dropped_ids:
+            self._pending_messages = deque(message for message in self._pending_messages
+                                           if message['conversation_id'] not in dropped_ids)
+        while len(self._pending_messages) > self.max_unflushed:
+            self._pending_messages.popleft()
+        self.dropped_conversations += len(dropped_ids)
+        self.dropped_messages += messages - len(self._pending_messages)
+
+    def evict_idle(self) -> int:
+        """Drops conversations idle for longer than idle_ttl_seconds. Returns how many were dropped."""
+        cutoff = time.monotonic() - self.idle_ttl_seconds
+        with self._lock:
+            # Conversations are ordered by last activity, so the idle ones come first.
+            idle = []
+            for key, conversation in self._conversations.items():
+                if conversation.last_active > cutoff:
+                    break
+                idle.append(key)
+            for key in idle:
+                self._drop(key)
+        return len(idle)
+
+    def clear(self) -> None:
+        """Forgets every conversation (queued rows are still written)."""
+        with self._lock:
+            self._conversations.clear()
+            self._bytes = 0
+            self._turns = 0
+
+    # --- Persistence ---
+    def flush(self) -> int:
+        """
+        Writes queued conversations, then their messages, as one batched insert
+        each. Rows whose insert fails are put back and retried on the next flush.
+        Returns the number of message rows written.
+        """
+        with self._flush_lock:
+            with self._lock:
+                conversations, self._pending_conversations = list(self._pending_conversations), deque()
+                messages, self._pending_messages = list(self._pending_messages), deque()
+            if not conversations and not messages:
+                return 0
+
+            # Messages reference their conversation, so they wait until it is written.
+            conversations_written = supabase_service.add_conversations(conversations)
+            messages_written = conversations_written and supabase_service.add_messages(messages)
+
+            with self._lock:
+                if conversations_written:
+                    self.conversations_written += len(conversations)
+                else:
+                    self._pending_conversations.extendleft(reversed(conversations))
+                if messages_written:
+                    self.flushes += 1
+                    self.messages_written += len(messages)
+                else:
+                    self._pending_messages.extendleft(reversed(messages))
+                    self._trim()
+                    self.flush_failures += 1
+                reported, self._reported_drops = self._reported_drops, (self.dropped_conversations, self.dropped_messages)
+
+            if self._reported_drops != reported:
+                logger.warning(f"Conversation write queue full: dropped the oldest {self._reported_drops[0] - reported[0]} "
+                               f"conversations and {self._reported_drops[1] - reported[1]} messages.")
+            if not messages_written:
+                logger.error(f"Failed to write {len(conversations)} conversations and {len(messages)} messages; will retry.")
+                return 0
+            logger.info(f"Wrote {len(conversations)} conversations and {len(messages)} messages.")
+            return len(messages)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            self.evict_idle()
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.error(f"Conversation flush failed: {e}", exc_info=True)
+
+    def start(self) -> None:
+        """Starts the background flush loop on the running event loop."""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stops the flush loop and writes out everything still queued."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'conversations': len(self._conversations),
+                'turns': self._turns,
+                'bytes': self._bytes,
+                'evictions': self.evictions,
+                'pending_conversations': len(self._pending_conversations),
+                'pending_messages': len(self._pending_messages),
+                'flushes': self.flushes,
+                'conversations_written': self.conversations_written,
+                'messages_written': self.messages_written,
+                'flush_failures': self.flush_failures,
+                'dropped_conversations': self.dropped_conversations,
+                'dropped_messages': self.dropped_messages,
+            }
+
+def is_follow_up(query: str) -> bool:
+    """Whether the query probably depends on the previous turn to make sense."""
+    text = query.strip().lower()
+    words = _WORD.findall(text)
+    if len(words) <= 2 or text.startswith(_FOLLOW_UP_OPENERS):
+        return True
+    return len(words) <= settings.CONVERSATION_FOLLOW_UP_MAX_WORDS and not _REFERRING_WORDS.isdisjoint(words)
+
+def retrieval_query(history: List[Turn], query: str) -> str:
+    """
+    The text to embed for retrieval. A follow-up is prefixed with the previous
+    question, so "and how long does that take?" searches for what "that" was.
+    """
+    if history and is_follow_up(query):
+        return f"{history[-1].question} {query}"
+    return query
+
+conversation_store = ConversationStore(
+    max_turns=settings.CONVERSATION_MAX_TURNS,
+    idle_ttl_seconds=settings.CONVERSATION_IDLE_TTL_SECONDS,
+    max_bytes=settings.CONVERSATION_MAX_BYTES,
+    flush_interval=settings.CONVERSATION_FLUSH_INTERVAL_SECONDS,
+    max_pending=settings.CONVERSATION_FLUSH_MAX_PENDING,
+    max_unflushed=settings.CONVERSATION_MAX_UNFLUSHED,
+)
@@ -0,0 +1,82 @@
+import logging
+import os
+import time
+from typing import List
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class SentenceTransformerBackend:
+    """The reference backend: sentence-transformers on PyTorch."""
+    name = "torch"
+
+    def __init__(self, model_name: str):
+        # Imported here so processes that never embed do not pay for loading torch.
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        return self.model.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+
+class OnnxBackend:
+    """
+    ONNX Runtime backend for an exported (optionally int8-quantized) copy of the
+    same model. Reproduces the sentence-transformers pipeline for
+    all-MiniLM-L6-v2 (mean pooling over the attention mask, then L2
+    normalisation) so its vectors are interchangeable with the torch backend's.
+    Expects model_dir to hold the ONNX file and tokenizer.json, as written by
+    scripts/export_onnx_model.py.
+    """
+    name = "onnx"
+
+    def __init__(self, model_dir: str, model_file: str, max_length: int = 256, threads: int = 0):
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError("EMBEDDING_BACKEND=onnx requires the onnxruntime and tokenizers packages.") from e
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, 'tokenizer.json'))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, model_file), options, providers=['CPUExecutionProvider']
+        )
+        self._input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        batches = [self._encode_batch(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)]
+        return np.concatenate(batches) if batches else np.empty((0, 0), dtype=np.float32)
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        feeds = {'input_ids': input_ids, 'attention_mask': attention_mask}
+        if 'token_type_ids' in self._input_names:
+            feeds['token_type_ids'] = np.zeros_like(input_ids)
+
+        token_embeddings = self.session.run(None, feeds)[0]
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+def create_embedding_backend(backend: str | None = None):
+    """Builds the embedding backend selected by EMBEDDING_BACKEND ("torch" or "onnx")."""
+    backend = backend or settings.EMBEDDING_BACKEND
+    start_time = time.time()
+    if backend == "onnx":
+        instance = OnnxBackend(settings.EMBEDDING_ONNX_DIR, settings.EMBEDDING_ONNX_FILE, threads=settings.EMBEDDING_ONNX_THREADS)
+    elif backend == "torch":
+        instance = SentenceTransformerBackend(settings.EMBEDDING_MODEL_NAME)
+    else:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend}")
+    logger.info(f"Loaded {backend} embedding backend in {time.time() - start_time:.4f} seconds")
+    return instance
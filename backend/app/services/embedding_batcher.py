@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from app.core.concurrency import offload, embedding_executor
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingBatcher:
+    """
+    Collects concurrent embedding requests for up to window_seconds (or until
+    max_batch_size requests are waiting) and encodes them with a single model
+    call, resolving each caller's future with its own vector.
+    """
+    def __init__(self, encode: Callable[[List[str]], List[List[float]]], window_seconds: float, max_batch_size: int):
+        self._encode_batch = encode
+        self.window_seconds = window_seconds
+        self.max_batch_size = max_batch_size
+
+        self._pending: List[Tuple[str, asyncio.Future, float]] = []
+        self._timer: asyncio.TimerHandle | None = None
+
+        self.batches = 0
+        self.items = 0
+        self.total_queue_delay = 0.0
+        self.max_queue_delay = 0.0
+
+    async def embed(self, text: str) -> List[float]:
+        """Queues a text for the next batch and waits for its embedding."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future, time.perf_counter()))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_seconds, self._dispatch)
+        return await future
+
+    async def embed_many(self, texts: List[str]) -> List[List[float]]:
+        """Embeds several texts through the shared queue."""
+        return list(await asyncio.gather(*(self.embed(text) for text in texts)))
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending[:self.max_batch_size], self._pending[self.max_batch_size:]
+        if self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self.window_seconds, self._dispatch)
+        if batch:
+            asyncio.get_running_loop().create_task(self._encode(batch))
+
+    async def _encode(self, batch: List[Tuple[str, asyncio.Future, float]]) -> None:
+        started = time.perf_counter()
+        delays = [started - enqueued for _, _, enqueued in batch]
+        self.batches += 1
+        self.items += len(batch)
+        self.total_queue_delay += sum(delays)
+        self.max_queue_delay = max(self.max_queue_delay, max(delays))
+
+        try:
+            vectors = await offload(embedding_executor, self._encode_batch, [text for text, _, _ in batch])
+        except Exception as e:
+            logger.error(f"Batched embedding of {len(batch)} texts failed: {e}", exc_info=True)
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future, _), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'avg_batch_size': self.items / self.batches if self.batches else 0.0,
+            'avg_batch_fill': self.items / (self.batches * self.max_batch_size) if self.batches else 0.0,
+            'avg_queue_delay_ms': 1000 * self.total_queue_delay / self.items if self.items else 0.0,
+            'max_queue_delay_ms': 1000 * self.max_queue_delay,
+            'queued': len(self._pending),
+        }
@@ -0,0 +1,31 @@
+import base64
+import json
+from typing import Any, List
+
+import numpy as np
+
+# Compact encodings are "<tag>:<base64 of the little-endian vector>", so the dtype travels with the value.
+_DTYPES = {'f16': np.dtype('<f2'), 'f32': np.dtype('<f4')}
+_TAGS = {'float16': 'f16', 'float32': 'f32'}
+
+def encode_embedding(embedding: List[float] | np.ndarray, dtype: str = 'float16') -> str:
+    """
+    Encodes an embedding for the knowledge_bases.embedding_compact column.
+    float16 is 2 bytes per dimension (1 KB of text for 384 dimensions), which is
+    well within the precision cosine ranking needs for normalised vectors.
+    """
+    tag = _TAGS[dtype]
+    raw = np.asarray(embedding, dtype=_DTYPES[tag]).tobytes()
+    return f"{tag}:{base64.b64encode(raw).decode('ascii')}"
+
+def decode_embedding(value: Any) -> np.ndarray:
+    """
+    Decodes an embedding in any stored form: a compact string, the JSON text
+    pgvector returns, or a plain list.
+    """
+    if isinstance(value, str):
+        tag, _, payload = value.partition(':')
+        if tag in _DTYPES:
+            return np.frombuffer(base64.b64decode(payload), dtype=_DTYPES[tag]).astype(np.float32)
+        value = json.loads(value)
+    return np.asarray(value, dtype=np.float32)
@@ -0,0 +1,205 @@
+import csv
+import logging
+import os
+import re
+import time
+from typing import Iterable, Iterator, List, Tuple
+
+from app.core.config import settings
+from app.services.answer_router import DIRECT_ANSWER
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_MARKDOWN_HEADING = re.compile(r"^#{1,6}\s")
+
+def estimate_tokens(text: str) -> int:
+    """Counts words and punctuation marks, a slight over-estimate of MiniLM word pieces for English."""
+    return len(_TOKEN_PATTERN.findall(text))
+
+# --- Readers ---
+def read_paragraphs(path: str) -> Iterator[str]:
+    """Streams a text or markdown file as paragraphs, split on blank lines and headings."""
+    buffer: List[str] = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip()
+            if not line or _MARKDOWN_HEADING.match(line):
+                if buffer:
+                    yield " ".join(buffer)
+                    buffer = []
+                if line:
+                    buffer.append(line.lstrip('#').strip())
+                continue
+            buffer.append(line.strip())
+    if buffer:
+        yield " ".join(buffer)
+
+def read_faq_rows(path: str) -> Iterator[str]:
+    """
+    Streams a CSV file one row at a time. Rows with question/answer columns become
+    "Q: ... A: ..." passages; other CSVs are rendered as "column: value" pairs.
+    """
+    with open(path, encoding='utf-8', newline='') as f:
+        reader = csv.DictReader(f)
+        columns = {name.lower().strip(): name for name in reader.fieldnames or []}
+        question, answer = columns.get('question'), columns.get('answer')
+        for row in reader:
+            if question and answer:
+                text = f"Q: {row[question].strip()}\nA: {row[answer].strip()}"
+            else:
+                text = "\n".join(f"{name}: {value.strip()}" for name, value in row.items() if value and value.strip())
+            if text.strip():
+                yield text
+
+def read_direct_answers(path: str) -> Iterator[Tuple[str, str]]:
+    """Streams the (question, answer) rows of a CSV file with question and answer columns."""
+    with open(path, encoding='utf-8', newline='') as f:
+        reader = csv.DictReader(f)
+        columns = {name.lower().strip(): name for name in reader.fieldnames or []}
+        question, answer = columns.get('question'), columns.get('answer')
+        if not (question and answer):
+            raise ValueError(f"{path} needs question and answer columns to be stored as direct answers")
+        for row in reader:
+            if row[question].strip() and row[answer].strip():
+                yield row[question].strip(), row[answer].strip()
+
+def read_documents(path: str) -> Iterator[str]:
+    """Picks a reader by file extension (.csv, otherwise text/markdown)."""
+    if os.path.splitext(path)[1].lower() == '.csv':
+        return read_faq_rows(path)
+    return read_paragraphs(path)
+
+# --- Chunking ---
+def _split_sentences(paragraph: str, max_tokens: int) -> Iterator[str]:
+    for sentence in _SENTENCE_END.split(paragraph.strip()):
+        if estimate_tokens(sentence) <= max_tokens:
+            if sentence:
+                yield sentence
+            continue
+        # A single over-long sentence is cut on word boundaries.
+        words, current = sentence.split(), []
+        for word in words:
+            if current and estimate_tokens(" ".join(current + [word])) > max_tokens:
+                yield " ".join(current)
+                current = []
+            current.append(word)
+        if current:
+            yield " ".join(current)
+
+def chunk_paragraphs(paragraphs: Iterable[str], max_tokens: int, overlap_tokens: int) -> Iterator[str]:
+    """
+    Packs sentences into chunks of at most max_tokens. Each chunk starts with up
+    to overlap_tokens worth of trailing sentences from the previous one, so an
+    answer that straddles a boundary is still retrievable.
+    """
+    current: List[str] = []
+    current_tokens = 0
+
+    for paragraph in paragraphs:
+        for sentence in _split_sentences(paragraph, max_tokens):
+            tokens = estimate_tokens(sentence)
+            if current and current_tokens + tokens > max_tokens:
+                yield " ".join(current)
+                overlap: List[str] = []
+                overlap_count = 0
+                for previous in reversed(current):
+                    count = estimate_tokens(previous)
+                    if overlap_count + count > overlap_tokens or overlap_count + count + tokens > max_tokens:
+                        break
+                    overlap.insert(0, previous)
+                    overlap_count += count
+                current, current_tokens = overlap, overlap_count
+            current.append(sentence)
+            current_tokens += tokens
+
+    if current:
+        yield " ".join(current)
+
+def chunk_documents(documents: Iterable[str], max_tokens: int, overlap_tokens: int, *, one_per_document: bool = False) -> Iterator[str]:
+    """Chunks a stream of documents; FAQ rows are kept as separate chunks when one_per_document is set."""
+    if not one_per_document:
+        yield from chunk_paragraphs(documents, max_tokens, overlap_tokens)
+        return
+    for document in documents:
+        yield from chunk_paragraphs([document], max_tokens, overlap_tokens)
+
+class IngestionService:
+    """
+    Streams knowledge files into token-bounded, overlapping chunks, embeds them in
+    batches and bulk-inserts them into knowledge_bases.
+    """
+    def __init__(self, rag_service, supabase_service, *, max_tokens: int | None = None, overlap_tokens: int | None = None, batch_size: int | None = None):
+        self.rag_service = rag_service
+        self.supabase_service = supabase_service
+        self.max_tokens = max_tokens or settings.INGESTION_CHUNK_TOKENS
+        self.overlap_tokens = overlap_tokens if overlap_tokens is not None else settings.INGESTION_CHUNK_OVERLAP_TOKENS
+        self.batch_size = batch_size or settings.INGESTION_BATCH_SIZE
+
+    def chunk_file(self, path: str) -> Iterator[str]:
+        is_csv = os.path.splitext(path)[1].lower() == '.csv'
+        return chunk_documents(read_documents(path), self.max_tokens, self.overlap_tokens, one_per_document=is_csv)
+
+    def chunk_text(self, text: str) -> Iterator[str]:
+        paragraphs = (paragraph for paragraph in re.split(r"\n\s*\n", text) if paragraph.strip())
+        return chunk_paragraphs(paragraphs, self.max_tokens, self.overlap_tokens)
+
+    def ingest_chunks(self, company_id: str, chunks: Iterable[str]) -> int:
+        """Embeds and inserts chunks batch_size at a time. Returns the number of rows inserted."""
+        start_time = time.time()
+        inserted = 0
+        batch: List[str] = []
+        for chunk in chunks:
+            batch.append(chunk)
+            if len(batch) >= self.batch_size:
+                inserted += self._ingest_batch(company_id, batch)
+                batch = []
+        if batch:
+            inserted += self._ingest_batch(company_id, batch)
+
+        logger.info(f"Ingested {inserted} chunks for company {company_id} in {time.time() - start_time:.4f} seconds")
+        return inserted
+
+    def ingest_files(self, company_id: str, paths: Iterable[str]) -> int:
+        return self.ingest_chunks(company_id, (chunk for path in paths for chunk in self.chunk_file(path)))
+
+    def ingest_text(self, company_id: str, text: str) -> int:
+        return self.ingest_chunks(company_id, self.chunk_text(text))
+
+    def ingest_direct_answers(self, company_id: str, paths: Iterable[str]) -> int:
+        """
+        Inserts the question/answer rows of FAQ CSVs as direct-answer entries: the
+        question alone is embedded, so it matches how customers ask, and the answer
+        is stored to be sent as is. Returns the number of rows inserted.
+        """
+        start_time = time.time()
+        inserted = 0
+        batch: List[Tuple[str, str]] = []
+        for pair in (pair for path in paths for pair in read_direct_answers(path)):
+            batch.append(pair)
+            if len(batch) >= self.batch_size:
+                inserted += self._ingest_direct_answer_batch(company_id, batch)
+                batch = []
+        if batch:
+            inserted += self._ingest_direct_answer_batch(company_id, batch)
+
+        logger.info(f"Ingested {inserted} direct answers for company {company_id} in {time.time() - start_time:.4f} seconds")
+        return inserted
+
+    def _ingest_batch(self, company_id: str, contents: List[str]) -> int:
+        embeddings = self.rag_service.generate_embeddings(contents, batch_size=self.batch_size)
+        rows = self.supabase_service.add_knowledge_base_entries(
+            company_id,
+            [{'content': content, 'embedding': embedding} for content, embedding in zip(contents, embeddings)],
+        )
+        return len(rows)
+
+    def _ingest_direct_answer_batch(self, company_id: str, pairs: List[Tuple[str, str]]) -> int:
+        embeddings = self.rag_service.generate_embeddings([question for question, _ in pairs], batch_size=self.batch_size)
+        rows = self.supabase_service.add_knowledge_base_entries(
+            company_id,
+            [{'content': f"Q: {question}\nA: {answer}", 'embedding': embedding, 'entry_type': DIRECT_ANSWER, 'answer': answer}
+             for (question, answer), embedding in zip(pairs, embeddings)],
+        )
+        return len(rows)
@@ -0,0 +1,148 @@
+import math
+import re
+import threading
+from array import array
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+# Words joined by - . / (SKUs, phone numbers, versions) are indexed whole and by part,
+# so "SKU-48213" matches "sku-48213" exactly and "48213" on its own.
+_TOKEN = re.compile(r"\w+(?:[-./]\w+)*")
+_PART = re.compile(r"\w+")
+_STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from how i if in is it me my no not of on or our so that the
+their them there these they this to was we what when where which who why will with you your
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in _TOKEN.findall(text.casefold()):
+        if token not in _STOPWORDS:
+            tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in _PART.findall(token) if part not in _STOPWORDS)
+    return tokens
+
+class BM25Index:
+    """
+    Inverted index over a tenant's knowledge base rows, scored with Okapi BM25.
+    Documents are identified by their position in the TenantVectorIndex and are
+    only ever appended. Postings are compact arrays, so the index costs a few
+    bytes per (term, row) pair, and a search only touches the postings of the
+    query's terms. save() and load() keep the postings with the vector snapshot,
+    so a loaded index does not re-tokenize the knowledge base.
+    """
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # term -> (row positions, term frequencies)
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._lengths = array('I')
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def add(self, texts: Iterable[str]) -> None:
+        """Indexes rows appended to the vector index, in the same order."""
+        tokenized = [tokenize(text) for text in texts]
+        with self._lock:
+            for tokens in tokenized:
+                position = len(self._lengths)
+                counts: Dict[str, int] = {}
+                for token in tokens:
+                    counts[token] = counts.get(token, 0) + 1
+                for token, count in counts.items():
+                    postings = self._postings.get(token)
+                    if postings is None:
+                        postings = self._postings[token] = (array('I'), array('I'))
+                    postings[0].append(position)
+                    postings[1].append(count)
+                self._lengths.append(len(tokens))
+                self._total_length += len(tokens)
+
+    def search(self, query: str, limit: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the positions of the best `limit` rows sharing a term with the query, and their scores, best first."""
+        terms = set(tokenize(query))
+        postings = []
+        with self._lock:
+            count = len(self._lengths)
+            if count:
+                lengths = np.frombuffer(self._lengths, dtype=np.uintc)
+                for term in terms:
+                    if term in self._postings:
+                        positions = np.array(self._postings[term][0], dtype=np.int64)
+                        postings.append((positions, np.array(self._postings[term][1], dtype=np.float32),
+                                         lengths[positions].astype(np.float32)))
+                # The array cannot grow while a view of it exists.
+                del lengths
+            average_length = self._total_length / count if count else 1.0
+        if not postings:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        contributions = []
+        for positions, frequencies, lengths in postings:
+            idf = math.log(1 + (count - len(positions) + 0.5) / (len(positions) + 0.5))
+            norms = self.k1 * (1 - self.b + self.b * lengths / (average_length or 1.0))
+            contributions.append(idf * frequencies * (self.k1 + 1) / (frequencies + norms))
+        # Scores are summed per row over the matched postings only, never over the whole index.
+        matched, rows = np.unique(np.concatenate([positions for positions, _, _ in postings]), return_inverse=True)
+        scores = np.bincount(rows, weights=np.concatenate(contributions)).astype(np.float32)
+
+        if len(matched) > limit:
+            best = np.argpartition(-scores, limit - 1)[:limit]
+            matched, scores = matched[best], scores[best]
+        order = np.argsort(-scores, kind='stable')
+        return matched[order], scores[order]
+
+    def save(self, path: str, size: int | None = None) -> None:
+        """Writes the postings of the first `size` rows (all by default) to path as an .npz archive."""
+        terms, positions, frequencies = [], [], []
+        with self._lock:
+            size = len(self._lengths) if size is None else size
+            for term, (term_positions, term_frequencies) in self._postings.items():
+                term_positions = np.array(term_positions, dtype=np.uintc)
+                # Positions are appended in order, so the rows past size are at the end.
+                end = int(np.searchsorted(term_positions, size))
+                if end:
+                    terms.append(term)
+                    positions.append(term_positions[:end])
+                    frequencies.append(np.array(term_frequencies[:end], dtype=np.uintc))
+            lengths = np.array(self._lengths[:size], dtype=np.uintc)
+
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(term_positions) for term_positions in positions])
+        with open(path, 'wb') as f:
+            np.savez(f, terms=np.array(terms, dtype=str), offsets=offsets, lengths=lengths,
+                     positions=np.concatenate(positions) if positions else np.empty(0, dtype=np.uintc),
+                     frequencies=np.concatenate(frequencies) if frequencies else np.empty(0, dtype=np.uintc))
+
+    @classmethod
+    def load(cls, path: str, k1: float = 1.2, b: float = 0.75) -> "BM25Index":
+        """Loads an index written by save(). Raises ValueError if the archive is inconsistent."""
+        with np.load(path, allow_pickle=False) as data:
+            terms, offsets, lengths, positions, frequencies = (
+                data[name] for name in ('terms', 'offsets', 'lengths', 'positions', 'frequencies'))
+        if len(offsets) != len(terms) + 1 or offsets[-1] != len(positions) or len(frequencies) != len(positions) \
+                or (len(positions) and positions.max() >= len(lengths)):
+            raise ValueError(f"Inconsistent BM25 index in {path}")
+
+        index = cls(k1=k1, b=b)
+        positions = positions.astype(np.uintc)
+        frequencies = frequencies.astype(np.uintc)
+        for term, start, end in zip(terms.tolist(), offsets[:-1].tolist(), offsets[1:].tolist()):
+            index._postings[term] = (array('I', positions[start:end].tobytes()), array('I', frequencies[start:end].tobytes()))
+        index._lengths = array('I', lengths.astype(np.uintc).tobytes())
+        index._total_length = int(lengths.sum())
+        return index
+
+    @property
+    def nbytes(self) -> int:
+        return sum(positions.itemsize * len(positions) * 2 for positions, _ in self._postings.values()) + \
+            self._lengths.itemsize * len(self._lengths)
+
+    @property
+    def terms(self) -> int:
+        return len(self._postings)
@@ -0,0 +1,121 @@
+import asyncio
+import hashlib
+import re
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Tuple
+
+from app.core.config import settings
+
+TOKEN_POLICIES = ('once', 'split', 'each')
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+class CoalescedResponse(NamedTuple):
+    text: str
+    # Tokens the Gemini call used
+    tokens: int
+    # Tokens to bill this request for, under the token policy
+    billed_tokens: int
+    # True when the answer came from another request's call
+    shared: bool
+
+class _Flight:
+    __slots__ = ('future', 'followers')
+
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+        self.followers = 0
+
+class LLMCoalescer:
+    """
+    Single-flight LLM calls: while a call for a key is in flight, requests with
+    the same key wait for it and share its answer instead of calling Gemini
+    again. The key covers the company, the normalized question and everything
+    else that goes into the prompt, so only identical prompts are shared.
+
+    token_policy decides what each request is billed:
+      once  - the request that made the call is billed its tokens, the others nothing
+      split - the call's tokens are divided between all the requests that shared it
+      each  - every request is billed the full call, as if it had made its own
+    """
+    def __init__(self, token_policy: str):
+        if token_policy not in TOKEN_POLICIES:
+            raise ValueError(f"Unknown LLM coalescing token policy {token_policy!r}; expected one of {TOKEN_POLICIES}")
+        self.token_policy = token_policy
+        self._flights: Dict[Tuple[str, str], _Flight] = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.tokens_saved = 0
+
+    async def run(self, key: Tuple[str, str], call: Callable[[], Awaitable[Tuple[str, int]]]) -> CoalescedResponse:
+        """Returns call()'s answer, or that of an identical call already in flight."""
+        if not settings.LLM_COALESCING_ENABLED:
+            self.calls += 1
+            text, tokens = await call()
+            return CoalescedResponse(text, tokens, tokens, False)
+
+        flight = self._flights.get(key)
+        if flight is not None:
+            flight.followers += 1
+            position = flight.followers
+            # Shielded so a follower that is cancelled does not cancel the shared call.
+            result = await asyncio.shield(flight.future)
+            if result is None:
+                # The request making the call was cancelled: the first follower to get here makes it again.
+                return await self.run(key, call)
+            text, tokens, shares = result
+            self.coalesced += 1
+            self.tokens_saved += tokens
+            return CoalescedResponse(text, tokens, shares[position], True)
+
+        flight = self._flights[key] = _Flight(asyncio.get_running_loop().create_future())
+        self.calls += 1
+        try:
+            text, tokens = await call()
+        except BaseException as e:
+            del self._flights[key]
+            # A cancellation belongs to this request only; None sends the followers to retry.
+            # Other errors fail the followers the same way; with none, nobody would retrieve the exception.
+            if isinstance(e, asyncio.CancelledError):
+                flight.future.set_result(None)
+            elif flight.followers:
+                flight.future.set_exception(e)
+            raise
+        del self._flights[key]
+        shares = self._shares(tokens, 1 + flight.followers)
+        flight.future.set_result((text, tokens, shares))
+        return CoalescedResponse(text, tokens, shares[0], False)
+
+    def _shares(self, tokens: int, requests: int) -> List[int]:
+        if self.token_policy == 'each':
+            return [tokens] * requests
+        if self.token_policy == 'split':
+            share, remainder = divmod(tokens, requests)
+            return [share + (1 if i < remainder else 0) for i in range(requests)]
+        return [tokens] + [0] * (requests - 1)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'enabled': settings.LLM_COALESCING_ENABLED,
+            'token_policy': self.token_policy,
+            'in_flight': len(self._flights),
+            'calls': self.calls,
+            'coalesced': self.coalesced,
+            'tokens_saved': self.tokens_saved,
+        }
+
+def normalize_query(query: str) -> str:
+    """Case, punctuation and spacing removed: "What's the price?" and "whats the price" match."""
+    return " ".join(_NON_WORD.sub(" ", query.casefold().replace("'", "")).split())
+
+def coalescing_key(company_id: str, query: str, relevant_knowledge: List[Dict[str, Any]], history: List[Any] | None = None) -> Tuple[str, str]:
+    """(company, digest of the normalized question, the retrieved context and the conversation so far)."""
+    digest = hashlib.sha1(normalize_query(query).encode('utf-8'))
+    for entry in relevant_knowledge:
+        digest.update(b"\0")
+        digest.update(entry['content'].encode('utf-8'))
+    for turn in history or ():
+        digest.update(b"\1")
+        digest.update(f"{turn.question}\0{turn.answer}".encode('utf-8'))
+    return str(company_id), digest.hexdigest()
+
+llm_coalescer = LLMCoalescer(token_policy=settings.LLM_COALESCING_TOKEN_POLICY)
@@ -1,74 +1,137 @@
+import asyncio
 import logging
 import time
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Any, Tuple
-import numpy as np
-import json
+from functools import cached_property
+from typing import List, Dict, Any, Tuple, Callable, Awaitable
 import google.generativeai as genai
 from app.core.config import settings
+from app.core import metrics
+from app.core.concurrency import Overloaded, llm_limiter
+from app.services.embedding_backends import create_embedding_backend
+from app.services.conversation_store import Turn
+from app.services.context_builder import build_context, token_budget_for_plan
+from app.services.embedding_batcher import EmbeddingBatcher
+from app.services.supabase_service import supabase_service
+from app.services.vector_index import TenantVectorIndex
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+NO_KNOWLEDGE_RESPONSE = "I'm sorry, I couldn't find relevant information in the knowledge base for your query."
+LLM_ERROR_RESPONSE = "I'm sorry, but I encountered an error while trying to generate a response."
+
 class RAGService:
+    """
+    Embedding, retrieval and generation. The embedding model and the Gemini client
+    are created on first use, so importing this module (or constructing the
+    service in an admin script) is cheap; call warmup() to load them up front.
+    """
     def __init__(self):
+        self.embedding_batcher = EmbeddingBatcher(
+            self.generate_embeddings,
+            window_seconds=settings.EMBEDDING_BATCH_WINDOW_MS / 1000,
+            max_batch_size=settings.EMBEDDING_MAX_BATCH_SIZE,
+        )
+
+    @cached_property
+    def llm(self) -> genai.GenerativeModel:
         # Configure the generative AI model
         genai.configure(api_key=settings.GOOGLE_API_KEY)
-        self.llm = genai.GenerativeModel('gemini-1.5-flash')
+        return genai.GenerativeModel('gemini-1.5-flash')
 
-        # Load a pre-trained sentence-transformer model for embeddings
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+    @cached_property
+    def embedding_backend(self):
+        # Load the embedding model (sentence-transformers or ONNX, see EMBEDDING_BACKEND)
+        return create_embedding_backend()
+
+    def warmup(self) -> None:
+        """Loads the embedding model and LLM client and runs one encode so the first request is not slow."""
+        start_time = time.time()
+        _ = self.llm
+        self.embedding_backend.encode(["warmup"])
+        logger.info(f"RAG service warmup took: {time.time() - start_time:.4f} seconds")
 
     def generate_embedding(self, text: str) -> List[float]:
         """Generates a vector embedding for the given text."""
-        start_time = time.time()
-        logger.info("Generating embedding...")
-        embedding = self.embedding_model.encode(text)
-        end_time = time.time()
-        logger.info(f"Embedding generation took: {end_time - start_time:.4f} seconds")
-        return embedding.tolist()
+        return self.embedding_backend.encode([text])[0].tolist()
 
-    def semantic_search(self, query_embedding: List[float], knowledge_bases: List[Dict[str, Any]], top_k: int = 3) -> List[Dict[str, Any]]:
+    def semantic_search(self, query_embedding: List[float], knowledge_bases: List[Dict[str, Any]] | TenantVectorIndex, top_k: int = 3,
+                        query_text: str | None = None) -> List[Dict[str, Any]]:
         """ 
         Performs a semantic search to find the most relevant knowledge base entries.
+        Accepts a resident TenantVectorIndex, or raw knowledge base rows which are indexed on the fly.
+        With query_text the search is hybrid (lexical shortlist, dense re-scoring).
         """
-        start_time = time.time()
-        logger.info("Performing semantic search...")
         if not knowledge_bases:
             return []
 
-        query_embedding_np = np.array(query_embedding)
-        
-        # Extract embeddings from knowledge_bases and convert to numpy array
-        kb_embeddings = np.array([json.loads(kb['embedding']) for kb in knowledge_bases])
+        if not isinstance(knowledge_bases, TenantVectorIndex):
+            knowledge_bases = TenantVectorIndex.from_rows(knowledge_bases)
 
-        # Calculate cosine similarity
-        similarities = np.dot(query_embedding_np, kb_embeddings.T)
+        # Cosine similarity over the pre-normalised matrix
+        return knowledge_bases.search(query_embedding, top_k=top_k, query_text=query_text)
 
-        # Get indices of top_k most similar entries
-        top_k_indices = similarities.argsort()[-top_k:][::-1]
-
-        # Return the top_k relevant knowledge base entries
-        relevant_knowledge = [knowledge_bases[i] for i in top_k_indices]
-        end_time = time.time()
-        logger.info(f"Semantic search took: {end_time - start_time:.4f} seconds")
-        return relevant_knowledge
+    def search_knowledge_base(self, company_id: str, query_embedding: List[float], top_k: int = 3) -> List[Dict[str, Any]] | None:
+        """
+        Performs the semantic search in the database, so only the top_k rows are
+        transferred. Returns None if the database search is unavailable.
+        """
+        return supabase_service.match_knowledge_bases(
+            company_id, query_embedding, match_count=top_k, min_similarity=settings.VECTOR_SEARCH_MIN_SIMILARITY
+        )
 
-    def generate_response_with_llm(self, query: str, relevant_knowledge: List[Dict[str, Any]]) -> Tuple[str, int]:
+    def build_context(self, relevant_knowledge: List[Dict[str, Any]], plan: Dict[str, Any] | None = None) -> List[Dict[str, Any]]:
         """
-        Generates a response using the Gemini LLM and returns the response and token count.
+        Reduces retrieved knowledge to diverse, non-duplicate passages within the
+        plan's context token budget, and logs the prompt tokens saved.
         """
+        passages, report = build_context(
+            relevant_knowledge,
+            token_budget=token_budget_for_plan(plan),
+            max_passages=settings.CONTEXT_MAX_PASSAGES,
+            diversity=settings.CONTEXT_DIVERSITY,
+            duplicate_threshold=settings.CONTEXT_DUPLICATE_THRESHOLD,
+        )
+        logger.info(
+            f"Context: {report['passages']} passages, ~{report['tokens']} tokens "
+            f"(saved ~{report['saved_tokens']} of {report['naive_tokens']}; "
+            f"{report['duplicates_dropped']} duplicates dropped, {report['truncated']} truncated)"
+        )
+        return passages
+
+    def generate_embeddings(self, texts: List[str], batch_size: int = 32) -> List[List[float]]:
+        """Generates vector embeddings for several texts, encoding batch_size texts per model call."""
         start_time = time.time()
-        logger.info("Generating response with LLM...")
-        total_token_count = 0
+        embeddings = self.embedding_backend.encode(texts, batch_size=batch_size)
+        end_time = time.time()
+        logger.info(f"Embedding generation for {len(texts)} texts took: {end_time - start_time:.4f} seconds")
+        return embeddings.tolist()
 
-        if not relevant_knowledge:
-            return "I'm sorry, I couldn't find relevant information in the knowledge base for your query.", total_token_count
+    async def generate_embedding_async(self, text: str) -> List[float]:
+        """
+        Generates a vector embedding without blocking the event loop. Concurrent
+        callers are micro-batched into a single model call on the embedding executor.
+        """
+        if not settings.ASYNC_PIPELINE:
+            return self.generate_embedding(text)
+        return await self.embedding_batcher.embed(text)
 
+    def _build_prompt(self, query: str, relevant_knowledge: List[Dict[str, Any]], history: List[Turn] | None = None) -> str:
         context = "\n".join([kb['content'] for kb in relevant_knowledge])
+        conversation = ""
+        if history:
+            # Earlier turns let the model resolve follow-ups; long answers are cut to keep the prompt small.
+            limit = settings.CONVERSATION_PROMPT_ANSWER_CHARS
+            conversation = "\n".join(f"User: {turn.question}\nAssistant: {turn.answer[:limit]}" for turn in history)
+            conversation = f"""
+        CONVERSATION SO FAR:
+        ---
+        {conversation}
+        ---
+"""
 
         # Construct a prompt for the LLM
-        prompt = f"""
+        return f"""
         You are a helpful customer support assistant for a company.
         Based on the following context from the company's knowledge base, please answer the user's question.
         Provide a clear, concise, and direct answer. Do not make up information.
@@ -78,7 +141,7 @@ class RAGService:
         ---
         {context}
         ---
-
+{conversation}
         USER'S QUESTION:
         ---
         {query}
@@ -87,16 +150,119 @@ class RAGService:
         ANSWER:
         """
 
+    def generate_response_with_llm(self, query: str, relevant_knowledge: List[Dict[str, Any]], on_text: Callable[[str], None] | None = None,
+                                   history: List[Turn] | None = None) -> Tuple[str, int]:
+        """
+        Generates a response using the Gemini LLM and returns the response and token count.
+        When on_text is given the response is streamed, and on_text receives the text so far after each chunk.
+        history holds the chat's earlier turns, if any.
+        """
+        logger.info("Generating response with LLM...")
+        total_token_count = 0
+
+        if not relevant_knowledge:
+            return NO_KNOWLEDGE_RESPONSE, total_token_count
+
+        prompt = self._build_prompt(query, relevant_knowledge, history)
+
+        try:
+            if on_text is None:
+                response = self.llm.generate_content(prompt)
+                return self._handle_llm_response(response.text, response.usage_metadata)
+
+            text, usage_metadata = "", None
+            for chunk in self.llm.generate_content(prompt, stream=True):
+                text += _chunk_text(chunk)
+                usage_metadata = chunk.usage_metadata or usage_metadata
+                if on_text is not None:
+                    try:
+                        on_text(text)
+                    except Exception as e:
+                        # The answer is still delivered in full by the caller; only the partial updates stop.
+                        logger.warning(f"Progressive reply update failed, no further updates: {e}")
+                        on_text = None
+            return self._handle_streamed_response(text, usage_metadata)
+        except Exception as e:
+            logger.error(f"An error occurred during LLM generation: {e}", exc_info=True)
+            return LLM_ERROR_RESPONSE, 0
+
+    async def generate_response_with_llm_async(self, query: str, relevant_knowledge: List[Dict[str, Any]], on_text: Callable[[str], Awaitable[None]] | None = None,
+                                               priority: int = 0, company_id: str = '', history: List[Turn] | None = None) -> Tuple[str, int]:
+        """
+        Async variant of generate_response_with_llm. Uses generate_content_async so the
+        event loop keeps serving other tenants while Gemini responds, and waits (by
+        priority) for a slot under LLM_MAX_CONCURRENCY; raises Overloaded if none frees
+        up in time. When on_text is given the response is streamed and on_text is
+        awaited with the text so far after each chunk.
+        """
+        if not settings.ASYNC_PIPELINE:
+            return self.generate_response_with_llm(query, relevant_knowledge, history=history)
+
+        logger.info("Generating response with LLM...")
+
+        if not relevant_knowledge:
+            return NO_KNOWLEDGE_RESPONSE, 0
+
+        prompt = self._build_prompt(query, relevant_knowledge, history)
+
+        # Partial replies are sent from a background task, so Telegram round trips (and flood
+        # waits) neither hold the LLM slot nor fail the generation. One update is in flight at a time.
+        progress: asyncio.Task | None = None
         try:
-            response = self.llm.generate_content(prompt)
-            total_token_count = response.usage_metadata.total_token_count
-            logger.info(f"Gemini API Response: {response.text}")
-            logger.info(f"Tokens used: {total_token_count}")
-            end_time = time.time()
-            logger.info(f"LLM generation took: {end_time - start_time:.4f} seconds")
-            return response.text, total_token_count
+            async with llm_limiter.slot(priority) as waited:
+                metrics.stage_seconds.observe(waited, 'llm_queue', company_id)
+                if on_text is None:
+                    response = await self.llm.generate_content_async(prompt)
+                    return self._handle_llm_response(response.text, response.usage_metadata)
+
+                text, usage_metadata = "", None
+                async for chunk in await self.llm.generate_content_async(prompt, stream=True):
+                    text += _chunk_text(chunk)
+                    # Token counts are only complete on the final chunk.
+                    usage_metadata = chunk.usage_metadata or usage_metadata
+                    if on_text is not None and (progress is None or progress.done()):
+                        if progress is not None and not progress.result():
+                            on_text = None
+                        else:
+                            progress = asyncio.create_task(_show_progress(on_text, text))
+            return self._handle_streamed_response(text, usage_metadata)
+        except Overloaded:
+            raise
         except Exception as e:
             logger.error(f"An error occurred during LLM generation: {e}", exc_info=True)
-            return "I'm sorry, but I encountered an error while trying to generate a response.", 0
+            return LLM_ERROR_RESPONSE, 0
+        finally:
+            # The caller's final reply must not race a partial update still being sent.
+            if progress is not None and not progress.done():
+                await asyncio.wait([progress])
+
+    def _handle_streamed_response(self, text: str, usage_metadata: Any) -> Tuple[str, int]:
+        # A fully blocked stream yields chunks without text; treated like response.text raising when not streaming.
+        if not text.strip():
+            raise ValueError("Gemini returned no text (the response was probably blocked)")
+        return self._handle_llm_response(text, usage_metadata)
+
+    def _handle_llm_response(self, text: str, usage_metadata: Any) -> Tuple[str, int]:
+        total_token_count = usage_metadata.total_token_count if usage_metadata else 0
+        logger.info(f"Gemini response: {len(text)} chars, {total_token_count} tokens")
+        logger.debug(f"Gemini response text: {text}")
+        return text, total_token_count
+
+async def _show_progress(on_text: Callable[[str], Awaitable[None]], text: str) -> bool:
+    """Sends a partial reply. Returns False if it failed, which ends progressive updates for the answer."""
+    try:
+        await on_text(text)
+        return True
+    except Exception as e:
+        # The caller still delivers the whole answer once generation is done.
+        logger.warning(f"Progressive reply update failed, no further updates: {e}")
+        return False
+
+def _chunk_text(chunk: Any) -> str:
+    """Text of a streamed chunk; chunks that only carry metadata have none."""
+    try:
+        return chunk.text
+    except ValueError:
+        return ""
 
 rag_service = RAGService()
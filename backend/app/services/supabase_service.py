@@ -1,13 +1,37 @@
-from supabase import create_client, Client
+import httpx
+from supabase import create_client, Client, ClientOptions
 from app.core.config import settings
-from typing import List, Dict, Any
+from app.services.embedding_codec import encode_embedding
+from typing import List, Dict, Any, Callable
 from postgrest.exceptions import APIError # Import APIError
 
 class SupabaseService:
     def __init__(self):
         self.supabase_url: str = settings.SUPABASE_URL
         self.supabase_key: str = settings.SUPABASE_KEY
-        self.client: Client = create_client(self.supabase_url, self.supabase_key)
+        self.client: Client = self._create_client()
+        self._knowledge_base_listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+
+    def _create_client(self) -> Client:
+        return create_client(self.supabase_url, self.supabase_key, options=ClientOptions(httpx_client=self._build_http_client()))
+
+    def reset_client(self) -> None:
+        """Replaces the client, e.g. in a forked worker that must not share the parent's connections."""
+        self.client = self._create_client()
+
+    @staticmethod
+    def _build_http_client() -> httpx.Client:
+        """One keep-alive pool for all PostgREST calls, sized for the database thread pool."""
+        return httpx.Client(
+            limits=httpx.Limits(
+                max_connections=settings.SUPABASE_POOL_SIZE,
+                max_keepalive_connections=settings.SUPABASE_POOL_SIZE,
+                keepalive_expiry=settings.HTTP_KEEPALIVE_SECONDS,
+            ),
+            http2=settings.SUPABASE_HTTP2,
+            timeout=settings.SUPABASE_TIMEOUT_SECONDS,
+            follow_redirects=True,
+        )
 
     # --- Company Functions ---
     def get_company_by_telegram_bot_token(self, telegram_bot_token: str) -> Dict[str, Any] | None:
@@ -54,13 +78,107 @@ class SupabaseService:
             return response.data
         return []
 
+    def get_knowledge_base_rows(self, company_id: str, ids: List[Any] | None = None) -> List[Dict[str, Any]]:
+        """
+        Fetches only the columns needed to build a search index for a company,
+        optionally restricted to the given row ids. With COMPACT_EMBEDDINGS the
+        compact encoding is fetched, falling back to pgvector's text for rows
+        that have not been migrated yet. With DIRECT_ANSWERS_ENABLED each row
+        also carries its entry_type and stored answer.
+        """
+        columns = 'id, content, entry_type, answer' if settings.DIRECT_ANSWERS_ENABLED else 'id, content'
+        if not settings.COMPACT_EMBEDDINGS:
+            return self._select_knowledge_base_rows(company_id, f'{columns}, embedding', ids)
+
+        rows = self._select_knowledge_base_rows(company_id, f'{columns}, embedding_compact', ids)
+        missing = [row['id'] for row in rows if not row.get('embedding_compact')]
+        legacy = {row['id']: row['embedding'] for row in self._select_knowledge_base_rows(company_id, 'id, embedding', missing)} if missing else {}
+        for row in rows:
+            row['embedding'] = row.pop('embedding_compact') or legacy.get(row['id'])
+        return [row for row in rows if row['embedding'] is not None]
+
+    def match_knowledge_bases(self, company_id: str, query_embedding: List[float], match_count: int = 3,
+                              min_similarity: float = 0.0) -> List[Dict[str, Any]] | None:
+        """
+        Searches a company's knowledge base in the database via the match_knowledge_bases
+        function. Returns the top rows as {'id', 'content', 'similarity', 'direct_answer'},
+        best first, or None if the call failed.
+        """
+        try:
+            response = self.client.rpc('match_knowledge_bases', {
+                'p_company_id': company_id,
+                'p_query_embedding': query_embedding,
+                'p_match_count': match_count,
+                'p_min_similarity': min_similarity
+            }).execute()
+            return response.data or []
+        except Exception as e:
+            print(f"Error matching knowledge bases: {e}")
+            return None
+
+    def get_knowledge_base_ids(self, company_id: str) -> List[Any]:
+        """Fetches the ids of a company's knowledge base rows, to check a local snapshot against."""
+        return [row['id'] for row in self._select_knowledge_base_rows(company_id, 'id')]
+
+    def _select_knowledge_base_rows(self, company_id: str, columns: str, ids: List[Any] | None = None) -> List[Dict[str, Any]]:
+        if ids is None:
+            response = self.client.from_('knowledge_bases').select(columns).eq('company_id', company_id).execute()
+            return response.data or []
+        # Ids go in the query string, so long lists are fetched in slices.
+        rows = []
+        for i in range(0, len(ids), 200):
+            response = self.client.from_('knowledge_bases').select(columns).eq('company_id', company_id).in_('id', ids[i:i + 200]).execute()
+            rows.extend(response.data or [])
+        return rows
+
     def add_knowledge_base_entry(self, company_id: str, content: str, embedding: List[float]) -> Dict[str, Any] | None:
         """Adds a new knowledge base entry for a company."""
-        response = self.client.from_('knowledge_bases').insert({'company_id': company_id, 'content': content, 'embedding': embedding}).execute()
+        response = self.client.from_('knowledge_bases').insert(self._knowledge_base_row(company_id, content, embedding)).execute()
         if response.data:
+            self._notify_knowledge_base_listeners(company_id, response.data[0])
             return response.data[0]
         return None
 
+    def add_knowledge_base_entries(self, company_id: str, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Adds several knowledge base entries ({'content', 'embedding'}, optionally
+        'entry_type' and 'answer') for a company in a single insert.
+        """
+        if not entries:
+            return []
+        rows = [self._knowledge_base_row(company_id, entry['content'], entry['embedding'], entry.get('entry_type'), entry.get('answer'))
+                for entry in entries]
+        response = self.client.from_('knowledge_bases').insert(rows).execute()
+        for row in response.data or []:
+            self._notify_knowledge_base_listeners(company_id, row)
+        return response.data or []
+
+    def update_knowledge_base_embedding_compact(self, row_id: Any, embedding_compact: str) -> None:
+        """Stores the compact encoding of an existing row's embedding."""
+        self.client.from_('knowledge_bases').update({'embedding_compact': embedding_compact}).eq('id', row_id).execute()
+
+    def _knowledge_base_row(self, company_id: str, content: str, embedding: List[float],
+                            entry_type: str | None = None, answer: str | None = None) -> Dict[str, Any]:
+        row = {'company_id': company_id, 'content': content, 'embedding': embedding}
+        # Only set when given, so plain passages can still be inserted before the columns exist.
+        if entry_type is not None:
+            row['entry_type'] = entry_type
+            row['answer'] = answer
+        if settings.COMPACT_EMBEDDINGS:
+            row['embedding_compact'] = encode_embedding(embedding, settings.COMPACT_EMBEDDING_DTYPE)
+        return row
+
+    def add_knowledge_base_listener(self, listener: Callable[[str, Dict[str, Any]], None]) -> None:
+        """Registers a callback invoked with (company_id, row) after each knowledge base insert."""
+        self._knowledge_base_listeners.append(listener)
+
+    def _notify_knowledge_base_listeners(self, company_id: str, row: Dict[str, Any]) -> None:
+        for listener in self._knowledge_base_listeners:
+            try:
+                listener(company_id, row)
+            except Exception as e:
+                print(f"Error notifying knowledge base listener: {e}")
+
     # --- Plan & Subscription Functions ---
     def get_plan_by_id(self, plan_id: str) -> Dict[str, Any] | None:
         """Fetches plan details by plan ID."""
@@ -120,8 +238,8 @@ class SupabaseService:
         return None
 
     # --- Usage Functions ---
-    def get_usage_for_subscription(self, subscription_id: str, start_date: str, end_date: str) -> int:
-        """Calculates the total token usage for a subscription within a date range."""
+    def get_usage_for_subscription(self, subscription_id: str, start_date: str, end_date: str) -> int | None:
+        """Calculates the total token usage for a subscription within a date range. Returns None if the read failed."""
         try:
             response = self.client.rpc('get_total_usage', {
                 'p_subscription_id': subscription_id,
@@ -134,7 +252,7 @@ class SupabaseService:
             return 0
         except Exception as e:
             print(f"Error getting usage: {e}")
-            return 0
+            return None
 
     def add_usage_log(self, subscription_id: str, total_tokens: int) -> None:
         """Adds a new usage log entry."""
@@ -146,4 +264,38 @@ class SupabaseService:
         except Exception as e:
             print(f"Error logging usage: {e}")
 
+    def add_usage_logs(self, entries: List[Dict[str, Any]]) -> bool:
+        """Adds several usage log entries in a single insert. Returns False if the insert failed."""
+        if not entries:
+            return True
+        try:
+            self.client.from_('usage_logs').insert(entries).execute()
+            return True
+        except Exception as e:
+            print(f"Error logging usage batch: {e}")
+            return False
+
+    # --- Conversation Functions ---
+    def add_conversations(self, conversations: List[Dict[str, Any]]) -> bool:
+        """Adds several conversations in a single insert. Returns False if the insert failed."""
+        if not conversations:
+            return True
+        try:
+            self.client.from_('conversations').insert(conversations).execute()
+            return True
+        except Exception as e:
+            print(f"Error adding conversations: {e}")
+            return False
+
+    def add_messages(self, messages: List[Dict[str, Any]]) -> bool:
+        """Adds several conversation messages in a single insert. Returns False if the insert failed."""
+        if not messages:
+            return True
+        try:
+            self.client.from_('messages').insert(messages).execute()
+            return True
+        except Exception as e:
+            print(f"Error adding messages: {e}")
+            return False
+
 supabase_service = SupabaseService()
\ No newline at end of file
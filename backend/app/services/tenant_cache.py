@@ -0,0 +1,135 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, Tuple
+
+import httpx
+
+from app.core.config import settings
+from app.services.supabase_service import supabase_service
+
+logger = logging.getLogger(__name__)
+
+class TenantContextCache:
+    """
+    In-process cache of the company, active subscription and plan for each bot token.
+    A warm tenant is served without touching the database until its entry expires
+    or is invalidated. Tokens that are not registered are remembered for
+    unknown_ttl_seconds, so repeated requests for them skip the database too.
+    """
+    def __init__(self, ttl_seconds: float, unknown_ttl_seconds: float = 0.0, max_unknown: int = 0):
+        self.ttl_seconds = ttl_seconds
+        self.unknown_ttl_seconds = unknown_ttl_seconds
+        self.max_unknown = max_unknown
+        self._entries: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        # bot token -> expiry, oldest first
+        self._unknown: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.unknown_hits = 0
+
+    def get(self, bot_token: str) -> Dict[str, Any] | None:
+        """
+        Returns {'company', 'subscription', 'plan'} for the bot token, or None if the
+        token is not registered. 'subscription' and 'plan' may be None.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(bot_token)
+            if entry and entry[0] > now:
+                self.hits += 1
+                return entry[1]
+            unknown_until = self._unknown.get(bot_token)
+            if unknown_until is not None:
+                if unknown_until > now:
+                    self.unknown_hits += 1
+                    return None
+                del self._unknown[bot_token]
+            self.misses += 1
+
+        context = self._load(bot_token)
+        with self._lock:
+            if context is not None:
+                self._entries[bot_token] = (now + self.ttl_seconds, context)
+            elif self.unknown_ttl_seconds > 0 and self.max_unknown > 0:
+                self._unknown[bot_token] = now + self.unknown_ttl_seconds
+                while len(self._unknown) > self.max_unknown:
+                    del self._unknown[next(iter(self._unknown))]
+        return context
+
+    def peek(self, bot_token: str) -> Dict[str, Any] | None:
+        """Returns the cached context if it is fresh, without loading it or counting a lookup."""
+        with self._lock:
+            entry = self._entries.get(bot_token)
+        return entry[1] if entry and entry[0] > time.monotonic() else None
+
+    def _load(self, bot_token: str) -> Dict[str, Any] | None:
+        company = supabase_service.get_company_by_telegram_bot_token(bot_token)
+        if not company:
+            return None
+
+        subscription = supabase_service.get_active_subscription_by_company_id(company['id'])
+        plan = supabase_service.get_plan_by_id(subscription['plan_id']) if subscription else None
+        return {'company': company, 'subscription': subscription, 'plan': plan}
+
+    def invalidate(self, bot_token: str) -> None:
+        """Drops the cached context for a single bot token, or forgets that it was unknown."""
+        with self._lock:
+            self._entries.pop(bot_token, None)
+            self._unknown.pop(bot_token, None)
+
+    def invalidate_company(self, company_id: str) -> None:
+        """Drops every cached context that belongs to the given company."""
+        with self._lock:
+            for bot_token, (_, context) in list(self._entries.items()):
+                if str(context['company']['id']) == str(company_id):
+                    del self._entries[bot_token]
+
+    def clear(self) -> None:
+        """Drops all cached contexts and remembered unknown tokens."""
+        with self._lock:
+            self._entries.clear()
+            self._unknown.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns hit/miss counters and the current number of cached tenants."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'unknown_tokens': len(self._unknown),
+                'unknown_hits': self.unknown_hits,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+def request_invalidation(*, company_id: str | None = None, bot_token: str | None = None) -> bool:
+    """
+    Asks the running backend to drop its cached state for a tenant.
+    Admin scripts run in their own process, so they reach the server's cache
+    through the admin endpoint rather than the local singleton.
+    """
+    if not settings.ADMIN_API_KEY:
+        logger.warning("ADMIN_API_KEY is not set; the backend will pick up changes when its cache expires.")
+        return False
+
+    try:
+        response = httpx.post(
+            f"{settings.WEBHOOK_DOMAIN}/admin/tenants/invalidate",
+            json={'company_id': company_id, 'bot_token': bot_token},
+            headers={'X-Admin-Key': settings.ADMIN_API_KEY},
+            timeout=10.0,
+        )
+        response.raise_for_status()
+        return True
+    except httpx.HTTPError as e:
+        logger.warning(f"Could not invalidate backend cache: {e}")
+        return False
+
+tenant_cache = TenantContextCache(
+    ttl_seconds=settings.TENANT_CACHE_TTL_SECONDS,
+    unknown_ttl_seconds=settings.TENANT_CACHE_UNKNOWN_TTL_SECONDS,
+    max_unknown=settings.TENANT_CACHE_MAX_UNKNOWN,
+)
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Dict
+
+from app.core.config import settings
+from app.services.supabase_service import supabase_service
+
+logger = logging.getLogger(__name__)
+
+class UsageLedger:
+    """
+    Write-behind token accounting. Keeps a running usage total per subscription in
+    memory, seeded once from get_total_usage, and writes recorded usage to
+    usage_logs in batches. At most flush_interval seconds of usage is held only
+    in memory, which bounds what a crash can lose.
+    """
+    def __init__(self, flush_interval: float, max_pending: int, reseed_interval: float):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.reseed_interval = reseed_interval
+
+        self._totals: Dict[str, int] = {}
+        self._seeded_at: Dict[str, float] = {}
+        self._pending: Dict[str, int] = {}
+        self._pending_records = 0
+        self._inflight: Dict[str, int] = {}
+        self._flush_generation = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wake: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+        self.flushes = 0
+        self.rows_written = 0
+        self.flush_failures = 0
+
+    # --- Accounting ---
+    def current_usage(self, subscription: Dict[str, Any]) -> int:
+        """
+        Returns the subscription's usage for its billing period. The database is
+        only read the first time a subscription is seen and every reseed_interval
+        seconds after that, to pick up usage written by other workers.
+
+        A read that fails, or that overlaps a flush (which it may or may not
+        include), is not cached: the previous total is kept, or the unflushed
+        usage counted, and the database is read again on the next call.
+        """
+        subscription_id = str(subscription['id'])
+        with self._lock:
+            seeded_at = self._seeded_at.get(subscription_id)
+            if seeded_at is not None and time.monotonic() - seeded_at < self.reseed_interval:
+                return self._totals[subscription_id]
+            flush_generation = None if self._inflight else self._flush_generation
+
+        stored_usage = supabase_service.get_usage_for_subscription(
+            subscription_id=subscription_id,
+            start_date=subscription['start_date'],
+            end_date=subscription['end_date']
+        )
+        with self._lock:
+            unflushed = self._pending.get(subscription_id, 0) + self._inflight.get(subscription_id, 0)
+            if stored_usage is None:
+                logger.warning(f"Could not read usage for subscription {subscription_id}; will retry.")
+                return self._totals.get(subscription_id, unflushed)
+            if flush_generation != self._flush_generation:
+                # Counting the in-flight batch too errs towards the limit rather than past it.
+                return self._totals.get(subscription_id, stored_usage + unflushed)
+            self._totals[subscription_id] = stored_usage + unflushed
+            self._seeded_at[subscription_id] = time.monotonic()
+            return self._totals[subscription_id]
+
+    def record(self, subscription_id: str, total_tokens: int) -> None:
+        """Adds usage to the running total and queues it for the next batched write."""
+        subscription_id = str(subscription_id)
+        with self._lock:
+            if subscription_id in self._totals:
+                self._totals[subscription_id] += total_tokens
+            self._pending[subscription_id] = self._pending.get(subscription_id, 0) + total_tokens
+            self._pending_records += 1
+            should_flush = self._pending_records >= self.max_pending
+
+        if should_flush and self._loop is not None and self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    # --- Persistence ---
+    def flush(self) -> int:
+        """
+        Writes all pending usage to usage_logs as one batched insert, one row per
+        subscription. On failure the usage is put back and retried on the next flush.
+        Returns the number of rows written.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                self._inflight, self._pending = self._pending, {}
+                self._pending_records = 0
+                self._flush_generation += 1
+
+            entries = [
+                {'subscription_id': subscription_id, 'total_tokens': total_tokens}
+                for subscription_id, total_tokens in self._inflight.items()
+            ]
+            written = supabase_service.add_usage_logs(entries)
+
+            with self._lock:
+                if not written:
+                    for subscription_id, total_tokens in self._inflight.items():
+                        self._pending[subscription_id] = self._pending.get(subscription_id, 0) + total_tokens
+                    self._pending_records += len(self._inflight)
+                    self.flush_failures += 1
+                self._inflight = {}
+
+            if not written:
+                logger.error(f"Failed to flush {len(entries)} usage rows; will retry.")
+                return 0
+
+            self.flushes += 1
+            self.rows_written += len(entries)
+            logger.info(f"Flushed usage for {len(entries)} subscriptions.")
+            return len(entries)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.error(f"Usage flush failed: {e}", exc_info=True)
+
+    def start(self) -> None:
+        """Starts the background flush loop on the running event loop."""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stops the flush loop and writes out everything still pending."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'subscriptions': len(self._totals),
+                'pending_records': self._pending_records,
+                'pending_tokens': sum(self._pending.values()),
+                'flushes': self.flushes,
+                'rows_written': self.rows_written,
+                'flush_failures': self.flush_failures,
+            }
+
+usage_ledger = UsageLedger(
+    flush_interval=settings.USAGE_FLUSH_INTERVAL_SECONDS,
+    max_pending=settings.USAGE_FLUSH_MAX_PENDING,
+    reseed_interval=settings.USAGE_RESEED_INTERVAL_SECONDS,
+)
@@ -1,6 +1,7 @@
 import logging
 from uuid import UUID
 from app.services.supabase_service import supabase_service
+from app.services.usage_ledger import usage_ledger
 
 logger = logging.getLogger(__name__)
 
@@ -8,31 +9,29 @@ class UsageService:
     def record_usage(self, *, subscription_id: UUID, total_tokens: int):
         """
         Records the token usage for a given subscription.
+        The usage is counted immediately and written to usage_logs by the ledger's next flush.
         """
         if not subscription_id or total_tokens <= 0:
             return
 
         try:
-            supabase_service.add_usage_log(
-                subscription_id=str(subscription_id),
-                total_tokens=total_tokens
-            )
-            logger.info(f"Successfully logged {total_tokens} tokens for subscription {subscription_id}")
+            usage_ledger.record(str(subscription_id), total_tokens)
+            logger.info(f"Recorded {total_tokens} tokens for subscription {subscription_id}")
         except Exception as e:
             logger.error(f"An error occurred while recording usage for subscription {subscription_id}: {e}", exc_info=True)
 
-    def has_exceeded_limit(self, subscription: dict) -> bool:
+    def has_exceeded_limit(self, subscription: dict, plan: dict | None = None) -> bool:
         """
         Checks if a subscription has exceeded its token limit for the current billing period.
+        Pass the subscription's plan when it is already known to skip the plan lookup.
         """
         try:
             subscription_id = subscription['id']
             plan_id = subscription['plan_id']
-            start_date = subscription['start_date']
-            end_date = subscription['end_date']
 
             # Get the plan details to find the token limit
-            plan = supabase_service.get_plan_by_id(plan_id)
+            if plan is None:
+                plan = supabase_service.get_plan_by_id(plan_id)
             if not plan:
                 logger.error(f"Could not find plan with ID {plan_id} for subscription {subscription_id}")
                 # Fail open or closed? For now, let's fail open (allow usage).
@@ -41,11 +40,7 @@ class UsageService:
             token_limit = plan['token_limit']
 
             # Get the current usage for the billing period
-            current_usage = supabase_service.get_usage_for_subscription(
-                subscription_id=subscription_id,
-                start_date=start_date,
-                end_date=end_date
-            )
+            current_usage = usage_ledger.current_usage(subscription)
 
             logger.info(f"Subscription {subscription_id}: Usage={current_usage}, Limit={token_limit}")
 
@@ -0,0 +1,431 @@
+import hashlib
+import itertools
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import zipfile
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services import versioned_dir
+from app.services.ann_index import IVFIndex
+from app.services.answer_router import DIRECT_ANSWER
+from app.services.embedding_codec import decode_embedding
+from app.services.lexical_index import BM25Index
+from app.services.supabase_service import supabase_service
+
+logger = logging.getLogger(__name__)
+
+# Global so that a rebuilt index never reuses a version an older one handed out.
+_versions = itertools.count(1)
+
+# Snapshot files inside the current version of a tenant's snapshot directory
+_MATRIX_FILE = 'matrix.npy'
+_ROWS_FILE = 'rows.json'
+_LEXICAL_FILE = 'lexical.npz'
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def _checksum(matrix: np.ndarray) -> str:
+    """Digest of the matrix bytes, stored with the rows so a snapshot's two files are known to belong together."""
+    return hashlib.blake2b(np.ascontiguousarray(matrix).data, digest_size=16).hexdigest()
+
+class TenantVectorIndex:
+    """
+    Resident knowledge base for one tenant: a contiguous, L2-normalised float32
+    matrix (one row per entry) plus the row ids, their content and, for entries
+    tagged as direct answers, the stored answer. Rows are appended in place, so new entries never require a rebuild.
+    `version` changes whenever the content changes.
+
+    Once the index holds ANN_MIN_ENTRIES rows, searches go through an IVF
+    index that narrows the exact scoring to a few clusters. The IVF index is
+    saved to and memory-mapped from ann_dir when one is given. A BM25 index
+    over the content is kept alongside for hybrid search and saved with the
+    snapshot.
+    """
+    def __init__(self, ann_dir: str | None = None):
+        self.version = next(_versions)
+        self.ids: List[Any] = []
+        self.contents: Dict[Any, str] = {}
+        self.direct_answers: Dict[Any, str] = {}
+        self.ann_dir = ann_dir
+        self._ann: IVFIndex | None = None
+        self._lexical: BM25Index | None = None
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._matrix[:self._size]
+
+    def add(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """Appends knowledge base rows ({'id', 'content', 'embedding'}, optionally 'entry_type' and 'answer') to the index."""
+        rows = [row for row in rows if row.get('id') is None or row['id'] not in self.contents]
+        if not rows:
+            return
+
+        vectors = _normalize(np.stack([decode_embedding(row['embedding']) for row in rows]))
+        with self._lock:
+            if self._size == 0:
+                self._matrix = np.empty((max(len(rows), 16), vectors.shape[1]), dtype=np.float32)
+            elif self._size + len(rows) > self._matrix.shape[0]:
+                capacity = max(self._size + len(rows), 2 * self._matrix.shape[0])
+                grown = np.empty((capacity, self._matrix.shape[1]), dtype=np.float32)
+                grown[:self._size] = self._matrix[:self._size]
+                self._matrix = grown
+
+            self._matrix[self._size:self._size + len(rows)] = vectors
+            for offset, row in enumerate(rows):
+                # Rows without an id (e.g. ad-hoc lists) are keyed by their position.
+                row_id = row['id'] if row.get('id') is not None else self._size + offset
+                self.ids.append(row_id)
+                self.contents[row_id] = row['content']
+                if row.get('entry_type') == DIRECT_ANSWER:
+                    self.direct_answers[row_id] = row.get('answer') or row['content']
+            self._size += len(rows)
+            self.version = next(_versions)
+
+            # The lexical index is kept in step with the rows, so it is ready for hybrid search.
+            if self._lexical is not None:
+                self._lexical.add(row['content'] for row in rows)
+            elif settings.HYBRID_SEARCH_ENABLED:
+                self._lexical = self._build_lexical()
+
+            if self._ann is not None and self._size <= settings.ANN_RETRAIN_GROWTH * self._ann.trained_size:
+                self._ann.add(self._size - len(rows), vectors)
+            elif self._size >= settings.ANN_MIN_ENTRIES:
+                self._build_ann()
+
+    @property
+    def uses_ann(self) -> bool:
+        return self._ann is not None
+
+    def _build_ann(self) -> None:
+        """Loads the saved IVF index for these rows, or trains (and saves) a new one."""
+        ann = IVFIndex.load(self.ann_dir, self.ids) if self.ann_dir and self._ann is None else None
+        if ann is None or self._size > settings.ANN_RETRAIN_GROWTH * ann.trained_size:
+            ann = IVFIndex.train(self.matrix)
+            if self.ann_dir:
+                try:
+                    ann.save(self.ann_dir, self.ids)
+                except OSError as e:
+                    logger.warning(f"Could not save IVF index to {self.ann_dir}: {e}")
+        elif ann.trained_size < self._size:
+            ann.add(ann.trained_size, self._matrix[ann.trained_size:self._size])
+        self._ann = ann
+
+    def search(self, query_embedding: List[float], top_k: int = 3, exact: bool = False,
+               query_text: str | None = None) -> List[Dict[str, Any]]:
+        """
+        Returns the top_k entries by cosine similarity, best first, as
+        {'id', 'content', 'similarity', 'embedding', 'direct_answer'} dicts (the
+        embedding is the normalised row; direct_answer is None unless the entry
+        is tagged as one). exact=True bypasses the IVF index.
+
+        With query_text (and HYBRID_SEARCH_ENABLED) the search is hybrid: the
+        BM25 index shortlists HYBRID_LEXICAL_CANDIDATES rows, only those are
+        scored densely, and the two rankings are fused by reciprocal rank. Each
+        result then also carries 'relevance', its fused score relative to the best.
+        """
+        size = self._size
+        if size == 0:
+            return []
+
+        query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+        if query_text and settings.HYBRID_SEARCH_ENABLED:
+            return self._hybrid_search(query, query_text, top_k, size, exact)
+
+        positions, similarities = self._dense_search(query, top_k, size, exact)
+        return [self._result(position, similarity) for position, similarity in zip(positions, similarities)]
+
+    def _dense_search(self, query: np.ndarray, top_k: int, size: int, exact: bool) -> Tuple[np.ndarray, np.ndarray]:
+        """Positions and similarities of the top_k rows by cosine similarity, best first."""
+        ann = None if exact else self._ann
+        if ann is not None:
+            positions = ann.candidates(query, settings.ANN_NPROBE)
+            positions = positions[positions < size]
+            similarities = self._matrix[positions] @ query
+        else:
+            positions = np.arange(size)
+            similarities = self._matrix[:size] @ query
+
+        count = len(similarities)
+        top_k = min(top_k, count)
+        if top_k == 0:
+            return positions[:0], similarities[:0]
+        if top_k < count:
+            top_k_indices = np.argpartition(-similarities, top_k - 1)[:top_k]
+        else:
+            top_k_indices = np.arange(count)
+        top_k_indices = top_k_indices[np.argsort(-similarities[top_k_indices])]
+        return positions[top_k_indices], similarities[top_k_indices]
+
+    def _hybrid_search(self, query: np.ndarray, query_text: str, top_k: int, size: int, exact: bool) -> List[Dict[str, Any]]:
+        positions, scores = self.lexical.search(query_text, settings.HYBRID_LEXICAL_CANDIDATES)
+        in_range = positions < size
+        positions, scores = positions[in_range], scores[in_range]
+        if len(scores):
+            # Rows that only share a minor term (a common word, a SKU prefix) would otherwise
+            # crowd the shortlist and outvote an exact match through their dense ranks.
+            strong = scores >= scores[0] * settings.HYBRID_LEXICAL_MIN_SCORE_RATIO
+            positions, scores = positions[strong], scores[strong]
+        lexical_count = len(positions)
+        if lexical_count < top_k:
+            # Too few rows share a term with the query (e.g. a paraphrase): add the dense top_k.
+            dense_positions, _ = self._dense_search(query, top_k, size, exact)
+            positions = np.concatenate([positions, dense_positions[~np.isin(dense_positions, positions)]])
+        if not len(positions):
+            return []
+
+        similarities = self._matrix[positions] @ query
+        dense_ranks = np.empty(len(positions))
+        dense_ranks[np.argsort(-similarities)] = np.arange(len(positions))
+        lexical_ranks = np.full(len(positions), np.inf)
+        # Rows with equal BM25 scores share a rank; the dense ranking decides between them.
+        lexical_ranks[:lexical_count] = np.searchsorted(-scores, -scores, side='left')
+        k = settings.HYBRID_RRF_K
+        fused = 1.0 / (k + 1 + lexical_ranks) + 1.0 / (k + 1 + dense_ranks)
+
+        order = np.argsort(-fused, kind='stable')[:top_k]
+        best = fused[order[0]]
+        return [
+            {**self._result(positions[i], similarities[i]), 'relevance': float(fused[i] / best)}
+            for i in order
+        ]
+
+    def _result(self, position: int, similarity: float) -> Dict[str, Any]:
+        row_id = self.ids[position]
+        return {
+            'id': row_id,
+            'content': self.contents[row_id],
+            'similarity': float(similarity),
+            'embedding': self._matrix[position],
+            'direct_answer': self.direct_answers.get(row_id),
+        }
+
+    @property
+    def lexical(self) -> BM25Index:
+        """The BM25 index over the rows, built on first use for an index loaded from a snapshot saved without one."""
+        if self._lexical is None:
+            with self._lock:
+                if self._lexical is None:
+                    self._lexical = self._build_lexical()
+        return self._lexical
+
+    def _build_lexical(self) -> BM25Index:
+        lexical = BM25Index(k1=settings.BM25_K1, b=settings.BM25_B)
+        lexical.add(self.contents[row_id] for row_id in self.ids[:self._size])
+        return lexical
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict[str, Any]], ann_dir: str | None = None) -> "TenantVectorIndex":
+        index = cls(ann_dir=ann_dir)
+        index.add(rows)
+        return index
+
+    def save_snapshot(self, directory: str) -> None:
+        """
+        Writes the matrix as matrix.npy, the ids, contents, direct answers and a
+        checksum of the matrix as rows.json and, with hybrid search enabled, the
+        BM25 postings as lexical.npz, into a new version of directory that
+        replaces the current one in a single rename (see versioned_dir).
+        """
+        lexical = self.lexical if settings.HYBRID_SEARCH_ENABLED else None
+        with self._lock:
+            matrix = self.matrix
+            ids = list(self.ids)
+            contents = [self.contents[row_id] for row_id in ids]
+            direct_answers = list(self.direct_answers.items())
+
+        version = versioned_dir.new_version(directory)
+        try:
+            np.save(os.path.join(version, _MATRIX_FILE), matrix)
+            with open(os.path.join(version, _ROWS_FILE), 'w') as f:
+                json.dump({'ids': ids, 'contents': contents, 'direct_answers': direct_answers,
+                           'checksum': _checksum(matrix)}, f)
+            if lexical is not None:
+                # Rows appended since the matrix was copied are left out.
+                lexical.save(os.path.join(version, _LEXICAL_FILE), size=len(ids))
+            versioned_dir.publish(directory, version)
+        except BaseException:
+            versioned_dir.discard(version)
+            raise
+
+    @classmethod
+    def load_snapshot(cls, directory: str, ann_dir: str | None = None) -> "TenantVectorIndex | None":
+        """
+        Loads a snapshot written by save_snapshot(), memory-mapping the matrix.
+        The first add() copies the matrix into memory. Returns None if there is
+        no usable snapshot.
+        """
+        version = versioned_dir.current_version(directory)
+        if version is None:
+            logger.info(f"No vector snapshot in {directory}")
+            return None
+        try:
+            matrix = np.load(os.path.join(version, _MATRIX_FILE), mmap_mode='r')
+            with open(os.path.join(version, _ROWS_FILE)) as f:
+                rows = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.info(f"No usable vector snapshot in {version}: {e}")
+            return None
+        if matrix.ndim != 2 or matrix.dtype != np.float32 or len(matrix) != len(rows['ids']) or not len(matrix) \
+                or rows.get('checksum') != _checksum(matrix):
+            logger.info(f"Ignoring mismatched vector snapshot in {version}")
+            return None
+
+        index = cls(ann_dir=ann_dir)
+        index.ids = rows['ids']
+        index.contents = dict(zip(rows['ids'], rows['contents']))
+        index.direct_answers = {row_id: answer for row_id, answer in rows.get('direct_answers', [])}
+        index._matrix = matrix
+        index._size = len(matrix)
+        if settings.HYBRID_SEARCH_ENABLED and os.path.exists(os.path.join(version, _LEXICAL_FILE)):
+            try:
+                lexical = BM25Index.load(os.path.join(version, _LEXICAL_FILE), k1=settings.BM25_K1, b=settings.BM25_B)
+            except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+                logger.info(f"Rebuilding the BM25 index of {version}: {e}")
+            else:
+                if len(lexical) == index._size:
+                    index._lexical = lexical
+        if index._size >= settings.ANN_MIN_ENTRIES:
+            index._build_ann()
+        return index
+
+class VectorIndexRegistry:
+    """
+    Per-company TenantVectorIndex instances. An index is built from the database
+    on first use and then kept current by add_knowledge_base_entry.
+    """
+    def __init__(self):
+        self._indexes: Dict[str, TenantVectorIndex] = {}
+        self._lock = threading.Lock()
+
+    def get(self, company_id: str) -> TenantVectorIndex:
+        """Returns the company's index, loading it from the database if it is not resident."""
+        company_id = str(company_id)
+        index = self._indexes.get(company_id)
+        if index is not None:
+            return index
+
+        start_time = time.time()
+        index = self._load_snapshot(company_id)
+        source = 'snapshot'
+        if index is None:
+            index = TenantVectorIndex.from_rows(supabase_service.get_knowledge_base_rows(company_id), ann_dir=self._ann_dir(company_id))
+            source = 'database'
+            self._save_snapshot(company_id, index)
+        logger.info(f"Built vector index for company {company_id} with {len(index)} entries from {source} "
+                    f"({'IVF' if index.uses_ann else 'exact'}) in {time.time() - start_time:.4f} seconds")
+
+        # An empty knowledge base is not kept, so a first upload is picked up on the next message.
+        if len(index):
+            with self._lock:
+                index = self._indexes.setdefault(company_id, index)
+        return index
+
+    def _load_snapshot(self, company_id: str) -> TenantVectorIndex | None:
+        """
+        Loads the company's local snapshot and brings it up to date: rows added
+        since it was written are fetched individually, while any deleted row
+        discards the snapshot.
+        """
+        directory = self._snapshot_dir(company_id)
+        if directory is None or not os.path.isdir(directory):
+            return None
+        index = TenantVectorIndex.load_snapshot(directory, ann_dir=self._ann_dir(company_id))
+        if index is None:
+            return None
+
+        current_ids = supabase_service.get_knowledge_base_ids(company_id)
+        if not set(index.contents) <= set(current_ids):
+            logger.info(f"Vector snapshot for company {company_id} has deleted rows, rebuilding")
+            return None
+        missing = [row_id for row_id in current_ids if row_id not in index.contents]
+        if missing:
+            index.add(supabase_service.get_knowledge_base_rows(company_id, ids=missing))
+            self._save_snapshot(company_id, index)
+        return index
+
+    def _save_snapshot(self, company_id: str, index: TenantVectorIndex) -> None:
+        directory = self._snapshot_dir(company_id)
+        if directory is None or not len(index):
+            return
+        try:
+            index.save_snapshot(directory)
+        except OSError as e:
+            logger.warning(f"Could not save vector snapshot for company {company_id}: {e}")
+
+    def preload_snapshots(self, stop: threading.Event | None = None) -> None:
+        """
+        Loads every company that has a local snapshot, so their first messages skip
+        the download. Returns early, between companies, once stop is set.
+        """
+        if not settings.VECTOR_SNAPSHOT_DIR or not os.path.isdir(settings.VECTOR_SNAPSHOT_DIR):
+            return
+        for company_id in os.listdir(settings.VECTOR_SNAPSHOT_DIR):
+            if stop is not None and stop.is_set():
+                logger.info("Vector snapshot preload stopped.")
+                return
+            try:
+                self.get(company_id)
+            except Exception as e:
+                logger.error(f"Error preloading vector index for company {company_id}: {e}", exc_info=True)
+
+    @staticmethod
+    def _snapshot_dir(company_id: str) -> str | None:
+        return os.path.join(settings.VECTOR_SNAPSHOT_DIR, company_id) if settings.VECTOR_SNAPSHOT_DIR else None
+
+    @staticmethod
+    def _ann_dir(company_id: str) -> str | None:
+        return os.path.join(settings.ANN_INDEX_DIR, company_id) if settings.ANN_INDEX_DIR else None
+
+    def add_entry(self, company_id: str, row: Dict[str, Any]) -> None:
+        """Appends a newly inserted row to the company's index if it is resident."""
+        index = self._indexes.get(str(company_id))
+        if index is not None:
+            index.add([row])
+
+    def invalidate(self, company_id: str) -> None:
+        """Drops the company's index and its snapshot, so the next message reloads it from the database."""
+        with self._lock:
+            self._indexes.pop(str(company_id), None)
+        directory = self._snapshot_dir(str(company_id))
+        if directory:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def unload(self) -> None:
+        """Drops the resident indexes but keeps their snapshots, so each is reloaded and revalidated on next use."""
+        with self._lock:
+            self._indexes.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._indexes.clear()
+        if settings.VECTOR_SNAPSHOT_DIR:
+            shutil.rmtree(settings.VECTOR_SNAPSHOT_DIR, ignore_errors=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'tenants': len(self._indexes),
+                'entries': sum(len(index) for index in self._indexes.values()),
+                'ann_tenants': sum(index.uses_ann for index in self._indexes.values()),
+                'bytes': sum(index.matrix.nbytes for index in self._indexes.values()),
+                'lexical_bytes': sum(index._lexical.nbytes for index in self._indexes.values() if index._lexical is not None),
+            }
+
+vector_index_registry = VectorIndexRegistry()
+supabase_service.add_knowledge_base_listener(vector_index_registry.add_entry)
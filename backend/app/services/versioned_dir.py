@@ -0,0 +1,54 @@
+# Directories shared by several processes (the pre-fork workers all read and write the
+# same snapshot directories) are written as a fresh version directory with a unique
+# name, then published by pointing the `current` symlink at it with a single rename.
+# Readers resolve the link once and so see one complete version, never files from two
+# writers, and concurrent writers never share a temp file.
+import os
+import shutil
+import time
+import uuid
+
+# Name of the symlink that points at the published version inside a directory
+CURRENT = 'current'
+_VERSION_PREFIX = 'v-'
+# Replaced versions are kept this long for readers that resolved them just before the swap.
+STALE_VERSION_SECONDS = 60.0
+
+def new_version(directory: str) -> str:
+    """Creates an empty version directory under directory and returns its path."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{_VERSION_PREFIX}{os.getpid()}-{uuid.uuid4().hex}")
+    os.mkdir(path)
+    return path
+
+def publish(directory: str, version: str) -> None:
+    """Makes version the current one, then removes versions replaced more than STALE_VERSION_SECONDS ago."""
+    link = os.path.join(directory, f".{CURRENT}-{os.getpid()}-{uuid.uuid4().hex}")
+    os.symlink(os.path.basename(version), link)
+    os.replace(link, os.path.join(directory, CURRENT))
+    _remove_stale(directory, keep=os.path.basename(version))
+
+def discard(version: str) -> None:
+    """Removes a version that was not published (e.g. after a failed write)."""
+    shutil.rmtree(version, ignore_errors=True)
+
+def current_version(directory: str) -> str | None:
+    """The path of the published version, or None if there is none."""
+    try:
+        path = os.path.join(directory, os.readlink(os.path.join(directory, CURRENT)))
+    except OSError:
+        return None
+    return path if os.path.isdir(path) else None
+
+def _remove_stale(directory: str, keep: str) -> None:
+    cutoff = time.time() - STALE_VERSION_SECONDS
+    for name in os.listdir(directory):
+        if name == keep or not name.startswith(_VERSION_PREFIX):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            # Removed by another writer meanwhile
+            pass
@@ -5,17 +5,12 @@ import os
 import asyncio
 from telegram.ext import Application, MessageHandler, filters
 from app.bot.handler import handle_message
+from app.core.logging_config import configure_logging
 from app.services.supabase_service import SupabaseService # Corrected import
 
-# Enable logging
+# Enable logging (levels per subsystem come from LOG_LEVEL and LOG_LEVELS)
+configure_logging()
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-logging.getLogger('telegram').setLevel(logging.DEBUG)
-
-# Add a file handler to bot.log
-file_handler = logging.FileHandler('bot.log', mode='w')
-file_handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
-logger.addHandler(file_handler)
 
 async def run_bot_for_company(company_name: str, token: str):
     """Runs a single Telegram bot instance for a given company."""
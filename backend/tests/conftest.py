@@ -0,0 +1,12 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Settings require these; the tests never reach the real services.
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '123:test')
+os.environ.setdefault('SUPABASE_URL', 'https://test.supabase.co')
+os.environ.setdefault('SUPABASE_KEY', 'eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJyb2xlIjoiYW5vbiJ9.test')
+os.environ.setdefault('GOOGLE_API_KEY', 'test')
+os.environ.setdefault('VECTOR_SNAPSHOT_DIR', '')
+os.environ.setdefault('ANN_INDEX_DIR', '')
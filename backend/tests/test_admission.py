@@ -0,0 +1,55 @@
+import pytest
+
+from app.services import admission as admission_module
+from app.services.admission import AdmissionController
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission_module.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(admission_module.settings, 'ADMISSION_CONTROL_ENABLED', True)
+    monkeypatch.setattr(admission_module.settings, 'CHAT_BURST', 2)
+    monkeypatch.setattr(admission_module.settings, 'COMPANY_BURST', 100)
+    return clock
+
+# 1 message per second per chat; the company limit is off.
+PLAN = {'chat_messages_per_minute': 60, 'company_messages_per_minute': 0}
+
+def test_chat_is_refused_past_its_burst_and_notified_once(clock):
+    controller = AdmissionController(max_chats=10, notify_ttl=60)
+    assert controller.admit('bot', 'chat', PLAN).admitted
+    assert controller.admit('bot', 'chat', PLAN).admitted
+
+    first, second = controller.admit('bot', 'chat', PLAN), controller.admit('bot', 'chat', PLAN)
+    assert (first.admitted, first.reason, first.notify) == (False, 'chat_rate', True)
+    assert (second.admitted, second.notify) == (False, False)
+
+    clock.now += 1
+    assert controller.admit('bot', 'chat', PLAN).admitted
+    assert controller.admit('bot', 'chat', PLAN).notify
+
+def test_notified_chats_are_forgotten_after_the_ttl(clock):
+    # Only the company limit applies, so refused chats never get an admitted message.
+    plan = {'chat_messages_per_minute': 0, 'company_messages_per_minute': 60}
+    controller = AdmissionController(max_chats=1000, notify_ttl=30)
+    for i in range(200):
+        controller.admit('bot', f'chat-{i}', plan)
+    assert 0 < controller.stats()['notified_chats'] <= 200
+
+    clock.now += 31
+    controller.admit('bot', 'other', plan)
+    assert controller.stats()['notified_chats'] <= 1
+
+def test_notified_chats_are_capped(clock):
+    plan = {'chat_messages_per_minute': 0, 'company_messages_per_minute': 60}
+    controller = AdmissionController(max_chats=50, notify_ttl=3600)
+    for i in range(500):
+        controller.admit('bot', f'chat-{i}', plan)
+    assert controller.stats()['notified_chats'] == 50
@@ -0,0 +1,39 @@
+from app.services.answer_cache import AnswerCache
+
+def make_cache(**overrides):
+    options = dict(similarity_threshold=0.95, ttl_seconds=60.0, max_entries_per_tenant=10, max_bytes=1024 * 1024)
+    options.update(overrides)
+    return AnswerCache(**options)
+
+def test_hits_close_queries_of_the_same_company_and_version():
+    cache = make_cache()
+    cache.put('a', [1.0, 0.0], 1, "Open 9 to 5")
+    assert cache.get('a', [0.99, 0.01], 1) == "Open 9 to 5"
+    assert cache.get('a', [0.0, 1.0], 1) is None
+    assert cache.get('b', [1.0, 0.0], 1) is None
+    assert cache.get('a', [1.0, 0.0], 2) is None
+
+def test_empty_answers_are_not_cached():
+    cache = make_cache()
+    cache.put('a', [1.0, 0.0], 1, "  ")
+    assert cache.stats()['entries'] == 0
+
+def test_expired_entries_miss():
+    cache = make_cache(ttl_seconds=0.0)
+    cache.put('a', [1.0, 0.0], 1, "answer")
+    assert cache.get('a', [1.0, 0.0], 1) is None
+
+def test_per_tenant_limit_evicts_the_oldest():
+    cache = make_cache(max_entries_per_tenant=2)
+    for i, vector in enumerate(([1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0])):
+        cache.put('a', vector, 1, f"answer {i}")
+    assert cache.get('a', [1.0, 0.0, 0.0], 1) is None
+    assert cache.get('a', [0.0, 0.0, 1.0], 1) == "answer 2"
+
+def test_invalidate_drops_only_that_company():
+    cache = make_cache()
+    cache.put('a', [1.0, 0.0], 1, "a's answer")
+    cache.put('b', [1.0, 0.0], 1, "b's answer")
+    cache.invalidate('a')
+    assert cache.get('a', [1.0, 0.0], 1) is None
+    assert cache.get('b', [1.0, 0.0], 1) == "b's answer"
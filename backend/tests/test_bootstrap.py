@@ -0,0 +1,77 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.bot import bootstrap
+from app.bot.bootstrap import BotRegistry
+
+class FakeApplication:
+    instances = []
+
+    def __init__(self, token, fail_webhook=False):
+        self.token = token
+        self.initialized = False
+        self.shut_down = False
+        self.bot = SimpleNamespace(get_webhook_info=self._get_webhook_info, set_webhook=self._set_webhook)
+        self.fail_webhook = fail_webhook
+        FakeApplication.instances.append(self)
+
+    async def initialize(self):
+        await asyncio.sleep(0.01)
+        self.initialized = True
+
+    async def shutdown(self):
+        self.shut_down = True
+
+    async def _get_webhook_info(self):
+        if self.fail_webhook:
+            raise RuntimeError("Bot API unavailable")
+        return SimpleNamespace(url='')
+
+    async def _set_webhook(self, url):
+        pass
+
+@pytest.fixture(autouse=True)
+def fake_applications(monkeypatch):
+    FakeApplication.instances = []
+    monkeypatch.setattr(bootstrap, 'build_application', lambda token, request=None: FakeApplication(token))
+    monkeypatch.setattr(bootstrap.settings, 'SHARED_HTTP_POOL', False)
+
+def test_failed_webhook_registration_shuts_the_bot_down(monkeypatch):
+    monkeypatch.setattr(bootstrap, 'build_application', lambda token, request=None: FakeApplication(token, fail_webhook=True))
+    registry = BotRegistry(init_concurrency=2)
+    report = asyncio.run(registry.initialize_all(['1:a', '2:b']))
+    assert report['initialized'] == 0 and len(report['failed']) == 2
+    assert registry.apps == {}
+    assert all(app.shut_down for app in FakeApplication.instances)
+
+def test_bots_for_other_workers_are_shut_down_and_the_rest_kept():
+    registry = BotRegistry(init_concurrency=2)
+    report = asyncio.run(registry.initialize_all(['1:a', '2:b'], keep=lambda token: token == '1:a'))
+    assert report['webhooks_set'] == 2
+    assert list(registry.apps) == ['1:a']
+    assert [app.shut_down for app in FakeApplication.instances] == [False, True]
+
+def test_lazy_loads_initialize_a_bot_once(monkeypatch):
+    lookups = []
+
+    def lookup(token):
+        lookups.append(token)
+        # The first lookup fails, so its waiters retry while new callers arrive.
+        return len(lookups) > 1
+
+    monkeypatch.setattr(bootstrap.tenant_cache, 'get', lookup)
+    registry = BotRegistry(init_concurrency=2)
+
+    async def main():
+        first = [asyncio.create_task(registry.get_or_load('1:a')) for _ in range(3)]
+        await asyncio.sleep(0)
+        later = [asyncio.create_task(registry.get_or_load('1:a')) for _ in range(3)]
+        return await asyncio.gather(*first, *later)
+
+    results = asyncio.run(main())
+    assert results[0] is None
+    assert len(FakeApplication.instances) == 1
+    assert all(result is FakeApplication.instances[0] for result in results[1:])
+    assert registry._locks == {} and registry._lock_users == {}
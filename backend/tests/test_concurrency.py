@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from app.core.concurrency import Overloaded, PriorityLimiter
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+def test_waiters_get_slots_by_priority_then_arrival():
+    async def main():
+        limiter = PriorityLimiter(capacity=1, max_waiting=10, timeout=5)
+        await limiter.acquire()
+        order = []
+
+        async def waiter(name, priority):
+            await limiter.acquire(priority)
+            order.append(name)
+            limiter.release()
+
+        tasks = [asyncio.create_task(waiter(name, priority)) for name, priority in (('low', 0), ('high', 5), ('low2', 0))]
+        await settle()
+        limiter.release()
+        await asyncio.gather(*tasks)
+        return order, limiter.stats()
+
+    order, stats = asyncio.run(main())
+    assert order == ['high', 'low', 'low2']
+    assert stats['active'] == 0 and stats['waiting'] == 0
+
+def test_full_queue_sheds_the_lowest_priority_caller():
+    async def main():
+        limiter = PriorityLimiter(capacity=1, max_waiting=1, timeout=5)
+        await limiter.acquire()
+        low = asyncio.create_task(limiter.acquire(0))
+        await settle()
+        # A tie sheds the newcomer; a higher priority evicts the queued caller.
+        with pytest.raises(Overloaded):
+            await limiter.acquire(0)
+        high = asyncio.create_task(limiter.acquire(3))
+        await settle()
+        with pytest.raises(Overloaded):
+            await low
+        limiter.release()
+        await high
+        limiter.release()
+        return limiter.stats()
+
+    stats = asyncio.run(main())
+    assert stats['active'] == 0 and stats['waiting'] == 0
+    assert stats['shed_by_priority'] == {0: 2}
+
+def test_timeout_sheds_and_frees_the_queue_place():
+    async def main():
+        limiter = PriorityLimiter(capacity=1, max_waiting=1, timeout=0.01)
+        await limiter.acquire()
+        with pytest.raises(Overloaded):
+            await limiter.acquire()
+        return limiter.stats()
+
+    stats = asyncio.run(main())
+    assert stats['active'] == 1 and stats['waiting'] == 0
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def main():
+        limiter = PriorityLimiter(capacity=1, max_waiting=5, timeout=5)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await settle()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        limiter.release()
+        return limiter.stats()
+
+    stats = asyncio.run(main())
+    assert stats['active'] == 0 and stats['waiting'] == 0
+
+def test_slot_handed_to_a_cancelled_waiter_is_passed_on(monkeypatch):
+    async def cancelled_after_hand_off(future, timeout):
+        # Python 3.12+ raises the cancellation even when the future already has its result.
+        await asyncio.wait([future])
+        raise asyncio.CancelledError()
+
+    async def main():
+        limiter = PriorityLimiter(capacity=1, max_waiting=5, timeout=5)
+        await limiter.acquire()
+        with monkeypatch.context() as patch:
+            patch.setattr(asyncio, 'wait_for', cancelled_after_hand_off)
+            first = asyncio.create_task(limiter.acquire())
+            await settle()
+        second = asyncio.create_task(limiter.acquire())
+        await settle()
+        limiter.release()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        await asyncio.wait_for(second, timeout=1)
+        limiter.release()
+        return limiter.stats()
+
+    stats = asyncio.run(main())
+    assert stats['active'] == 0 and stats['waiting'] == 0
@@ -0,0 +1,75 @@
+import pytest
+
+from app.services import conversation_store as conversation_store_module
+from app.services.conversation_store import ConversationStore
+
+class FakeDatabase:
+    def __init__(self):
+        self.conversations = []
+        self.messages = []
+        self.down = False
+
+    def add_conversations(self, conversations):
+        if self.down:
+            return False
+        self.conversations.extend(conversations)
+        return True
+
+    def add_messages(self, messages):
+        if self.down:
+            return False
+        self.messages.extend(messages)
+        return True
+
+@pytest.fixture
+def db(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(conversation_store_module.settings, 'CONVERSATION_PERSIST', True)
+    monkeypatch.setattr(conversation_store_module.supabase_service, 'add_conversations', database.add_conversations)
+    monkeypatch.setattr(conversation_store_module.supabase_service, 'add_messages', database.add_messages)
+    return database
+
+def make_store(max_unflushed=6):
+    return ConversationStore(max_turns=4, idle_ttl_seconds=3600, max_bytes=1 << 20,
+                             flush_interval=60, max_pending=1000, max_unflushed=max_unflushed)
+
+def test_flush_writes_conversations_and_messages(db):
+    store = make_store()
+    store.append('c1', 'chat-1', 'u1', "hi", "hello")
+    store.append('c1', 'chat-1', 'u1', "price?", "ten")
+
+    assert store.flush() == 4
+    assert len(db.conversations) == 1
+    assert [message['content'] for message in db.messages] == ["hi", "hello", "price?", "ten"]
+
+def test_queue_stays_bounded_while_the_database_is_down(db):
+    db.down = True
+    store = make_store(max_unflushed=6)
+    for i in range(20):
+        store.append('c1', f'chat-{i}', 'u1', f"q{i}", f"a{i}")
+        store.flush()
+
+    stats = store.stats()
+    assert stats['pending_conversations'] <= 6
+    assert stats['pending_messages'] <= 6
+    assert stats['dropped_conversations'] > 0
+    assert stats['dropped_messages'] > 0
+
+    db.down = False
+    store.flush()
+    # Only the newest chats survive, and no message is written without its conversation.
+    written = {conversation['id'] for conversation in db.conversations}
+    assert db.messages and all(message['conversation_id'] in written for message in db.messages)
+    assert db.messages[-1]['content'] == "a19"
+
+def test_dropping_a_conversation_drops_its_queued_messages(db):
+    db.down = True
+    store = make_store(max_unflushed=2)
+    store.append('c1', 'chat-1', 'u1', "q1", "a1")
+    store.append('c1', 'chat-2', 'u1', "q2", "a2")
+    store.append('c1', 'chat-3', 'u1', "q3", "a3")
+
+    db.down = False
+    store.flush()
+    assert [message['content'] for message in db.messages] == ["q3", "a3"]
+    assert store.dropped_conversations == 1
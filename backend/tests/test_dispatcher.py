@@ -0,0 +1,66 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.bot.dispatcher import ACCEPTED, DUPLICATE, UpdateDispatcher
+
+def make_update(update_id: int, chat_id: int = 1):
+    return SimpleNamespace(update_id=update_id, effective_chat=SimpleNamespace(id=chat_id))
+
+class FakeApplication:
+    def __init__(self, behaviour):
+        self.behaviour = behaviour
+        self.processed = []
+
+    async def process_update(self, update):
+        await self.behaviour(update)
+        self.processed.append(update.update_id)
+
+def test_worker_survives_a_cancelled_update():
+    async def behaviour(update):
+        if update.update_id == 1:
+            raise asyncio.CancelledError()
+
+    async def main():
+        dispatcher = UpdateDispatcher(num_workers=1, max_queue_size=10, dedupe_size=10)
+        application = FakeApplication(behaviour)
+        dispatcher.start()
+        dispatcher.submit('token', application, make_update(1))
+        dispatcher.submit('token', application, make_update(2))
+        await asyncio.wait_for(dispatcher._queues[0].join(), timeout=1)
+        stats = dispatcher.stats()
+        await dispatcher.stop()
+        return application, stats
+
+    application, stats = asyncio.run(main())
+    assert application.processed == [2]
+    assert stats['failed'] == 1 and stats['processed'] == 1 and stats['workers'] == 1
+
+def test_stop_cancels_workers_stuck_in_a_handler():
+    async def behaviour(update):
+        await asyncio.sleep(10)
+
+    async def main():
+        dispatcher = UpdateDispatcher(num_workers=1, max_queue_size=10, dedupe_size=10)
+        dispatcher.start()
+        dispatcher.submit('token', FakeApplication(behaviour), make_update(1))
+        await asyncio.sleep(0)
+        await asyncio.wait_for(dispatcher.stop(timeout=0.01), timeout=1)
+        return dispatcher
+
+    assert asyncio.run(main()).stats()['workers'] == 0
+
+def test_redelivered_updates_are_dropped():
+    async def behaviour(update):
+        pass
+
+    async def main():
+        dispatcher = UpdateDispatcher(num_workers=2, max_queue_size=10, dedupe_size=10)
+        dispatcher.start()
+        application = FakeApplication(behaviour)
+        results = [dispatcher.submit('token', application, make_update(7)) for _ in range(2)]
+        await dispatcher.stop()
+        return results, application
+
+    results, application = asyncio.run(main())
+    assert results == [ACCEPTED, DUPLICATE]
+    assert application.processed == [7]
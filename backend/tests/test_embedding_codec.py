@@ -0,0 +1,26 @@
+import json
+
+import numpy as np
+import pytest
+
+from app.services.embedding_codec import decode_embedding, encode_embedding
+
+@pytest.mark.parametrize('dtype, tolerance', [('float16', 1e-3), ('float32', 0)])
+def test_compact_round_trip(dtype, tolerance):
+    vector = np.random.default_rng(0).normal(size=384).astype(np.float32)
+    vector /= np.linalg.norm(vector)
+
+    encoded = encode_embedding(vector, dtype)
+    assert encoded.startswith(f"f{dtype[-2:]}:")
+    decoded = decode_embedding(encoded)
+    assert decoded.dtype == np.float32
+    np.testing.assert_allclose(decoded, vector, atol=tolerance)
+
+def test_float16_is_half_the_size_of_float32():
+    vector = np.ones(384, dtype=np.float32)
+    assert len(encode_embedding(vector, 'float16')) < 0.6 * len(encode_embedding(vector, 'float32'))
+
+def test_pgvector_text_and_lists_decode():
+    values = [0.25, -0.5, 1.0]
+    np.testing.assert_array_equal(decode_embedding(json.dumps(values)), values)
+    np.testing.assert_array_equal(decode_embedding(values), values)
@@ -0,0 +1,100 @@
+import math
+import os
+
+import numpy as np
+import pytest
+
+from app.services import versioned_dir
+from app.services.lexical_index import BM25Index, tokenize
+from app.services.vector_index import TenantVectorIndex, _LEXICAL_FILE
+
+DOCUMENTS = [
+    "Running shoes SKU-48213 in Accra",
+    "Leather boots in Kumasi, call +233 550 123 456",
+    "Running shoes SKU-48214 in Kumasi",
+    "Sandals and slippers",
+    "Return policy: 7 days for running shoes and boots",
+]
+
+def reference_scores(documents, query, k1=1.2, b=0.75):
+    """Okapi BM25 computed directly over every document."""
+    tokenized = [tokenize(document) for document in documents]
+    average_length = sum(map(len, tokenized)) / len(tokenized)
+    scores = {}
+    for position, tokens in enumerate(tokenized):
+        score = 0.0
+        for term in set(tokenize(query)):
+            frequency = tokens.count(term)
+            if not frequency:
+                continue
+            containing = sum(term in other for other in tokenized)
+            idf = math.log(1 + (len(tokenized) - containing + 0.5) / (containing + 0.5))
+            score += idf * frequency * (k1 + 1) / (frequency + k1 * (1 - b + b * len(tokens) / average_length))
+        if score:
+            scores[position] = score
+    return scores
+
+@pytest.mark.parametrize('query', ["running shoes kumasi", "48213", "SKU-48214", "boots return", "nothing matches"])
+def test_search_matches_reference_scoring(query):
+    index = BM25Index()
+    index.add(DOCUMENTS)
+
+    positions, scores = index.search(query, limit=10)
+    expected = reference_scores(DOCUMENTS, query)
+    assert dict(zip(positions.tolist(), scores.tolist())) == pytest.approx(expected, rel=1e-5)
+    assert list(scores) == sorted(scores, reverse=True)
+
+def test_search_keeps_the_best_rows_within_limit():
+    index = BM25Index()
+    index.add(DOCUMENTS)
+
+    positions, _ = index.search("running shoes kumasi", limit=2)
+    expected = reference_scores(DOCUMENTS, "running shoes kumasi")
+    assert positions.tolist() == sorted(expected, key=expected.get, reverse=True)[:2]
+
+def test_save_and_load_round_trip(tmp_path):
+    index = BM25Index()
+    index.add(DOCUMENTS)
+    path = str(tmp_path / 'lexical.npz')
+    index.save(path)
+
+    loaded = BM25Index.load(path)
+    assert len(loaded) == len(index) and loaded.terms == index.terms
+    for query in ("running shoes kumasi", "+233 550", "sandals"):
+        np.testing.assert_array_equal(loaded.search(query, 10)[0], index.search(query, 10)[0])
+    # The loaded postings keep growing like built ones.
+    loaded.add(["Sandals for kids"])
+    assert loaded.search("kids", 10)[0].tolist() == [len(DOCUMENTS)]
+
+def test_save_leaves_out_rows_past_size(tmp_path):
+    index = BM25Index()
+    index.add(DOCUMENTS)
+    path = str(tmp_path / 'lexical.npz')
+    index.save(path, size=2)
+
+    loaded = BM25Index.load(path)
+    assert len(loaded) == 2
+    assert loaded.search("running shoes", 10)[0].tolist() == [0]
+
+def test_vector_snapshot_carries_the_lexical_index(tmp_path):
+    rng = np.random.default_rng(0)
+    rows = [{'id': f"r{i}", 'content': document, 'embedding': rng.normal(size=8).astype(np.float32)}
+            for i, document in enumerate(DOCUMENTS)]
+    TenantVectorIndex.from_rows(rows).save_snapshot(str(tmp_path))
+    assert os.path.exists(os.path.join(versioned_dir.current_version(str(tmp_path)), _LEXICAL_FILE))
+
+    loaded = TenantVectorIndex.load_snapshot(str(tmp_path))
+    assert loaded._lexical is not None and len(loaded._lexical) == len(DOCUMENTS)
+    assert loaded.lexical.search("SKU-48213", 10)[0][0] == 0
+
+def test_corrupt_lexical_file_is_rebuilt(tmp_path):
+    rng = np.random.default_rng(0)
+    rows = [{'id': f"r{i}", 'content': document, 'embedding': rng.normal(size=8).astype(np.float32)}
+            for i, document in enumerate(DOCUMENTS)]
+    TenantVectorIndex.from_rows(rows).save_snapshot(str(tmp_path))
+    with open(os.path.join(versioned_dir.current_version(str(tmp_path)), _LEXICAL_FILE), 'wb') as f:
+        f.write(b"not an archive")
+
+    loaded = TenantVectorIndex.load_snapshot(str(tmp_path))
+    assert loaded._lexical is None
+    assert loaded.lexical.search("SKU-48213", 10)[0][0] == 0
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+from app.services.llm_coalescer import LLMCoalescer, coalescing_key, normalize_query
+
+KEY = ('company-1', 'digest')
+
+def answer_after(event: asyncio.Event, text: str = "answer", tokens: int = 10):
+    async def call():
+        await event.wait()
+        return text, tokens
+    return call
+
+def test_identical_requests_share_one_call():
+    async def main():
+        coalescer = LLMCoalescer('split')
+        release = asyncio.Event()
+        tasks = [asyncio.create_task(coalescer.run(KEY, answer_after(release, tokens=10))) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        return coalescer, await asyncio.gather(*tasks)
+
+    coalescer, responses = asyncio.run(main())
+    assert coalescer.calls == 1
+    assert coalescer.coalesced == 2
+    assert [response.shared for response in responses] == [False, True, True]
+    assert sorted(response.billed_tokens for response in responses) == [3, 3, 4]
+
+def test_cancelled_leader_does_not_cancel_followers():
+    async def main():
+        coalescer = LLMCoalescer('once')
+        never, release = asyncio.Event(), asyncio.Event()
+        leader = asyncio.create_task(coalescer.run(KEY, answer_after(never)))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(coalescer.run(KEY, answer_after(release, text="retried"))) for _ in range(2)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0.01)
+        release.set()
+        results = await asyncio.gather(*followers)
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return coalescer, results
+
+    coalescer, results = asyncio.run(main())
+    assert [result.text for result in results] == ["retried", "retried"]
+    # One follower took over the call and the other shared it.
+    assert coalescer.calls == 2
+    assert sorted(result.shared for result in results) == [False, True]
+
+def test_leader_error_fails_followers():
+    async def main():
+        coalescer = LLMCoalescer('once')
+        release = asyncio.Event()
+
+        async def failing():
+            await release.wait()
+            raise RuntimeError("gemini down")
+
+        tasks = [asyncio.create_task(coalescer.run(KEY, failing)) for _ in range(2)]
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+def test_key_covers_normalized_question_context_and_history():
+    knowledge = [{'content': 'Opening hours: 9 to 5'}]
+    assert normalize_query("What's the PRICE?") == normalize_query("whats the price")
+    assert coalescing_key('1', "What's the price?", knowledge) == coalescing_key('1', "whats the price", knowledge)
+    assert coalescing_key('1', "price", knowledge) != coalescing_key('2', "price", knowledge)
+    assert coalescing_key('1', "price", knowledge) != coalescing_key('1', "price", [{'content': 'other'}])
@@ -0,0 +1,35 @@
+import asyncio
+import logging
+import threading
+
+from app import main
+
+def run_lifespan(monkeypatch, preload):
+    monkeypatch.setattr(main.settings, 'BOT_STARTUP_MODE', 'lazy')
+    monkeypatch.setattr(main.settings, 'WARMUP_ON_STARTUP', False)
+    monkeypatch.setattr(main.settings, 'VECTOR_SNAPSHOT_PRELOAD', True)
+    monkeypatch.setattr(main.vector_index_registry, 'preload_snapshots', preload)
+
+    async def serve():
+        async with main.lifespan(main.app):
+            await asyncio.sleep(0.05)
+
+    asyncio.run(serve())
+
+def test_preload_failure_is_logged(monkeypatch, caplog):
+    def preload(stop):
+        raise RuntimeError("snapshot directory unreadable")
+
+    with caplog.at_level(logging.ERROR):
+        run_lifespan(monkeypatch, preload)
+    assert "Vector snapshot preload failed: snapshot directory unreadable" in caplog.text
+
+def test_shutdown_stops_and_waits_for_the_preload(monkeypatch):
+    finished = threading.Event()
+
+    def preload(stop):
+        assert stop.wait(5)
+        finished.set()
+
+    run_lifespan(monkeypatch, preload)
+    assert finished.is_set()
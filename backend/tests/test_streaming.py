@@ -0,0 +1,97 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import BadRequest
+
+from app.bot import streaming
+from app.bot.streaming import EditBudget, ProgressiveReply
+
+class FakeMessage:
+    def __init__(self, chat_type='private', chat_id=1, fail_edits=None):
+        self.chat = SimpleNamespace(type=chat_type)
+        self.chat_id = chat_id
+        self.fail_edits = fail_edits
+        self.replies = []
+        self.edits = []
+
+    async def reply_text(self, text):
+        sent = FakeMessage(self.chat.type, self.chat_id, self.fail_edits)
+        sent.text = text
+        self.replies.append(text)
+
+        async def edit_text(new_text):
+            if self.fail_edits:
+                raise BadRequest(self.fail_edits)
+            self.edits.append(new_text)
+        sent.edit_text = edit_text
+        return sent
+
+@pytest.fixture(autouse=True)
+def generous_budget(monkeypatch):
+    monkeypatch.setattr(streaming, 'edit_budget', EditBudget(bot_rate=0, group_rate=0, max_chats=10))
+
+def test_partial_text_is_sent_then_edited_and_finished():
+    async def main():
+        message = FakeMessage()
+        reply = ProgressiveReply(message, min_edit_interval=0)
+        await reply.update("Hello")
+        await reply.update("Hello wor")
+        await reply.finish("Hello world")
+        return message
+
+    message = asyncio.run(main())
+    assert message.replies == ["Hello"]
+    assert message.edits == ["Hello wor", "Hello world"]
+
+def test_final_text_is_sent_anew_when_the_partial_reply_is_gone():
+    async def main():
+        message = FakeMessage(fail_edits="Message to edit not found")
+        reply = ProgressiveReply(message, min_edit_interval=0)
+        await reply.update("Hello")
+        await reply.finish("Hello world")
+        return message
+
+    assert asyncio.run(main()).replies == ["Hello", "Hello world"]
+
+def test_failed_partial_edit_raises_so_updates_stop():
+    async def main():
+        message = FakeMessage(fail_edits="Message to edit not found")
+        reply = ProgressiveReply(message, min_edit_interval=0)
+        await reply.update("Hello")
+        with pytest.raises(BadRequest):
+            await reply.update("Hello wor")
+
+    asyncio.run(main())
+
+def test_long_answers_are_split():
+    async def main():
+        message = FakeMessage()
+        await ProgressiveReply(message, min_edit_interval=0).finish("x" * (streaming.MAX_MESSAGE_LENGTH + 10))
+        return message
+
+    assert [len(text) for text in asyncio.run(main()).replies] == [streaming.MAX_MESSAGE_LENGTH, 10]
+
+def test_group_budget_skips_partial_replies_but_not_the_final_text(monkeypatch):
+    budget = EditBudget(bot_rate=0, group_rate=1 / 60, max_chats=10)
+    monkeypatch.setattr(streaming, 'edit_budget', budget)
+
+    async def main():
+        message = FakeMessage(chat_type='supergroup')
+        reply = ProgressiveReply(message, min_edit_interval=0, bot_token='bot')
+        for i in range(1, 10):
+            await reply.update("word " * i)
+        await reply.finish("the whole answer")
+        return message
+
+    message = asyncio.run(main())
+    # Three messages of burst: the first partial reply and two edits, then only the final text.
+    assert message.replies == ["word "]
+    assert message.edits == ["word word ", "word word word ", "the whole answer"]
+    assert budget.skipped == 6
+
+def test_private_chats_only_share_the_bot_budget():
+    budget = EditBudget(bot_rate=2, group_rate=1 / 60, max_chats=10)
+    assert [budget.allow('bot', chat_id, group=False) for chat_id in range(3)] == [True, True, False]
+    assert budget.allow('other bot', 1, group=False)
+    assert budget.allow('bot', 1, group=False, final=True)
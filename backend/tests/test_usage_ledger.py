@@ -0,0 +1,102 @@
+import pytest
+
+from app.services import usage_ledger as usage_ledger_module
+from app.services.usage_ledger import UsageLedger
+
+SUBSCRIPTION = {'id': 'sub-1', 'start_date': '2026-01-01', 'end_date': '2026-02-01'}
+
+class FakeDatabase:
+    def __init__(self, stored=0):
+        self.stored = stored
+        self.reads = 0
+        self.fail_reads = False
+        self.fail_writes = False
+        self.on_read = None
+        self.on_write = None
+
+    def get_usage_for_subscription(self, subscription_id, start_date, end_date):
+        self.reads += 1
+        if self.fail_reads:
+            return None
+        stored = self.stored
+        if self.on_read:
+            self.on_read()
+        return stored
+
+    def add_usage_logs(self, entries):
+        if self.fail_writes:
+            return False
+        self.stored += sum(entry['total_tokens'] for entry in entries)
+        if self.on_write:
+            self.on_write()
+        return True
+
+@pytest.fixture
+def db(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(usage_ledger_module.supabase_service, 'get_usage_for_subscription', database.get_usage_for_subscription)
+    monkeypatch.setattr(usage_ledger_module.supabase_service, 'add_usage_logs', database.add_usage_logs)
+    return database
+
+def make_ledger(reseed_interval=300.0):
+    return UsageLedger(flush_interval=5.0, max_pending=100, reseed_interval=reseed_interval)
+
+def test_seeds_once_and_counts_recorded_usage(db):
+    db.stored = 500
+    ledger = make_ledger()
+    assert ledger.current_usage(SUBSCRIPTION) == 500
+    ledger.record('sub-1', 40)
+    assert ledger.current_usage(SUBSCRIPTION) == 540
+    assert db.reads == 1
+
+def test_flush_writes_pending_usage_and_keeps_it_on_failure(db):
+    ledger = make_ledger()
+    ledger.record('sub-1', 30)
+    db.fail_writes = True
+    assert ledger.flush() == 0
+    assert ledger.stats()['pending_tokens'] == 30
+    db.fail_writes = False
+    assert ledger.flush() == 1
+    assert db.stored == 30
+    assert ledger.stats()['pending_tokens'] == 0
+
+def test_failed_read_keeps_previous_total_and_retries(db):
+    db.stored = 900
+    ledger = make_ledger(reseed_interval=0.0)
+    assert ledger.current_usage(SUBSCRIPTION) == 900
+    db.fail_reads = True
+    assert ledger.current_usage(SUBSCRIPTION) == 900
+    db.fail_reads = False
+    db.stored = 950
+    assert ledger.current_usage(SUBSCRIPTION) == 950
+
+def test_failed_first_read_is_not_cached(db):
+    ledger = make_ledger()
+    ledger.record('sub-1', 10)
+    db.fail_reads = True
+    assert ledger.current_usage(SUBSCRIPTION) == 10
+    db.fail_reads = False
+    db.stored = 1000
+    assert ledger.current_usage(SUBSCRIPTION) == 1010
+    assert db.reads == 2
+
+def test_reseed_during_flush_does_not_count_the_batch_twice(db):
+    ledger = make_ledger(reseed_interval=0.0)
+    assert ledger.current_usage(SUBSCRIPTION) == 0
+    ledger.record('sub-1', 100)
+    seen = []
+    # The batch is stored but still in flight when the reseed reads the database.
+    db.on_write = lambda: seen.append(ledger.current_usage(SUBSCRIPTION))
+    ledger.flush()
+    assert seen == [100]
+    db.on_write = None
+    assert ledger.current_usage(SUBSCRIPTION) == 100
+
+def test_reseed_overlapping_a_whole_flush_does_not_miss_the_batch(db):
+    ledger = make_ledger(reseed_interval=0.0)
+    assert ledger.current_usage(SUBSCRIPTION) == 0
+    ledger.record('sub-1', 100)
+    # The read returns the total from before the flush, which finishes while it is under way.
+    db.on_read = lambda: (setattr(db, 'on_read', None), ledger.flush())
+    assert ledger.current_usage(SUBSCRIPTION) == 100
+    assert ledger.current_usage(SUBSCRIPTION) == 100
@@ -0,0 +1,87 @@
+import os
+import threading
+
+import numpy as np
+
+from app.services import versioned_dir
+from app.services.ann_index import IVFIndex
+from app.services.answer_router import DIRECT_ANSWER
+from app.services.vector_index import TenantVectorIndex, _MATRIX_FILE
+
+def vector(row_id: str, dim: int = 16) -> np.ndarray:
+    values = np.random.default_rng(abs(hash(row_id)) % 2**32).normal(size=dim).astype(np.float32)
+    return values / np.linalg.norm(values)
+
+def rows(prefix: str, count: int):
+    return [{'id': f"{prefix}-{i}", 'content': f"row {prefix}-{i}", 'embedding': vector(f"{prefix}-{i}")} for i in range(count)]
+
+def assert_consistent(index: TenantVectorIndex) -> None:
+    for position, row_id in enumerate(index.ids):
+        assert index.contents[row_id] == f"row {row_id}"
+        np.testing.assert_allclose(index.matrix[position], vector(row_id), atol=1e-6)
+
+def test_snapshot_round_trip(tmp_path):
+    index = TenantVectorIndex.from_rows(rows('a', 20) + [
+        {'id': 'faq', 'content': "Q: hours?", 'embedding': vector('faq'), 'entry_type': DIRECT_ANSWER, 'answer': "9 to 5"}])
+    index.save_snapshot(str(tmp_path))
+
+    loaded = TenantVectorIndex.load_snapshot(str(tmp_path))
+    assert loaded.ids == index.ids
+    assert loaded.direct_answers == {'faq': "9 to 5"}
+    np.testing.assert_array_equal(loaded.matrix, index.matrix)
+    assert loaded.search(vector('a-3'), top_k=1)[0]['id'] == 'a-3'
+
+def test_snapshot_with_a_foreign_matrix_is_rejected(tmp_path):
+    TenantVectorIndex.from_rows(rows('a', 10)).save_snapshot(str(tmp_path))
+    version = versioned_dir.current_version(str(tmp_path))
+    # Same shape and dtype, different vectors: only the checksum tells them apart.
+    np.save(os.path.join(version, _MATRIX_FILE), TenantVectorIndex.from_rows(rows('b', 10)).matrix)
+    assert TenantVectorIndex.load_snapshot(str(tmp_path)) is None
+
+def test_missing_or_unpublished_snapshot_loads_nothing(tmp_path):
+    assert TenantVectorIndex.load_snapshot(str(tmp_path)) is None
+    versioned_dir.new_version(str(tmp_path))
+    assert TenantVectorIndex.load_snapshot(str(tmp_path)) is None
+
+def test_concurrent_writers_never_publish_a_mixed_snapshot(tmp_path):
+    directory = str(tmp_path)
+    indexes = [TenantVectorIndex.from_rows(rows('a', 50)), TenantVectorIndex.from_rows(rows('b', 80))]
+    errors = []
+
+    def write(index):
+        try:
+            for _ in range(20):
+                index.save_snapshot(directory)
+        except Exception as e:
+            errors.append(e)
+
+    writers = [threading.Thread(target=write, args=(index,)) for index in indexes]
+    for writer in writers:
+        writer.start()
+    loaded = []
+    while any(writer.is_alive() for writer in writers):
+        index = TenantVectorIndex.load_snapshot(directory)
+        if index is not None:
+            loaded.append(index)
+    for writer in writers:
+        writer.join()
+
+    assert not errors
+    loaded.append(TenantVectorIndex.load_snapshot(directory))
+    for index in loaded:
+        assert len({row_id.split('-')[0] for row_id in index.ids}) == 1
+        assert_consistent(index)
+    assert [name for name in os.listdir(directory) if name.startswith('.')] == []
+
+def test_ivf_index_round_trip_and_staleness(tmp_path):
+    index = TenantVectorIndex.from_rows(rows('a', 300))
+    ivf = IVFIndex.train(index.matrix, nlist=8)
+    ivf.save(str(tmp_path), index.ids)
+
+    loaded = IVFIndex.load(str(tmp_path), index.ids)
+    np.testing.assert_array_equal(loaded.positions, ivf.positions)
+    np.testing.assert_array_equal(loaded.candidates(index.matrix[0], nprobe=2), ivf.candidates(index.matrix[0], nprobe=2))
+    # Trained over other rows
+    assert IVFIndex.load(str(tmp_path), ['x'] + index.ids[1:]) is None
+    # Rows appended since training still match
+    assert IVFIndex.load(str(tmp_path), index.ids + ['new']).trained_size == 300
@@ -0,0 +1,38 @@
+-- Server-side knowledge base search (VECTOR_SEARCH_MODE=database).
+-- Returns a company's top p_match_count rows by cosine similarity, so only those
+-- rows cross the wire. pgvector's <=> operator is cosine distance (1 - similarity).
+-- direct_answer is the stored answer of entries tagged as direct answers, else NULL.
+
+-- Entry types (see docs/saas/database_schema.md, section 11)
+ALTER TABLE knowledge_bases
+ADD COLUMN IF NOT EXISTS entry_type TEXT NOT NULL DEFAULT 'passage' CHECK (entry_type IN ('passage', 'direct_answer')),
+ADD COLUMN IF NOT EXISTS answer TEXT;
+
+-- The result columns changed, which CREATE OR REPLACE cannot do.
+DROP FUNCTION IF EXISTS match_knowledge_bases(UUID, VECTOR(384), INT, FLOAT);
+
+CREATE OR REPLACE FUNCTION match_knowledge_bases(
+    p_company_id UUID,
+    p_query_embedding VECTOR(384),
+    p_match_count INT DEFAULT 3,
+    p_min_similarity FLOAT DEFAULT 0
+)
+RETURNS TABLE (id UUID, content TEXT, similarity FLOAT, direct_answer TEXT)
+LANGUAGE sql
+STABLE
+AS $$
+    -- The threshold is applied after the LIMIT so the ORDER BY can use a vector index.
+    SELECT matches.id, matches.content, matches.similarity, matches.direct_answer
+    FROM (
+        SELECT kb.id, kb.content, 1 - (kb.embedding <=> p_query_embedding) AS similarity,
+               CASE WHEN kb.entry_type = 'direct_answer' THEN COALESCE(kb.answer, kb.content) END AS direct_answer
+        FROM knowledge_bases kb
+        WHERE kb.company_id = p_company_id
+        ORDER BY kb.embedding <=> p_query_embedding
+        LIMIT p_match_count
+    ) AS matches
+    WHERE matches.similarity >= p_min_similarity;
+$$;
+
+-- Lets each search read only the company's rows.
+CREATE INDEX IF NOT EXISTS knowledge_bases_company_id_idx ON knowledge_bases (company_id);
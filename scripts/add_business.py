@@ -9,6 +9,8 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../b
 from app.core.config import settings
 from app.services.supabase_service import SupabaseService
 from app.services.rag_service import RAGService
+from app.services.ingestion_service import IngestionService
+from app.services.tenant_cache import request_invalidation
 
 async def add_business():
     print("--- Add New Business ---")
@@ -16,6 +18,7 @@ async def add_business():
     # Initialize services
     supabase_service = SupabaseService()
     rag_service = RAGService()
+    ingestion_service = IngestionService(rag_service, supabase_service)
 
     # Get company details
     company_name = input("Enter Company Name: ")
@@ -28,6 +31,8 @@ async def add_business():
     if company:
         company_id = company['id']
         print(f"Company '{company_name}' added successfully with ID: {company_id}")
+        # The backend may have remembered the token as unregistered.
+        request_invalidation(bot_token=telegram_bot_token)
         print("\n--- Enter Knowledge Base Content ---")
         print("Type 'END_KNOWLEDGE' on a new line to finish.")
 
@@ -41,14 +46,12 @@ async def add_business():
         knowledge_content = "\n".join(knowledge_content_lines).strip()
 
         if knowledge_content:
-            print("\nGenerating embedding for knowledge base...")
-            embedding = rag_service.generate_embedding(knowledge_content)
+            print("\nChunking and embedding knowledge base...")
+            inserted = ingestion_service.ingest_text(company_id, knowledge_content)
             
-            print("Adding knowledge base entry...")
-            knowledge_entry = supabase_service.add_knowledge_base_entry(company_id, knowledge_content, embedding)
-            
-            if knowledge_entry:
-                print(f"Knowledge base added successfully for {company_name}.")
+            if inserted:
+                print(f"Knowledge base added successfully for {company_name} ({inserted} chunks).")
+                request_invalidation(company_id=company_id, bot_token=telegram_bot_token)
             else:
                 print("Failed to add knowledge base entry.")
         else:
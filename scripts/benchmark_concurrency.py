@@ -0,0 +1,157 @@
+"""
+Measures handle_message throughput under concurrent load, first with
+ASYNC_PIPELINE off (every blocking call runs on the event loop) and then on
+(database and embedding work offloaded, Gemini called with generate_content_async).
+
+Database and Gemini calls are replaced with fakes of fixed latency so the
+numbers are reproducible; the embedding model is the real one. "p50 1st" is
+the time until the first reply is sent, which streaming (STREAM_RESPONSES)
+brings forward to the first LLM chunk.
+
+Usage:
+    python scripts/benchmark_concurrency.py --messages 200 --concurrency 50 --db-latency 0.05 --llm-latency 1.0
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend')))
+
+from dotenv import load_dotenv
+load_dotenv(os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend/.env')))
+
+from app.core.config import settings
+from app.bot import handler
+from app.services.rag_service import rag_service
+from app.services.vector_index import TenantVectorIndex
+
+TENANT = {
+    'company': {'id': 'bench-company', 'name': 'Benchmark Ltd.'},
+    'subscription': {'id': 'bench-subscription', 'plan_id': 'bench-plan', 'start_date': '', 'end_date': ''},
+    'plan': {'id': 'bench-plan', 'token_limit': 10**12},
+}
+
+class FakeLLM:
+    """Stands in for genai.GenerativeModel with a fixed response time."""
+    def __init__(self, latency: float, chunks: int = 5):
+        self.latency = latency
+        self.chunks = chunks
+
+    def _response(self, text="Benchmark answer."):
+        return SimpleNamespace(text=text, usage_metadata=SimpleNamespace(total_token_count=250))
+
+    def generate_content(self, prompt, stream=False):
+        if stream:
+            return self._stream_sync()
+        time.sleep(self.latency)
+        return self._response()
+
+    def _stream_sync(self):
+        for i in range(self.chunks):
+            time.sleep(self.latency / self.chunks)
+            yield self._response(f"part {i} ")
+
+    async def generate_content_async(self, prompt, stream=False):
+        if stream:
+            return self._stream()
+        await asyncio.sleep(self.latency)
+        return self._response()
+
+    async def _stream(self):
+        for i in range(self.chunks):
+            await asyncio.sleep(self.latency / self.chunks)
+            yield self._response(f"part {i} ")
+
+class FakeMessage:
+    """Stands in for telegram.Message; replies and edits are no-ops."""
+    def __init__(self, text: str = "", chat_id: int = 0):
+        self.text = text
+        self.chat_id = chat_id
+        self.first_reply_at = None
+
+    async def reply_text(self, text):
+        if self.first_reply_at is None:
+            self.first_reply_at = time.perf_counter()
+        return FakeMessage(text, self.chat_id)
+
+    async def edit_text(self, text):
+        self.text = text
+        return self
+
+def fake_update(text: str, chat_id: int):
+    return SimpleNamespace(message=FakeMessage(text, chat_id)), SimpleNamespace(bot=SimpleNamespace(token='bench-token'))
+
+async def run_load(messages: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    first_replies = []
+
+    async def one(i: int):
+        async with semaphore:
+            update, context = fake_update(f"What are your delivery times? #{i}", i)
+            start = time.perf_counter()
+            await handler.handle_message(update, context)
+            latencies.append(time.perf_counter() - start)
+            first_replies.append(update.message.first_reply_at - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(messages)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'messages_per_second': messages / elapsed,
+        'wall_seconds': elapsed,
+        'p50_seconds': statistics.median(latencies),
+        'p95_seconds': latencies[int(0.95 * (len(latencies) - 1))],
+        'p50_first_reply_seconds': statistics.median(first_replies),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--db-latency', type=float, default=0.05, help="Seconds per fake database round trip")
+    parser.add_argument('--llm-latency', type=float, default=1.0, help="Seconds per fake Gemini call")
+    parser.add_argument('--kb-size', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    index = TenantVectorIndex.from_rows(
+        {'id': i, 'content': f"Knowledge entry {i}", 'embedding': rng.normal(size=384).tolist()}
+        for i in range(args.kb_size)
+    )
+
+    def slow(value):
+        def call(*_, **__):
+            time.sleep(args.db_latency)
+            return value
+        return call
+
+    with mock.patch.object(handler.tenant_cache, 'get', slow(TENANT)), \
+         mock.patch.object(handler.usage_service, 'has_exceeded_limit', slow(False)), \
+         mock.patch.object(handler.usage_service, 'record_usage', lambda **_: None), \
+         mock.patch.object(handler.vector_index_registry, 'get', slow(index)), \
+         mock.patch.object(rag_service, 'llm', FakeLLM(args.llm_latency)):
+        results = {}
+        for mode in (False, True):
+            settings.ASYNC_PIPELINE = mode
+            results[mode] = asyncio.run(run_load(args.messages, args.concurrency))
+
+    print(f"{args.messages} messages, concurrency {args.concurrency}, db latency {args.db_latency}s, llm latency {args.llm_latency}s")
+    print(f"STREAM_RESPONSES={settings.STREAM_RESPONSES}")
+    print(f"{'mode':<10}{'msg/s':>10}{'wall s':>10}{'p50 s':>10}{'p95 s':>10}{'p50 1st':>10}")
+    for mode, label in ((False, 'blocking'), (True, 'async')):
+        r = results[mode]
+        print(f"{label:<10}{r['messages_per_second']:>10.2f}{r['wall_seconds']:>10.2f}{r['p50_seconds']:>10.3f}{r['p95_seconds']:>10.3f}{r['p50_first_reply_seconds']:>10.3f}")
+    print(f"speedup: {results[True]['messages_per_second'] / results[False]['messages_per_second']:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Measures the conversation memory (app/services/conversation_store.py): the
+cost of recording a turn and reading a chat's history, the memory held per
+chat (the store's own estimate and what tracemalloc sees), and how many
+database inserts the batched writes need. The database is replaced by a
+counter, with --db-latency per insert.
+
+Usage:
+    python scripts/benchmark_conversations.py [--chats 10000] [--turns 6] [--answer-chars 400]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend')))
+
+from dotenv import load_dotenv
+load_dotenv(os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend/.env')))
+
+from app.core.config import settings
+from app.services.conversation_store import ConversationStore, retrieval_query
+from app.services.supabase_service import supabase_service
+
+class CountingInserts:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.inserts = 0
+        self.rows = 0
+
+    def __call__(self, rows):
+        time.sleep(self.latency)
+        self.inserts += 1
+        self.rows += len(rows)
+        return True
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chats', type=int, default=10000)
+    parser.add_argument('--turns', type=int, default=6, help="Turns recorded per chat")
+    parser.add_argument('--question-chars', type=int, default=60)
+    parser.add_argument('--answer-chars', type=int, default=400)
+    parser.add_argument('--db-latency', type=float, default=0.02)
+    args = parser.parse_args()
+
+    store = ConversationStore(
+        max_turns=settings.CONVERSATION_MAX_TURNS,
+        idle_ttl_seconds=settings.CONVERSATION_IDLE_TTL_SECONDS,
+        max_bytes=settings.CONVERSATION_MAX_BYTES,
+        flush_interval=settings.CONVERSATION_FLUSH_INTERVAL_SECONDS,
+        max_pending=settings.CONVERSATION_FLUSH_MAX_PENDING,
+        max_unflushed=10**9,
+    )
+    inserts = CountingInserts(args.db_latency)
+    question = "q" * args.question_chars
+    answer = "a" * args.answer_chars
+    turns = args.chats * args.turns
+
+    def record_all(flush_every: int = 0):
+        for turn in range(args.turns):
+            for chat in range(args.chats):
+                # Distinct strings per turn, as real messages would be.
+                store.append('company-0', str(chat), str(chat), f"{question}{turn}", f"{answer}{turn}")
+                # The flush loop is woken once CONVERSATION_FLUSH_MAX_PENDING rows are queued.
+                if flush_every and store.stats()['pending_messages'] >= flush_every:
+                    store.flush()
+        store.flush()
+
+    # Memory only
+    with mock.patch.object(settings, 'CONVERSATION_PERSIST', False):
+        start = time.perf_counter()
+        record_all()
+        append_us = 1e6 * (time.perf_counter() - start) / turns
+        # Again under tracemalloc, which slows allocation down too much to time with it on.
+        store.clear()
+        tracemalloc.start()
+        record_all()
+        held, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    start = time.perf_counter()
+    for chat in range(args.chats):
+        retrieval_query(store.history('company-0', str(chat)), "and how long does that take?")
+    history_us = 1e6 * (time.perf_counter() - start) / args.chats
+
+    stats = store.stats()
+    print(f"{turns} turns over {args.chats} chats (memory keeps {settings.CONVERSATION_MAX_TURNS} per chat)")
+    print(f"record a turn:            {append_us:8.2f} us")
+    print(f"history + retrieval text: {history_us:8.2f} us")
+    print(f"memory estimate:          {stats['bytes'] / 1e6:8.1f} MB ({stats['bytes'] / args.chats:.0f} bytes per chat)")
+    print(f"traced allocations:       {held / 1e6:8.1f} MB ({held / args.chats:.0f} bytes per chat)")
+
+    # Batched writes
+    store.clear()
+    with mock.patch.object(settings, 'CONVERSATION_PERSIST', True), \
+         mock.patch.object(supabase_service, 'add_conversations', inserts), \
+         mock.patch.object(supabase_service, 'add_messages', inserts):
+        start = time.perf_counter()
+        record_all(flush_every=store.max_pending)
+        elapsed = time.perf_counter() - start
+    print(f"batched writes:           {inserts.rows} rows in {inserts.inserts} inserts, {elapsed:.2f}s "
+          f"(one insert per row: {inserts.rows * args.db_latency:.1f}s at {1000 * args.db_latency:.0f} ms each)")
+
+if __name__ == "__main__":
+    main()
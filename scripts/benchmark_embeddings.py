@@ -0,0 +1,110 @@
+"""
+Compares embedding backends (EMBEDDING_BACKEND=torch vs onnx) on cold start,
+per-query latency, batch throughput and peak memory, and checks that the ONNX
+vectors match the torch ones (cosine similarity per query).
+
+Each backend runs in a fresh subprocess so cold start and RSS are measured from
+a clean interpreter. Run scripts/export_onnx_model.py first for the onnx backend.
+
+Usage:
+    python scripts/benchmark_embeddings.py [--backends torch onnx] [--queries 200]
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+QUERIES = [
+    "How long does delivery to Abuja take?",
+    "Do you accept Mobile Money?",
+    "What is your return policy?",
+    "Where is your headquarters located?",
+    "Can I pick up my order in Lagos?",
+    "Is there a warranty on leather shoes?",
+    "How do I contact customer support?",
+    "Do you offer cash on delivery in Kumasi?",
+]
+
+def run_child(backend: str, queries: int, vectors_path: str) -> None:
+    start = time.perf_counter()
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend')))
+    from dotenv import load_dotenv
+    load_dotenv(os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend/.env')))
+
+    import numpy as np
+    from app.services.embedding_backends import create_embedding_backend
+
+    model = create_embedding_backend(backend)
+    model.encode([QUERIES[0]])
+    cold_start = time.perf_counter() - start
+
+    latencies = []
+    for i in range(queries):
+        query_start = time.perf_counter()
+        model.encode([QUERIES[i % len(QUERIES)]])
+        latencies.append(time.perf_counter() - query_start)
+    latencies.sort()
+
+    batch = [QUERIES[i % len(QUERIES)] for i in range(256)]
+    batch_start = time.perf_counter()
+    model.encode(batch, batch_size=64)
+    batch_seconds = time.perf_counter() - batch_start
+
+    np.save(vectors_path, np.asarray(model.encode(QUERIES), dtype=np.float32))
+    print(json.dumps({
+        'backend': backend,
+        'cold_start_seconds': cold_start,
+        'query_p50_ms': 1000 * statistics.median(latencies),
+        'query_p95_ms': 1000 * latencies[int(0.95 * (len(latencies) - 1))],
+        'batch_texts_per_second': len(batch) / batch_seconds,
+        # ru_maxrss is reported in kilobytes on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', nargs='+', default=['torch', 'onnx'])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--vectors', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.queries, args.vectors)
+        return
+
+    import numpy as np
+
+    results, vectors = [], {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in args.backends:
+            vectors_path = os.path.join(tmp, f"{backend}.npy")
+            completed = subprocess.run(
+                [sys.executable, __file__, '--child', backend, '--queries', str(args.queries), '--vectors', vectors_path],
+                capture_output=True, text=True,
+            )
+            if completed.returncode != 0:
+                print(f"{backend}: failed\n{completed.stderr.strip().splitlines()[-1] if completed.stderr else ''}")
+                continue
+            results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+            vectors[backend] = np.load(vectors_path)
+
+    print(f"{'backend':<10}{'cold s':>10}{'p50 ms':>10}{'p95 ms':>10}{'batch/s':>10}{'RSS MB':>10}")
+    for r in results:
+        print(f"{r['backend']:<10}{r['cold_start_seconds']:>10.2f}{r['query_p50_ms']:>10.2f}{r['query_p95_ms']:>10.2f}"
+              f"{r['batch_texts_per_second']:>10.0f}{r['peak_rss_mb']:>10.0f}")
+
+    if 'torch' in vectors:
+        for backend, other in vectors.items():
+            if backend == 'torch':
+                continue
+            similarity = np.sum(vectors['torch'] * other, axis=1)
+            print(f"{backend} vs torch cosine similarity: min {similarity.min():.4f}, mean {similarity.mean():.4f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Hit quality and latency of hybrid retrieval (BM25 shortlist, dense re-scoring,
+reciprocal rank fusion) against dense-only search, on a synthetic product
+catalog: products with SKUs in several cities, and branches with phone numbers.
+
+Queries name a SKU, a branch phone number, or a product and a city, and each
+has a known set of relevant rows. Reports hit@k (a relevant row in the top k),
+MRR over the CONTEXT_CANDIDATES results, and per-query latency for dense-only
+search (exact, and IVF once the catalog reaches ANN_MIN_ENTRIES) and hybrid.
+
+--encoder model embeds with the configured embedding backend. --encoder lsa
+uses TF-IDF + truncated SVD (scikit-learn) fitted on the catalog: a stand-in
+with no model download that, like a sentence embedding, captures topic words
+and blurs rare exact tokens.
+
+Usage:
+    python scripts/benchmark_hybrid_search.py [--sizes 2000 20000] [--queries 300] [--encoder model|lsa]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List, Set, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend')))
+
+from dotenv import load_dotenv
+load_dotenv(os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend/.env')))
+
+from app.core.config import settings
+
+settings.ANN_INDEX_DIR = ""
+
+from app.services.vector_index import TenantVectorIndex
+
+BRANDS = ["Nova", "Zenith", "Apex", "Kora", "Luma", "Orin", "Sahel", "Tera", "Volt", "Yara"]
+PRODUCTS = ["blender", "rice cooker", "standing fan", "air conditioner", "microwave", "pressing iron",
+            "water dispenser", "deep freezer", "television", "inverter battery", "solar panel", "gas cooker"]
+CITIES = ["Lagos", "Abuja", "Kano", "Ibadan", "Port Harcourt", "Enugu", "Accra", "Kumasi", "Benin City", "Jos"]
+
+def synthetic_catalog(size: int, rng: np.random.Generator) -> Tuple[List[str], List[Tuple[str, str, Set[int]]]]:
+    """Returns the catalog rows and (kind, query, relevant row positions) triples."""
+    rows, queries = [], []
+    by_product_city: Dict[Tuple[str, str], Set[int]] = {}
+    branches = max(size // 50, len(CITIES))
+    for i in range(branches):
+        city = CITIES[i % len(CITIES)]
+        phone = f"0{rng.integers(700, 910)}-{rng.integers(100, 1000)}-{rng.integers(1000, 10000)}"
+        rows.append(f"Our {city} branch {i} is open Monday to Saturday, 9am to 6pm. Call {phone} for orders and repairs.")
+        queries.append(('phone', f"Which branch answers {phone}?", {i}))
+    for i in range(branches, size):
+        brand, product, city = BRANDS[rng.integers(len(BRANDS))], PRODUCTS[rng.integers(len(PRODUCTS))], CITIES[rng.integers(len(CITIES))]
+        sku = f"{brand[:2].upper()}-{rng.integers(10000, 100000)}"
+        rows.append(f"The {brand} {product} (SKU {sku}) costs {rng.integers(20, 900) * 1000} naira and is in stock at our {city} store.")
+        queries.append(('sku', f"Is {sku} still available?", {i}))
+        by_product_city.setdefault((product, city), set()).add(i)
+    for (product, city), relevant in by_product_city.items():
+        queries.append(('product+city', f"Can I buy a {product} in {city}?", relevant))
+    return rows, queries
+
+def lsa_encoder(rows: List[str], dim: int) -> Callable[[List[str]], np.ndarray]:
+    from sklearn.decomposition import TruncatedSVD
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    vectorizer = TfidfVectorizer(sublinear_tf=True)
+    matrix = vectorizer.fit_transform(rows)
+    svd = TruncatedSVD(n_components=min(dim, matrix.shape[1] - 1), random_state=0).fit(matrix)
+    return lambda texts: svd.transform(vectorizer.transform(texts)).astype(np.float32)
+
+def model_encoder() -> Callable[[List[str]], np.ndarray]:
+    from app.services.rag_service import rag_service
+    return lambda texts: np.asarray(rag_service.embedding_backend.encode(texts), dtype=np.float32)
+
+def evaluate(search: Callable[[np.ndarray, str], List[Dict[str, Any]]], queries, embeddings, hit_k: int) -> Dict[str, Any]:
+    by_kind: Dict[str, List[Tuple[bool, float]]] = {}
+    latencies = []
+    for (kind, text, relevant), embedding in zip(queries, embeddings):
+        start = time.perf_counter()
+        results = search(embedding, text)
+        latencies.append(time.perf_counter() - start)
+        ranks = [rank for rank, hit in enumerate(results) if hit['id'] in relevant]
+        by_kind.setdefault(kind, []).append((bool(ranks) and ranks[0] < hit_k, 1 / (ranks[0] + 1) if ranks else 0.0))
+    latencies.sort()
+    return {
+        'p50_ms': 1000 * statistics.median(latencies),
+        'p95_ms': 1000 * latencies[int(0.95 * (len(latencies) - 1))],
+        'kinds': {kind: (sum(hit for hit, _ in scores) / len(scores), sum(rr for _, rr in scores) / len(scores))
+                  for kind, scores in by_kind.items()},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[2000, 20000])
+    parser.add_argument('--queries', type=int, default=300, help="Queries per kind")
+    parser.add_argument('--encoder', choices=['model', 'lsa'], default='model')
+    parser.add_argument('--dim', type=int, default=384, help="Dimensions of the lsa encoder")
+    parser.add_argument('--hit-k', type=int, default=settings.CONTEXT_MAX_PASSAGES)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    top_k = settings.CONTEXT_CANDIDATES
+    print(f"hit@{args.hit_k} and MRR@{top_k}; encoder {args.encoder}; IVF from {settings.ANN_MIN_ENTRIES} rows")
+    for size in args.sizes:
+        rows, queries = synthetic_catalog(size, rng)
+        encode = lsa_encoder(rows, args.dim) if args.encoder == 'lsa' else model_encoder()
+        vectors = encode(rows)
+        sample = []
+        for kind in ('sku', 'phone', 'product+city'):
+            of_kind = [query for query in queries if query[0] == kind]
+            sample += [of_kind[i] for i in rng.permutation(len(of_kind))[:args.queries]]
+        query_vectors = encode([text for _, text, _ in sample])
+
+        start = time.perf_counter()
+        index = TenantVectorIndex.from_rows({'id': i, 'content': row, 'embedding': vectors[i]} for i, row in enumerate(rows))
+        build_seconds = time.perf_counter() - start
+        print(f"\n{size} rows: index built in {build_seconds:.2f}s ({'IVF' if index.uses_ann else 'exact'} dense), "
+              f"BM25 {index.lexical.terms} terms, {index.lexical.nbytes / 1e6:.1f} MB")
+
+        modes = {'dense exact': lambda q, text: index.search(q, top_k, exact=True)}
+        if index.uses_ann:
+            modes['dense IVF'] = lambda q, text: index.search(q, top_k)
+        modes['hybrid'] = lambda q, text: index.search(q, top_k, query_text=text)
+
+        kinds = ('sku', 'phone', 'product+city')
+        print(f"{'search':<13}{'p50 ms':>8}{'p95 ms':>8}" + "".join(f"{kind + ' hit/MRR':>24}" for kind in kinds))
+        for name, search in modes.items():
+            result = evaluate(search, sample, query_vectors, args.hit_k)
+            print(f"{name:<13}{result['p50_ms']:>8.2f}{result['p95_ms']:>8.2f}" +
+                  "".join(f"{result['kinds'][kind][0]:>17.2f} / {result['kinds'][kind][1]:.2f}" for kind in kinds))
+
+if __name__ == "__main__":
+    main()
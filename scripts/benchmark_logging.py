@@ -0,0 +1,95 @@
+"""
+Measures what a log call costs the thread that makes it (in the bot, the event
+loop) with the previous synchronous setup (console and bot.log handlers on the
+root logger) and with app/core/logging_config.py (bounded queue, writer thread,
+rotation, truncation). Console output goes to a temporary file in both cases.
+--disk-latency-ms adds a sleep to every handler flush to stand in for a slow
+or contended disk.
+
+Usage:
+    python scripts/benchmark_logging.py [--iterations 5000] [--payload-chars 4000] [--disk-latency-ms 0]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend')))
+
+from dotenv import load_dotenv
+load_dotenv(os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend/.env')))
+
+from app.core import logging_config
+from app.core.tracing import TraceIdFilter, new_trace_id
+
+logger = logging.getLogger("benchmark")
+
+def per_call_us(message: str, iterations: int) -> float:
+    start = time.perf_counter()
+    for i in range(iterations):
+        logger.info(f"{message} {i}")
+    return 1e6 * (time.perf_counter() - start) / iterations
+
+def configure_sync(log_file: str) -> None:
+    """The logging setup main.py used before: both handlers write on the calling thread."""
+    formatter = logging.Formatter(logging_config.LOG_FORMAT)
+    trace_id_filter = TraceIdFilter()
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    for handler in (logging.StreamHandler(), logging.FileHandler(log_file)):
+        handler.setFormatter(formatter)
+        handler.addFilter(trace_id_filter)
+        root.addHandler(handler)
+
+def reset_root() -> None:
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        handler.close()
+        root.removeHandler(handler)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=5000,
+                        help="log calls per case; keep below LOG_QUEUE_SIZE so no records are dropped")
+    parser.add_argument('--payload-chars', type=int, default=4000, help="size of the large message (a full Gemini answer)")
+    parser.add_argument('--disk-latency-ms', type=float, default=0.0, help="simulated delay per handler flush")
+    args = parser.parse_args()
+
+    if args.disk_latency_ms:
+        flush = logging.StreamHandler.flush
+        def slow_flush(handler):
+            time.sleep(args.disk_latency_ms / 1000)
+            flush(handler)
+        logging.StreamHandler.flush = slow_flush
+
+    directory = tempfile.mkdtemp(prefix="benchmark_logging_")
+    sys.stderr = open(os.path.join(directory, "console.log"), "w")
+    new_trace_id()
+    cases = {'short message': "Replied to chat_id 12345 for company Acme", 'large payload': "x" * args.payload_chars}
+    results = {}
+
+    configure_sync(os.path.join(directory, "sync.log"))
+    for name, message in cases.items():
+        results[(name, 'sync')] = per_call_us(message, args.iterations)
+    reset_root()
+
+    logging_config.configure_logging(os.path.join(directory, "queued.log"))
+    for name, message in cases.items():
+        results[(name, 'queued')] = per_call_us(message, args.iterations)
+    start = time.perf_counter()
+    logging_config.stop_logging()
+    drain_ms = 1000 * (time.perf_counter() - start)
+    reset_root()
+
+    sys.stderr = sys.__stderr__
+    print(f"{'case':<16}{'sync us/call':>14}{'queued us/call':>16}")
+    for name in cases:
+        print(f"{name:<16}{results[(name, 'sync')]:>14.1f}{results[(name, 'queued')]:>16.1f}")
+    print(f"\nwriter thread drained the remaining queue in {drain_ms:.0f}ms; "
+          f"{logging_config.dropped_records()} records dropped")
+    print(f"log files in {directory}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Throughput scaling of the pre-fork serving mode (app/prefork.py) across worker
+counts. For each count the server runs in a subprocess with the load test fakes
+(scripts/load_test_webhooks.py) patched in before forking, so every worker uses
+them. The Telegram Bot API fake runs here, over local HTTP, and a message counts
+as done when its reply arrives. By default the fake embedder spins for
+--embed-cpu-ms per call, standing in for model inference; --real-embeddings
+loads the configured model in the supervisor instead.
+
+Reports messages/second, end to end p50/p99 and the resident (RSS) and
+proportional (PSS, shared pages split between processes) memory of all server
+processes. Set --workers to the core counts to compare; more workers than cores
+adds no throughput.
+
+Usage:
+    python scripts/benchmark_prefork.py --workers 1 2 4 8 [--messages 400] [--concurrency 64]
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+# Set before the app is imported, here and in the server subprocess.
+os.environ.update({'LOG_FILE': "", 'LOG_LEVEL': "WARNING", 'STREAM_RESPONSES': "false", 'ANSWER_CACHE_ENABLED': "false"})
+
+import httpx
+
+from load_test_webhooks import (FakeBotApi, FakeEmbeddingBackend, FakeLLM, FakeSupabase, LocalBotApiServer,
+                                service_patches, synthetic_update, _percentile)
+
+class CompletionBotApi(FakeBotApi):
+    """Signals the waiting request when a chat's reply is sent."""
+    def __init__(self, latency: float):
+        super().__init__(latency)
+        self.waiting: Dict[int, asyncio.Event] = {}
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        result = await super().do_request(url, method, request_data)
+        if url.endswith('/sendMessage'):
+            event = self.waiting.get(int(request_data.parameters.get('chat_id', 0)))
+            if event is not None:
+                event.set()
+        return result
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def process_tree(pid: int) -> List[int]:
+    pids = [pid]
+    for child in open(f"/proc/{pid}/task/{pid}/children").read().split():
+        pids.extend(process_tree(int(child)))
+    return pids
+
+def memory_mb(pid: int) -> Dict[str, float]:
+    """RSS and PSS of a process and its descendants, from /proc/<pid>/smaps_rollup."""
+    totals = {'rss_mb': 0.0, 'pss_mb': 0.0}
+    for process in process_tree(pid):
+        for line in open(f"/proc/{process}/smaps_rollup"):
+            field, value = line.split(':', 1)
+            if field in ('Rss', 'Pss'):
+                totals[f"{field.lower()}_mb"] += int(value.split()[0]) / 1024
+    return totals
+
+def serve(args) -> None:
+    """Subprocess: runs the pre-fork server with the fakes patched in."""
+    from app.core.config import settings
+    from app import prefork
+
+    settings.TELEGRAM_BASE_URL = args.bot_api_url
+    embedder = None if args.real_embeddings else FakeEmbeddingBackend(args.embed_cpu_ms / 1000, busy=True)
+    fake_db = FakeSupabase(args.tenants, args.kb_size, args.db_latency, FakeEmbeddingBackend(0.0))
+    with contextlib.ExitStack() as stack:
+        for patch in service_patches(fake_db, FakeLLM(args.llm_latency), embedder):
+            stack.enter_context(patch)
+        prefork.serve('127.0.0.1', args.port, args.workers[0], args.socket_dir)
+
+async def send_messages(client: httpx.AsyncClient, api: CompletionBotApi, tokens: List[str], count: int,
+                        concurrency: int, first_update_id: int) -> List[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    durations = []
+
+    async def one(i: int):
+        update_id = first_update_id + i
+        async with semaphore:
+            api.waiting[update_id] = asyncio.Event()
+            start = time.perf_counter()
+            while (await client.post(f"/webhook/{tokens[i % len(tokens)]}",
+                                     json=synthetic_update(update_id, update_id, f"Question {update_id}"))).status_code != 200:
+                await asyncio.sleep(0.1)
+            await api.waiting[update_id].wait()
+            durations.append(time.perf_counter() - start)
+            api.waiting.pop(update_id)
+
+    await asyncio.gather(*(one(i) for i in range(count)))
+    return durations
+
+async def run_workers(args, workers: int) -> Dict[str, Any]:
+    api = CompletionBotApi(args.bot_api_latency)
+    bot_api_server = LocalBotApiServer(api, connect_latency=0.0)
+    await bot_api_server.start()
+    port = free_port()
+    command = [sys.executable, os.path.abspath(__file__), '--serve', '--workers', str(workers), '--port', str(port),
+               '--bot-api-url', bot_api_server.base_url, '--socket-dir', tempfile.mkdtemp(prefix="prefork_"),
+               '--tenants', str(args.tenants), '--kb-size', str(args.kb_size), '--embed-cpu-ms', str(args.embed_cpu_ms),
+               '--llm-latency', str(args.llm_latency), '--db-latency', str(args.db_latency)]
+    if args.real_embeddings:
+        command.append('--real-embeddings')
+    server = subprocess.Popen(command)
+    tokens = [f"{100000 + i}:LOADTEST{i:04d}" for i in range(args.tenants)]
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60.0) as client:
+            for i in range(workers):
+                while True:
+                    with contextlib.suppress(httpx.TransportError):
+                        if (await client.get(f"/worker/{i}/")).status_code == 200:
+                            break
+                    await asyncio.sleep(0.2)
+            # One message per tenant loads every tenant's state in its worker.
+            await send_messages(client, api, tokens, len(tokens), args.concurrency, 1)
+            start = time.perf_counter()
+            durations = sorted(await send_messages(client, api, tokens, args.messages, args.concurrency, 10**6))
+            elapsed = time.perf_counter() - start
+            memory = memory_mb(server.pid)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+        await bot_api_server.stop()
+    return {
+        'workers': workers,
+        'messages_per_second': args.messages / elapsed,
+        'p50_ms': 1000 * _percentile(durations, 0.5),
+        'p99_ms': 1000 * _percentile(durations, 0.99),
+        **memory,
+    }
+
+async def main_async(args) -> List[Dict[str, Any]]:
+    results = []
+    for workers in args.workers:
+        result = await run_workers(args, workers)
+        results.append(result)
+        print(f"{workers:>7}{result['messages_per_second']:>10.1f}{result['p50_ms']:>9.0f}{result['p99_ms']:>9.0f}"
+              f"{result['rss_mb']:>10.0f}{result['pss_mb']:>10.0f}", flush=True)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--tenants', type=int, default=40)
+    parser.add_argument('--kb-size', type=int, default=200)
+    parser.add_argument('--messages', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--embed-cpu-ms', type=float, default=20.0, help="CPU time per fake embedding call")
+    parser.add_argument('--llm-latency', type=float, default=0.2)
+    parser.add_argument('--db-latency', type=float, default=0.005)
+    parser.add_argument('--bot-api-latency', type=float, default=0.01)
+    parser.add_argument('--real-embeddings', action='store_true', help="Use the configured embedding backend")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    # Internal: run the server (started by the benchmark itself)
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--bot-api-url', help=argparse.SUPPRESS)
+    parser.add_argument('--socket-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    print(f"cores available: {len(os.sched_getaffinity(0))}")
+    print(f"{'workers':>7}{'msg/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'RSS MB':>10}{'PSS MB':>10}")
+    results = asyncio.run(main_async(args))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'config': {key: value for key, value in vars(args).items() if key != 'output'}, 'results': results},
+                      f, indent=2)
+        print(f"\nWrote {args.output}")
+
+if __name__ == "__main__":
+    main()
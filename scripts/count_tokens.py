@@ -1,10 +1,21 @@
 import google.generativeai as genai
 import os
+import sys
 from dotenv import load_dotenv
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend')))
+
 # Load environment variables from backend/.env
 load_dotenv(dotenv_path='backend/.env')
 
+from app.core.config import settings
+from app.services.context_builder import estimate_llm_tokens
+
+# Compares Gemini's exact token counts with the offline estimate used for context
+# budgets. Pass text files to calibrate on your own knowledge base; the suggested
+# LLM_TOKEN_ESTIMATE_SCALE makes the estimate match the exact total.
+SAMPLE_TEXT = "We deliver to Nigeria,  but the provided text doesn't specify delivery to Abuja.  Shipping within Ghana and Nigeria takes 1–3 business days.  Customer support is available 24/7 via WhatsApp, Telegram, email (support@urbanstep.com), and phone (+233 550 123 456)."
+
 api_key = os.getenv("GOOGLE_API_KEY")
 
 if not api_key:
@@ -12,8 +23,23 @@ if not api_key:
 else:
     genai.configure(api_key=api_key)
     model = genai.GenerativeModel('gemini-1.5-flash')
-    
-    text = "We deliver to Nigeria,  but the provided text doesn't specify delivery to Abuja.  Shipping within Ghana and Nigeria takes 1–3 business days.  Customer support is available 24/7 via WhatsApp, Telegram, email (support@urbanstep.com), and phone (+233 550 123 456)."
-    token_count = model.count_tokens(text)
-    
-    print(f"The exact token count for the phrase ''{text}'' is: {token_count.total_tokens}")
+
+    texts = [SAMPLE_TEXT]
+    for path in sys.argv[1:]:
+        with open(path, encoding='utf-8') as f:
+            texts.extend(paragraph for paragraph in f.read().split("\n\n") if paragraph.strip())
+
+    exact_total, estimate_total = 0, 0
+    for text in texts:
+        exact = model.count_tokens(text).total_tokens
+        estimate = estimate_llm_tokens(text)
+        exact_total += exact
+        estimate_total += estimate
+        if text is SAMPLE_TEXT:
+            print(f"The exact token count for the phrase ''{text}'' is: {exact} (estimated {estimate})")
+
+    # The estimate already includes the current scale, so fold it back in.
+    suggested_scale = settings.LLM_TOKEN_ESTIMATE_SCALE * exact_total / estimate_total
+    print(f"{len(texts)} texts: {exact_total} exact tokens, {estimate_total} estimated "
+          f"(ratio {exact_total / estimate_total:.3f})")
+    print(f"Suggested LLM_TOKEN_ESTIMATE_SCALE={suggested_scale:.2f}")
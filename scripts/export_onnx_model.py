@@ -0,0 +1,75 @@
+"""
+Exports the embedding model to ONNX for EMBEDDING_BACKEND=onnx, writing an fp32
+model.onnx, a dynamically int8-quantized model_int8.onnx and tokenizer.json
+into EMBEDDING_ONNX_DIR (or --output).
+
+Needs the export-time packages on top of requirements.txt:
+    pip install onnx onnxruntime tokenizers
+
+Usage:
+    python scripts/export_onnx_model.py [--output backend/models/all-MiniLM-L6-v2-onnx]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend')))
+
+from dotenv import load_dotenv
+load_dotenv(os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend/.env')))
+
+from app.core.config import settings
+
+def export(output_dir: str) -> None:
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(output_dir, exist_ok=True)
+    model = SentenceTransformer(settings.EMBEDDING_MODEL_NAME, device='cpu')
+    tokenizer = model.tokenizer
+
+    class TokenEmbeddings(torch.nn.Module):
+        """Exposes the transformer with keyword inputs and the token embeddings as the only output."""
+        def __init__(self, auto_model):
+            super().__init__()
+            self.auto_model = auto_model
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.auto_model(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids).last_hidden_state
+
+    transformer = TokenEmbeddings(model[0].auto_model).eval()
+
+    print(f"Exporting {settings.EMBEDDING_MODEL_NAME} to {output_dir}...")
+    sample = tokenizer(["An example sentence to trace the model."], return_tensors='pt')
+    fp32_path = os.path.join(output_dir, 'model.onnx')
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            (sample['input_ids'], sample['attention_mask'], sample['token_type_ids']),
+            fp32_path,
+            input_names=['input_ids', 'attention_mask', 'token_type_ids'],
+            output_names=['last_hidden_state'],
+            dynamic_axes={
+                'input_ids': {0: 'batch', 1: 'sequence'},
+                'attention_mask': {0: 'batch', 1: 'sequence'},
+                'token_type_ids': {0: 'batch', 1: 'sequence'},
+                'last_hidden_state': {0: 'batch', 1: 'sequence'},
+            },
+            opset_version=14,
+            # The TorchScript exporter handles dynamic_axes without extra dependencies.
+            dynamo=False,
+        )
+
+    print("Quantizing weights to int8...")
+    quantize_dynamic(fp32_path, os.path.join(output_dir, 'model_int8.onnx'), weight_type=QuantType.QInt8)
+
+    # The fast tokenizer's tokenizer.json is what the runtime backend loads.
+    tokenizer.backend_tokenizer.save(os.path.join(output_dir, 'tokenizer.json'))
+    print("Done. Set EMBEDDING_BACKEND=onnx to use it (EMBEDDING_ONNX_FILE=model.onnx for the fp32 model).")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the embedding model to ONNX.")
+    parser.add_argument('--output', default=settings.EMBEDDING_ONNX_DIR)
+    args = parser.parse_args()
+    export(os.path.abspath(args.output))
@@ -0,0 +1,589 @@
+"""
+Offline end-to-end load test of the webhook pipeline. Synthetic Telegram
+updates for many tenants are POSTed to /webhook/{token} on the FastAPI app
+in-process (lifespan, dispatcher and handler included). Local fakes stand in
+for the external services:
+
+  * Supabase: every SupabaseService call sleeps for --db-latency
+  * Gemini: a streamed answer that takes --llm-latency
+  * Telegram Bot API: every call sleeps for --bot-api-latency
+  * Embeddings: deterministic hashed vectors (--real-embeddings uses the model)
+
+With --bot-api-server the Bot API fake is served over HTTP/1.1 on 127.0.0.1 and
+the bots use their real HTTPX clients, so connection counts can be compared
+between --pool shared (SHARED_HTTP_POOL) and --pool per-bot. The first request
+on each connection waits --connect-latency extra, standing in for TCP and TLS setup.
+
+With --repeat-questions every tenant gets the same few questions verbatim, so
+identical requests overlap and share Gemini calls (LLM_COALESCING_ENABLED);
+set ANSWER_CACHE_ENABLED=false to see coalescing without the answer cache.
+With --direct-answers every tenant also gets direct-answer entries for some of
+those questions (DIRECT_ANSWERS_ENABLED), which are replied to without Gemini;
+together with --repeat-questions they match exactly.
+With --priorities N tenants are spread over N plans with llm_priority 0 to N-1.
+Past LLM_MAX_CONCURRENCY + LLM_QUEUE_MAX_WAITING messages in flight, LLM calls
+are shed (lowest priority first) and answered with the "try again" reply.
+
+For each concurrency level (messages in flight), reports messages/second and
+p50/p95/p99 per stage: tenant lookup, usage check, KB fetch, embed, search,
+LLM, reply and end to end (webhook received to handler done), and how many
+replies came from the LLM, the answer cache or a direct answer. Caches are
+cleared between levels. Results are written as JSON for comparison across
+commits.
+
+Usage:
+    python scripts/load_test_webhooks.py --tenants 20 --messages 500 --concurrency 1 10 50 --output load_test.json
+    python scripts/load_test_webhooks.py --tenants 200 --bot-api-server --pool per-bot
+    ANSWER_CACHE_ENABLED=false python scripts/load_test_webhooks.py --tenants 2 --repeat-questions
+    python scripts/load_test_webhooks.py --repeat-questions --direct-answers
+    python scripts/load_test_webhooks.py --tenants 6 --messages 600 --concurrency 200 --priorities 3
+"""
+import argparse
+import asyncio
+import contextlib
+import functools
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import zlib
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Any, Dict, List
+from unittest import mock
+from urllib.parse import parse_qs
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend')))
+
+from dotenv import load_dotenv
+load_dotenv(os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend/.env')))
+
+import httpx
+from telegram.request import BaseRequest
+
+from app.core.config import settings
+
+# Local runs must not touch the snapshot and IVF directories of a real deployment.
+settings.VECTOR_SNAPSHOT_DIR = ""
+settings.ANN_INDEX_DIR = ""
+# Synthetic traffic bursts far above per-company rate limits; measure the pipeline, not the limits.
+settings.ADMISSION_CONTROL_ENABLED = False
+
+from app.main import app
+from app.bot import bootstrap, handler
+from app.bot.streaming import ProgressiveReply
+from app.core.concurrency import llm_limiter
+from app.services.answer_cache import answer_cache
+from app.services.answer_router import answer_router, DIRECT_ANSWER
+from app.services.llm_coalescer import llm_coalescer
+from app.services.rag_service import rag_service
+from app.services.supabase_service import supabase_service
+from app.services.tenant_cache import tenant_cache
+from app.services.usage_service import usage_service
+from app.services.vector_index import vector_index_registry
+
+STAGES = ['tenant_lookup', 'usage_check', 'kb_fetch', 'embed', 'search', 'llm', 'reply', 'end_to_end']
+QUESTIONS = [
+    "How long does delivery to {city} take?",
+    "Do you accept mobile money in {city}?",
+    "What is your return policy for orders from {city}?",
+    "Is there a store I can visit in {city}?",
+    "How much is shipping to {city}?",
+]
+CITIES = ["Accra", "Lagos", "Abuja", "Kumasi", "Tema", "Ibadan", "Kano", "Takoradi"]
+
+# --- Fakes ---
+class FakeEmbeddingBackend:
+    """
+    Deterministic unit vectors derived from a hash of each text. With busy, each
+    call spins for latency seconds (holding the GIL, like model inference) instead of sleeping.
+    """
+    name = "fake"
+
+    def __init__(self, latency: float, dim: int = 384, busy: bool = False):
+        self.latency = latency
+        self.dim = dim
+        self.busy = busy
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        if self.busy:
+            deadline = time.perf_counter() + self.latency
+            while time.perf_counter() < deadline:
+                pass
+        else:
+            time.sleep(self.latency)
+        vectors = np.stack([np.random.default_rng(zlib.crc32(text.encode())).normal(size=self.dim) for text in texts])
+        return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+class FakeSupabase:
+    """The SupabaseService methods the pipeline calls, backed by in-memory tenants."""
+    def __init__(self, tenants: int, kb_size: int, latency: float, embedder: FakeEmbeddingBackend, direct_answers: bool = False,
+                 priorities: int = 1):
+        self.latency = latency
+        self.tenants: Dict[str, Dict[str, Any]] = {}
+        self.knowledge: Dict[str, List[Dict[str, Any]]] = {}
+        for i in range(tenants):
+            token = f"{100000 + i}:LOADTEST{i:04d}"
+            company = {'id': f"company-{i}", 'name': f"Load Test {i}", 'telegram_bot_token': token}
+            self.tenants[token] = {
+                'company': company,
+                'subscription': {'id': f"subscription-{i}", 'plan_id': f"plan-{i % priorities}", 'company_id': company['id'],
+                                 'start_date': '2026-01-01T00:00:00+00:00', 'end_date': '2099-01-01T00:00:00+00:00'},
+            }
+            contents = [f"{company['name']} fact {j}: orders to {CITIES[j % len(CITIES)]} arrive in {1 + j % 5} days." for j in range(kb_size)]
+            self.knowledge[company['id']] = [
+                {'id': f"{company['id']}-{j}", 'content': content, 'embedding': vector.tolist()}
+                for j, (content, vector) in enumerate(zip(contents, embedder.encode(contents)))
+            ]
+            if direct_answers:
+                # Every other question, for every city, has a stored answer.
+                questions = [question.format(city=city) for question in QUESTIONS[::2] for city in CITIES]
+                self.knowledge[company['id']] += [
+                    {'id': f"{company['id']}-direct-{j}", 'content': f"Q: {question}\nA: {company['name']} answer {j}.",
+                     'embedding': vector.tolist(), 'entry_type': DIRECT_ANSWER, 'answer': f"{company['name']} answer {j}."}
+                    for j, (question, vector) in enumerate(zip(questions, embedder.encode(questions)))
+                ]
+        self.plans = {f"plan-{priority}": {'id': f"plan-{priority}", 'name': f"Load Test {priority}", 'token_limit': 10**12,
+                                           'llm_priority': priority}
+                      for priority in range(priorities)}
+
+    def _wait(self):
+        time.sleep(self.latency)
+
+    def get_all_bot_tokens(self):
+        self._wait()
+        return list(self.tenants)
+
+    def get_company_by_telegram_bot_token(self, token):
+        self._wait()
+        tenant = self.tenants.get(token)
+        return tenant['company'] if tenant else None
+
+    def get_active_subscription_by_company_id(self, company_id):
+        self._wait()
+        return next((t['subscription'] for t in self.tenants.values() if t['company']['id'] == company_id), None)
+
+    def get_plan_by_id(self, plan_id):
+        self._wait()
+        return self.plans.get(plan_id)
+
+    def get_usage_for_subscription(self, subscription_id, start_date, end_date):
+        self._wait()
+        return 0
+
+    def add_usage_logs(self, entries):
+        self._wait()
+        return True
+
+    def add_conversations(self, conversations):
+        self._wait()
+        return True
+
+    def add_messages(self, messages):
+        self._wait()
+        return True
+
+    def get_knowledge_base_rows(self, company_id, ids=None):
+        self._wait()
+        rows = self.knowledge.get(company_id, [])
+        return [row for row in rows if ids is None or row['id'] in ids]
+
+    def get_knowledge_base_ids(self, company_id):
+        self._wait()
+        return [row['id'] for row in self.knowledge.get(company_id, [])]
+
+    def match_knowledge_bases(self, company_id, query_embedding, match_count=3, min_similarity=0.0):
+        self._wait()
+        rows = self.knowledge.get(company_id, [])
+        if not rows:
+            return []
+        matrix = np.asarray([row['embedding'] for row in rows], dtype=np.float32)
+        similarities = matrix @ np.asarray(query_embedding, dtype=np.float32)
+        return [{'id': rows[i]['id'], 'content': rows[i]['content'], 'similarity': float(similarities[i]),
+                 'direct_answer': rows[i].get('answer') if rows[i].get('entry_type') == DIRECT_ANSWER else None}
+                for i in np.argsort(-similarities)[:match_count] if similarities[i] >= min_similarity]
+
+class FakeLLM:
+    """Stands in for genai.GenerativeModel: a streamed answer spread over latency seconds."""
+    def __init__(self, latency: float, chunks: int = 5):
+        self.latency = latency
+        self.chunks = chunks
+
+    def _response(self, text):
+        return SimpleNamespace(text=text, usage_metadata=SimpleNamespace(total_token_count=250))
+
+    def generate_content(self, prompt, stream=False):
+        time.sleep(self.latency)
+        return self._response("Load test answer.")
+
+    async def generate_content_async(self, prompt, stream=False):
+        if stream:
+            return self._stream()
+        await asyncio.sleep(self.latency)
+        return self._response("Load test answer.")
+
+    async def _stream(self):
+        for i in range(self.chunks):
+            await asyncio.sleep(self.latency / self.chunks)
+            yield self._response(f"Load test answer part {i}. ")
+
+class FakeBotApi(BaseRequest):
+    """Answers Bot API calls locally after latency seconds and counts them by method."""
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls: Dict[str, int] = defaultdict(int)
+        self._message_ids = iter(range(1, 10**9))
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        await asyncio.sleep(self.latency)
+        endpoint = url.rsplit('/', 1)[-1]
+        self.calls[endpoint] += 1
+        parameters = request_data.parameters if request_data else {}
+
+        if endpoint == 'getMe':
+            bot_id = int(url.split('/bot', 1)[1].split(':', 1)[0])
+            result = {'id': bot_id, 'is_bot': True, 'first_name': 'Load Test', 'username': f"load_test_{bot_id}_bot"}
+        elif endpoint == 'getWebhookInfo':
+            result = {'url': '', 'has_custom_certificate': False, 'pending_update_count': 0}
+        elif endpoint in ('sendMessage', 'editMessageText'):
+            result = {
+                'message_id': int(parameters.get('message_id') or next(self._message_ids)),
+                'date': int(time.time()),
+                'chat': {'id': int(parameters.get('chat_id', 0)), 'type': 'private'},
+                'text': parameters.get('text', ''),
+            }
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+class LocalBotApiServer:
+    """Serves a FakeBotApi over HTTP/1.1 keep-alive connections and counts them."""
+    def __init__(self, api: FakeBotApi, connect_latency: float):
+        self.api = api
+        self.connect_latency = connect_latency
+        self.opened = 0
+        self.open = 0
+        self.peak_open = 0
+        self._server = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.sockets[0].getsockname()[1]}/bot"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, '127.0.0.1', 0)
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    def reset_peak(self):
+        self.peak_open = self.open
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.opened += 1
+        self.open += 1
+        self.peak_open = max(self.peak_open, self.open)
+        first_request = True
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode().split(' ', 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    name, value = line.decode().split(':', 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                if first_request:
+                    await asyncio.sleep(self.connect_latency)
+                    first_request = False
+                parameters = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+                _, payload = await self.api.do_request(path, method, SimpleNamespace(parameters=parameters))
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             b"Content-Length: %d\r\n\r\n%s" % (len(payload), payload))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # Idle keep-alive connections are still open when the run ends.
+            pass
+        finally:
+            self.open -= 1
+            writer.close()
+
+# --- Measurement ---
+class StageTimer:
+    """Collects durations per stage from wrapped pipeline functions."""
+    def __init__(self):
+        self.durations: Dict[str, List[float]] = defaultdict(list)
+
+    def wrap(self, stage: str, func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def timed_async(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.durations[stage].append(time.perf_counter() - start)
+            return timed_async
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.durations[stage].append(time.perf_counter() - start)
+        return timed
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        report = {}
+        for stage in STAGES:
+            values = sorted(self.durations.get(stage, []))
+            if not values:
+                continue
+            report[stage] = {
+                'count': len(values),
+                'p50_ms': 1000 * _percentile(values, 0.50),
+                'p95_ms': 1000 * _percentile(values, 0.95),
+                'p99_ms': 1000 * _percentile(values, 0.99),
+            }
+        return report
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+def synthetic_update(update_id: int, chat_id: int, text: str) -> Dict[str, Any]:
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Load'},
+            'text': text,
+        },
+    }
+
+async def run_level(client: httpx.AsyncClient, tokens: List[str], messages: int, concurrency: int,
+                    completions: Dict[int, asyncio.Event], timer: StageTimer, rng: np.random.Generator,
+                    first_update_id: int, repeat_questions: bool = False) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses: Dict[int, int] = defaultdict(int)
+
+    async def one(i: int):
+        update_id = first_update_id + i
+        token = tokens[i % len(tokens)]
+        question = QUESTIONS[rng.integers(len(QUESTIONS))].format(city=CITIES[rng.integers(len(CITIES))])
+        text = question if repeat_questions else f"{question} (#{update_id})"
+        payload = synthetic_update(update_id, chat_id=1000 + i, text=text)
+        async with semaphore:
+            completions[update_id] = asyncio.Event()
+            start = time.perf_counter()
+            response = await client.post(f"/webhook/{token}", json=payload)
+            statuses[response.status_code] += 1
+            if response.status_code == 200:
+                await completions[update_id].wait()
+                timer.durations['end_to_end'].append(time.perf_counter() - start)
+            completions.pop(update_id, None)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(messages)))
+    elapsed = time.perf_counter() - start
+    return {
+        'concurrency': concurrency,
+        'messages': messages,
+        'wall_seconds': elapsed,
+        'messages_per_second': messages / elapsed,
+        'http_statuses': dict(statuses),
+        'stages': timer.summary(),
+    }
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def service_patches(fake_db: FakeSupabase, llm: FakeLLM, embedder: FakeEmbeddingBackend | None) -> List[Any]:
+    """Patches that put the fakes in place of Supabase, Gemini and (unless None) the embedding model."""
+    patches = [
+        mock.patch.object(supabase_service, name, getattr(fake_db, name))
+        for name in ('get_all_bot_tokens', 'get_company_by_telegram_bot_token', 'get_active_subscription_by_company_id',
+                     'get_plan_by_id', 'get_usage_for_subscription', 'add_usage_logs', 'add_conversations', 'add_messages',
+                     'get_knowledge_base_rows', 'get_knowledge_base_ids', 'match_knowledge_bases')
+    ]
+    # llm and embedding_backend are cached properties: patching the instance dict avoids creating the real ones.
+    patches.append(mock.patch.dict(rag_service.__dict__, {'llm': llm}))
+    if embedder is not None:
+        patches.append(mock.patch.dict(rag_service.__dict__, {'embedding_backend': embedder}))
+    return patches
+
+async def main_async(args) -> Dict[str, Any]:
+    embedder = FakeEmbeddingBackend(args.embed_latency)
+    fake_db = FakeSupabase(args.tenants, args.kb_size, args.db_latency, embedder, args.direct_answers, args.priorities)
+    if args.direct_answers:
+        settings.DIRECT_ANSWERS_ENABLED = True
+    bot_api = FakeBotApi(args.bot_api_latency)
+    bot_api_server = None
+    if args.bot_api_server:
+        bot_api_server = LocalBotApiServer(bot_api, args.connect_latency)
+        await bot_api_server.start()
+        settings.TELEGRAM_BASE_URL = bot_api_server.base_url
+        settings.SHARED_HTTP_POOL = args.pool == 'shared'
+    timer = StageTimer()
+    completions: Dict[int, asyncio.Event] = {}
+
+    async def handle_and_signal(update, context):
+        try:
+            await original_handle_message(update, context)
+        finally:
+            event = completions.get(update.update_id)
+            if event is not None:
+                event.set()
+
+    original_handle_message = handler.handle_message
+    patches = service_patches(fake_db, FakeLLM(args.llm_latency), None if args.real_embeddings else embedder) + [
+        mock.patch.object(bootstrap, 'handle_message', handle_and_signal),
+        mock.patch.object(tenant_cache, 'get', timer.wrap('tenant_lookup', tenant_cache.get)),
+        mock.patch.object(usage_service, 'has_exceeded_limit', timer.wrap('usage_check', usage_service.has_exceeded_limit)),
+        mock.patch.object(vector_index_registry, 'get', timer.wrap('kb_fetch', vector_index_registry.get)),
+        # In database mode the RPC fetches and searches in one call.
+        mock.patch.object(rag_service, 'search_knowledge_base', timer.wrap('search', rag_service.search_knowledge_base)),
+        mock.patch.object(rag_service, 'generate_embedding_async', timer.wrap('embed', rag_service.generate_embedding_async)),
+        mock.patch.object(rag_service, 'semantic_search', timer.wrap('search', rag_service.semantic_search)),
+        mock.patch.object(rag_service, 'generate_response_with_llm_async', timer.wrap('llm', rag_service.generate_response_with_llm_async)),
+        mock.patch.object(ProgressiveReply, 'finish', timer.wrap('reply', ProgressiveReply.finish)),
+    ]
+    if bot_api_server is None:
+        patches.append(mock.patch.object(bootstrap.bot_registry, '_request', lambda: bot_api))
+
+    results = []
+    with contextlib.ExitStack() as stack:
+        for patch in patches:
+            stack.enter_context(patch)
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://load-test") as client:
+                rng = np.random.default_rng(args.seed)
+                update_id = 1
+                for concurrency in args.concurrency:
+                    tenant_cache.clear()
+                    vector_index_registry.clear()
+                    answer_cache.clear()
+                    timer.durations.clear()
+                    if bot_api_server is not None:
+                        opened_before = bot_api_server.opened
+                        bot_api_server.reset_peak()
+                    coalescing_before = llm_coalescer.stats()
+                    replies_before = answer_router.stats()['replies']
+                    shed_before = dict(llm_limiter.shed)
+                    result = await run_level(client, list(fake_db.tenants), args.messages, concurrency,
+                                             completions, timer, rng, update_id, args.repeat_questions)
+                    coalescing = llm_coalescer.stats()
+                    result['llm_calls'] = coalescing['calls'] - coalescing_before['calls']
+                    result['llm_coalesced'] = coalescing['coalesced'] - coalescing_before['coalesced']
+                    result['replies'] = {source: count - replies_before[source] for source, count in answer_router.stats()['replies'].items()}
+                    result['llm_shed_by_priority'] = {priority: count - shed_before.get(priority, 0)
+                                                      for priority, count in sorted(llm_limiter.shed.items())}
+                    if bot_api_server is not None:
+                        result['bot_api_connections'] = {
+                            'opened': bot_api_server.opened - opened_before,
+                            'peak_open': bot_api_server.peak_open,
+                        }
+                    update_id += args.messages
+                    results.append(result)
+                    end_to_end = result['stages'].get('end_to_end', {})
+                    print(f"concurrency {concurrency:>4}: {result['messages_per_second']:8.1f} msg/s, "
+                          f"end to end p50 {end_to_end.get('p50_ms', 0):.0f}ms p99 {end_to_end.get('p99_ms', 0):.0f}ms")
+
+    startup_connections = None
+    if bot_api_server is not None:
+        startup_connections = bot_api_server.opened - sum(level['bot_api_connections']['opened'] for level in results)
+        await bot_api_server.stop()
+
+    return {
+        'revision': git_revision(),
+        'config': {key: value for key, value in vars(args).items() if key != 'output'},
+        'settings': {key: getattr(settings, key) for key in (
+            'ASYNC_PIPELINE', 'WEBHOOK_FAST_ACK', 'WEBHOOK_WORKERS', 'STREAM_RESPONSES', 'ANSWER_CACHE_ENABLED',
+            'VECTOR_SEARCH_MODE', 'DB_MAX_CONCURRENCY', 'LLM_MAX_CONCURRENCY', 'SHARED_HTTP_POOL',
+            'TELEGRAM_POOL_SIZE', 'HTTP_KEEPALIVE_SECONDS', 'LLM_COALESCING_ENABLED', 'DIRECT_ANSWERS_ENABLED',
+            'LLM_QUEUE_MAX_WAITING')},
+        'bot_api_calls': dict(bot_api.calls),
+        'bot_api_startup_connections': startup_connections,
+        'levels': results,
+    }
+
+def print_table(report: Dict[str, Any]) -> None:
+    if report['bot_api_startup_connections'] is not None:
+        print(f"\nBot API connections opened at startup: {report['bot_api_startup_connections']}")
+    for level in report['levels']:
+        print(f"\nconcurrency {level['concurrency']}: {level['messages_per_second']:.1f} msg/s over {level['wall_seconds']:.1f}s, "
+              f"HTTP {level['http_statuses']}")
+        print(f"LLM calls: {level['llm_calls']}, requests coalesced onto them: {level['llm_coalesced']}")
+        replies = level['replies']
+        answered = sum(replies.values())
+        print(f"Replies: {replies['llm']} llm, {replies['cache']} cache, {replies['direct']} direct "
+              f"({(replies['cache'] + replies['direct']) / answered if answered else 0:.0%} without the LLM)")
+        shed = level['llm_shed_by_priority']
+        print(f"LLM calls shed: {sum(shed.values())}" +
+              (f" (by plan priority: {', '.join(f'{priority}: {count}' for priority, count in shed.items())})" if shed else ""))
+        if 'bot_api_connections' in level:
+            connections = level['bot_api_connections']
+            print(f"Bot API connections: {connections['opened']} opened, {connections['peak_open']} open at peak")
+        print(f"{'stage':<14}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for stage, values in level['stages'].items():
+            print(f"{stage:<14}{values['count']:>8}{values['p50_ms']:>10.1f}{values['p95_ms']:>10.1f}{values['p99_ms']:>10.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tenants', type=int, default=20)
+    parser.add_argument('--kb-size', type=int, default=200, help="Knowledge base rows per tenant")
+    parser.add_argument('--messages', type=int, default=500, help="Messages per concurrency level")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--db-latency', type=float, default=0.02, help="Seconds per fake Supabase call")
+    parser.add_argument('--llm-latency', type=float, default=0.8, help="Seconds per fake Gemini answer")
+    parser.add_argument('--bot-api-latency', type=float, default=0.05, help="Seconds per fake Bot API call")
+    parser.add_argument('--embed-latency', type=float, default=0.005, help="Seconds per fake embedding batch")
+    parser.add_argument('--bot-api-server', action='store_true', help="Serve the Bot API fake over local HTTP")
+    parser.add_argument('--pool', choices=['shared', 'per-bot'], default='shared', help="Bot API pooling with --bot-api-server")
+    parser.add_argument('--connect-latency', type=float, default=0.1, help="Extra seconds on each new Bot API connection")
+    parser.add_argument('--real-embeddings', action='store_true', help="Use the configured embedding backend")
+    parser.add_argument('--repeat-questions', action='store_true',
+                        help="Send the same few questions to every tenant (no per-message suffix), as after an announcement")
+    parser.add_argument('--direct-answers', action='store_true',
+                        help="Give every tenant direct-answer entries for some of the questions")
+    parser.add_argument('--priorities', type=int, default=1, help="Plans with distinct llm_priority values, spread over the tenants")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level)
+    report = asyncio.run(main_async(args))
+    print_table(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Backfills knowledge_bases.embedding_compact for rows written before
+COMPACT_EMBEDDINGS was enabled. Run the SQL in docs/saas/database_schema.md
+(section 6) first. The script is resumable: it only touches rows whose compact
+column is still empty.
+
+Usage:
+    python scripts/migrate_embeddings.py [--dtype float16] [--batch-size 500] [--dry-run]
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend')))
+
+from dotenv import load_dotenv
+load_dotenv(os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend/.env')))
+
+from app.core.config import settings
+from app.services.embedding_codec import decode_embedding, encode_embedding
+from app.services.supabase_service import SupabaseService
+
+def migrate(dtype: str, batch_size: int, dry_run: bool) -> None:
+    supabase_service = SupabaseService()
+    migrated, text_bytes, compact_bytes, max_error = 0, 0, 0, 0.0
+    offset = 0
+    updated_ids = set()
+
+    while True:
+        query = supabase_service.client.from_('knowledge_bases').select('id, embedding').is_('embedding_compact', 'null')
+        # Migrated rows drop out of the filter, so only a dry run needs to page forward.
+        rows = query.range(offset, offset + batch_size - 1).execute().data or []
+        if not rows:
+            break
+        stuck = [row['id'] for row in rows if row['id'] in updated_ids]
+        if stuck:
+            # An update that matched no row (e.g. blocked by row-level security) leaves the compact
+            # column empty, and the same batch would be picked again forever.
+            print(f"Error: {len(stuck)} rows were updated but still have no compact embedding "
+                  f"(first id {stuck[0]}); check that the key may update knowledge_bases.")
+            sys.exit(1)
+
+        for row in rows:
+            text = row['embedding'] if isinstance(row['embedding'], str) else json.dumps(row['embedding'])
+            vector = decode_embedding(text)
+            compact = encode_embedding(vector, dtype)
+            text_bytes += len(text)
+            compact_bytes += len(compact)
+            max_error = max(max_error, float(np.max(np.abs(decode_embedding(compact) - vector))))
+            if not dry_run:
+                supabase_service.update_knowledge_base_embedding_compact(row['id'], compact)
+                updated_ids.add(row['id'])
+            migrated += 1
+
+        print(f"{'Checked' if dry_run else 'Migrated'} {migrated} rows...")
+        if dry_run:
+            offset += batch_size
+
+    if not migrated:
+        print("Nothing to migrate.")
+        return
+    print(f"{migrated} rows: {text_bytes / migrated:.0f} bytes per embedding as pgvector text, "
+          f"{compact_bytes / migrated:.0f} as {dtype} ({text_bytes / compact_bytes:.1f}x smaller), "
+          f"max absolute error {max_error:.2e}")
+    if not dry_run and not settings.COMPACT_EMBEDDINGS:
+        print("Set COMPACT_EMBEDDINGS=true to read and write the compact column.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill compact knowledge base embeddings.")
+    parser.add_argument('--dtype', choices=['float16', 'float32'], default=settings.COMPACT_EMBEDDING_DTYPE)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+    migrate(args.dtype, args.batch_size, args.dry_run)
@@ -8,17 +8,12 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../b
 
 from app.bot.setup import setup_bot_application
 from app.bot.handler import handle_message
+from app.core.logging_config import configure_logging
 from telegram.ext import MessageHandler, filters
 
-# Enable logging
+# Enable logging (levels per subsystem come from LOG_LEVEL and LOG_LEVELS)
+configure_logging()
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-logging.getLogger('telegram').setLevel(logging.DEBUG)
-
-# Add a file handler to log to bot.log
-file_handler = logging.FileHandler('bot.log', mode='w')
-file_handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
-logger.addHandler(file_handler)
 
 def send_heartbeat(context):
     logger.info(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Bot is running and waiting for messages...")
@@ -8,6 +8,7 @@ import logging # Import logging
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend')))
 
 from app.services.supabase_service import SupabaseService
+from app.services.tenant_cache import request_invalidation
 
 # Configure logging for the script
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -68,6 +69,7 @@ async def setup_test_subscription():
 
     if new_subscription:
         logger.info("Successfully subscribed company to the 'Basic' plan.") # Use logger.info
+        request_invalidation(company_id=company_id)
     else:
         logger.error("Error: Failed to create the subscription.") # Use logger.error
 
@@ -1,16 +1,18 @@
 import sys
 import os
 import asyncio
+import argparse
 
 # Add the backend directory to the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend')))
 
 from app.services.supabase_service import SupabaseService
 from app.services.rag_service import RAGService
+from app.services.ingestion_service import IngestionService
+from app.services.tenant_cache import request_invalidation
 
 # --- Configuration ---
 COMPANY_NAME = "UrbanStep Footwear Ltd."
-TELEGRAM_CHAT_ID = "-4884220020"
 KNOWLEDGE_CONTENT = """The company is called UrbanStep Footwear Ltd. It was established in 2014 and has been operating for over 11 years. The headquarters is located in Accra, Ghana, with additional distribution centers in Lagos, Nigeria and London, UK.
 
 UrbanStep specializes in athletic sneakers, casual footwear, formal leather shoes, sandals, and limited-edition collaborations. The company serves over 70,000 active customers worldwide and delivers to more than 45 countries.
@@ -27,42 +29,56 @@ Customer support is available 24/7 via WhatsApp, Telegram, and email. The offici
 
 The company operates an official website at www.urbanstep.com, where customers can browse catalogs, track orders, and access exclusive promotions."""
 
-async def upload_knowledge():
+async def upload_knowledge(company_name: str, paths: list[str], direct_answers: bool = False):
     print("--- Uploading Knowledge for Existing Business ---")
 
     # Initialize services
     supabase_service = SupabaseService()
     rag_service = RAGService()
+    ingestion_service = IngestionService(rag_service, supabase_service)
 
     # Get company details
-    print(f"Checking for company with chat ID '{TELEGRAM_CHAT_ID}'...")
-    company = supabase_service.get_company_by_telegram_chat_id(TELEGRAM_CHAT_ID)
+    print(f"Checking for company '{company_name}'...")
+    company = supabase_service.get_company_by_name(company_name)
 
     if company:
         company_id = company['id']
         print(f"Found company '{company['name']}' with ID: {company_id}")
 
-        if KNOWLEDGE_CONTENT:
-            print("\nGenerating embedding for the knowledge base...")
-            embedding = rag_service.generate_embedding(KNOWLEDGE_CONTENT)
-            
-            print("Adding knowledge base entry to the database...")
-            knowledge_entry = supabase_service.add_knowledge_base_entry(company_id, KNOWLEDGE_CONTENT, embedding)
-            
-            if knowledge_entry:
-                print(f"\nSUCCESS: Knowledge base added successfully for {company['name']}.")
-            else:
-                print("ERROR: Failed to add knowledge base entry.")
+        if paths and direct_answers:
+            print(f"\nEmbedding and uploading the question/answer rows of {len(paths)} file(s) as direct answers...")
+            inserted = ingestion_service.ingest_direct_answers(company_id, paths)
+        elif paths:
+            print(f"\nChunking, embedding and uploading {len(paths)} file(s)...")
+            inserted = ingestion_service.ingest_files(company_id, paths)
+        elif KNOWLEDGE_CONTENT:
+            print("\nChunking, embedding and uploading the built-in knowledge content...")
+            inserted = ingestion_service.ingest_text(company_id, KNOWLEDGE_CONTENT)
         else:
             print("WARNING: No knowledge content provided. Nothing to upload.")
+            return
+
+        if inserted:
+            print(f"\nSUCCESS: {inserted} knowledge base chunks added for {company['name']}.")
+            request_invalidation(company_id=company_id)
+        else:
+            print("ERROR: Failed to add knowledge base entries.")
     else:
-        print(f"ERROR: Could not find a company with Telegram Chat ID {TELEGRAM_CHAT_ID}. Please add the company first.")
+        print(f"ERROR: Could not find a company named '{company_name}'. Please add the company first.")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upload knowledge files (.txt, .md or FAQ .csv) for an existing business.")
+    parser.add_argument('paths', nargs='*', help="Files to ingest. Defaults to the built-in KNOWLEDGE_CONTENT.")
+    parser.add_argument('--company', default=COMPANY_NAME, help="Company name as stored in the companies table.")
+    parser.add_argument('--direct-answers', action='store_true',
+                        help="Store FAQ .csv question/answer rows as direct answers, sent without calling Gemini "
+                             "when a question matches closely (needs DIRECT_ANSWERS_ENABLED).")
+    args = parser.parse_args()
+
     # Ensure .env is loaded for the script
     from dotenv import load_dotenv
     load_dotenv(os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend/.env')))
     
     # The service functions are synchronous, but we keep the async structure to be safe
     # In a real script, we might not need asyncio if all calls are sync.
-    asyncio.run(upload_knowledge())
+    asyncio.run(upload_knowledge(args.company, args.paths, args.direct_answers))